@@ -1,16 +1,35 @@
 import { api } from "./axios";
-import { Request } from "../types";
+import { Request, RequestPage, RequestQuery } from "../types";
 
-export async function getRequests(): Promise<Request[]> {
-  return api.get("/requests");
+export async function getRequests(params: RequestQuery = {}): Promise<RequestPage> {
+  return api.get("/requests", { params });
+}
+
+// ссылка на NDJSON-выгрузку с теми же фильтрами (скачивает браузер, не axios)
+export function exportRequestsUrl(params: RequestQuery = {}): string {
+  return api.getUri({ url: "/requests/export", params });
 }
 
 export async function getRequest(id: string): Promise<Request> {
   return api.get(`/requests/${id}`);
 }
 
-export async function createRequest(data: Partial<Request>) {
-  return api.post("/requests/create-and-publish", data);
+export interface CreatedRequest {
+  request_id: number;
+  duplicate_of: number | null;
+  created: boolean;
+  queued: boolean;
+}
+
+// idempotencyKey — один на заполненную форму: повторная отправка (двойной клик,
+// ретрай после обрыва) вернёт ту же заявку, а не создаст вторую
+export async function createRequest(
+  data: Partial<Request>,
+  idempotencyKey: string
+): Promise<CreatedRequest> {
+  return api.post("/requests/create-and-publish", data, {
+    headers: { "Idempotency-Key": idempotencyKey },
+  });
 }
 
 export async function updateRequest(id: string, data: Partial<Request>) {
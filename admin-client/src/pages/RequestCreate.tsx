@@ -24,18 +24,29 @@ export default function RequestCreate() {
   const navigate = useNavigate();
   const { showMessage } = useSnackbar();
   const [loading, setLoading] = useState(false);
+  // ключ идемпотентности живёт, пока форма не меняется: ретрай той же формы
+  // вернёт уже созданную заявку, а правка формы — это уже новая заявка
+  const [submissionKey, setSubmissionKey] = useState(() => crypto.randomUUID());
 
   function handleChange(e: React.ChangeEvent<HTMLInputElement>) {
     setForm({ ...form, [e.target.name]: e.target.value });
+    setSubmissionKey(crypto.randomUUID());
   }
 
   async function handleSubmit() {
     try {
       setLoading(true);
 
-      await createRequest(form);
+      const created = await createRequest(form, submissionKey);
 
-      showMessage("Заявка создана и опубликована", "success");
+      if (created.duplicate_of) {
+        showMessage(
+          `Похожая заявка №${created.duplicate_of} уже в работе — новая сохранена как повтор и не опубликована`,
+          "warning"
+        );
+      } else {
+        showMessage("Заявка создана и поставлена в очередь на публикацию", "success");
+      }
       navigate("/requests");
     } catch (err: any) {
       showMessage(err.message, "error");
@@ -46,7 +46,9 @@ export default function RequestEdit() {
     try {
       setLoading(true);
 
-      await updateRequest(id, form);
+      // только редактируемые поля: остальное в заявке сервер менять не даёт
+      const { name, phone, city, description, specialization } = form;
+      await updateRequest(id, { name, phone, city, description, specialization });
       showMessage("Заявка успешно обновлена", "success");
 
       navigate("/requests");
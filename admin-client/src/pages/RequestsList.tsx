@@ -1,49 +1,115 @@
 import { useEffect, useState } from "react";
-import { Request } from "../types";
-import { getRequests } from "../api/requests";
+import { Request, RequestQuery } from "../types";
+import { getRequests, exportRequestsUrl } from "../api/requests";
 import {
   Table, TableBody, TableCell, TableContainer,
-  TableHead, TableRow, Paper, Button, Box, Typography
+  TableHead, TableRow, Paper, Button, Box, Typography,
+  TextField, MenuItem
 } from "@mui/material";
 
 import { Link } from "react-router-dom";
 import { useSnackbar } from "../components/SnackbarProvider";
 
+const STATUSES = ["PENDING", "CLAIMED", "RESEND", "DONE", "CANCELED", "DUPLICATE"];
+const SPECIALIZATIONS = ["ACCOUNTING", "LAW", "EGOV"];
+
+// в таблице только эти колонки — остальное грузит страница заявки
+const LIST_FIELDS = "id,specialization,name,phone,status";
+const PAGE_SIZE = 50;
+
 export default function RequestsList() {
   const [data, setData] = useState<Request[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [status, setStatus] = useState("");
+  const [specialization, setSpecialization] = useState("");
+  const [search, setSearch] = useState("");
+  const [q, setQ] = useState("");
+  const [loading, setLoading] = useState(false);
   const { showMessage } = useSnackbar();
 
-  const refresh = async () => {
+  const filters: RequestQuery = {
+    status: status || undefined,
+    specialization: specialization || undefined,
+    q: q || undefined,
+  };
+
+  const load = async (cursor?: string) => {
     try {
-      const result = await getRequests();
-      if (Array.isArray(result)) {
-        setData(result);
-      } else {
-        setData([]);
-      }
+      setLoading(true);
+      const page = await getRequests({ ...filters, fields: LIST_FIELDS, limit: PAGE_SIZE, cursor });
+      setData((prev) => (cursor ? [...prev, ...page.items] : page.items));
+      setNextCursor(page.next_cursor);
     } catch (err: any) {
       showMessage(err.message, "error");
+    } finally {
+      setLoading(false);
     }
   };
 
   useEffect(() => {
-    refresh();
-  }, []);
+    load();
+  }, [status, specialization, q]);
 
   return (
     <Box p={2}>
-      <Button
-        variant="contained"
-        component={Link}
-        to="/requests/create"
-        sx={{ mb: 2 }}
-      >
-        ➕ Создать заявку
-      </Button>
+      <Box sx={{ display: "flex", gap: 2, mb: 2, flexWrap: "wrap" }}>
+        <Button
+          variant="contained"
+          component={Link}
+          to="/requests/create"
+        >
+          ➕ Создать заявку
+        </Button>
+
+        <Button variant="outlined" href={exportRequestsUrl(filters)}>
+          ⬇ Выгрузить
+        </Button>
+      </Box>
+
+      <Box sx={{ display: "flex", gap: 2, mb: 2, flexWrap: "wrap" }}>
+        <TextField
+          select
+          label="Статус"
+          value={status}
+          onChange={(e) => setStatus(e.target.value)}
+          size="small"
+          sx={{ minWidth: 160 }}
+        >
+          <MenuItem value="">Все</MenuItem>
+          {STATUSES.map((s) => (
+            <MenuItem key={s} value={s}>{s}</MenuItem>
+          ))}
+        </TextField>
+
+        <TextField
+          select
+          label="Категория"
+          value={specialization}
+          onChange={(e) => setSpecialization(e.target.value)}
+          size="small"
+          sx={{ minWidth: 160 }}
+        >
+          <MenuItem value="">Все</MenuItem>
+          {SPECIALIZATIONS.map((s) => (
+            <MenuItem key={s} value={s}>{s}</MenuItem>
+          ))}
+        </TextField>
+
+        {/* поиск запускается по Enter, а не на каждую букву */}
+        <TextField
+          label="Поиск"
+          value={search}
+          onChange={(e) => setSearch(e.target.value)}
+          onKeyDown={(e) => {
+            if (e.key === "Enter") setQ(search.trim());
+          }}
+          size="small"
+        />
+      </Box>
 
       {/* Если данных нет */}
-      {data.length === 0 && (
-        <Typography sx={{ mt: 2 }}>Заявок пока нет.</Typography>
+      {data.length === 0 && !loading && (
+        <Typography sx={{ mt: 2 }}>Заявок не найдено.</Typography>
       )}
 
       {data.length > 0 && (
@@ -85,6 +151,16 @@ export default function RequestsList() {
           </Table>
         </TableContainer>
       )}
+
+      {nextCursor && (
+        <Button
+          onClick={() => load(nextCursor)}
+          disabled={loading}
+          sx={{ mt: 2 }}
+        >
+          Загрузить ещё
+        </Button>
+      )}
     </Box>
   );
 }
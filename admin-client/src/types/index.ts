@@ -15,6 +15,24 @@ export interface Request {
   cancel_note?: string;
 }
 
+// GET /requests: страница заявок и курсор следующей (null — последняя)
+export interface RequestPage {
+  items: Request[];
+  next_cursor: string | null;
+}
+
+export interface RequestQuery {
+  status?: string;          // через запятую: PENDING,RESEND
+  specialization?: string;
+  claimed_by?: number;
+  from?: string;
+  to?: string;
+  q?: string;
+  fields?: string;
+  limit?: number;
+  cursor?: string;
+}
+
 export interface Specialist {
   id: number;
   tg_id: string;
@@ -0,0 +1,16 @@
+import express from "express";
+import cors from "cors";
+import requestsRouter from "./routes/requests";
+import specialistsRouter from "./routes/specialists";
+
+// Приложение без listen: его поднимают index.ts и тесты (test/)
+const app = express();
+
+app.use(cors());
+app.use(express.json());
+
+// API
+app.use("/api/requests", requestsRouter);
+app.use("/api/specialists", specialistsRouter);
+
+export default app;
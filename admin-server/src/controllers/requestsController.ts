@@ -1,6 +1,11 @@
 import { Request, Response } from "express";
 import {
-    getAllRequests,
+    listRequests,
+    searchRequests,
+    streamRequests,
+    REQUEST_COLUMNS,
+    RequestFilters,
+    ListCursor,
     getRequestById,
     createRequest,
     updateRequest,
@@ -8,7 +13,6 @@ import {
     saveChannelMessage,
     createRequestInChanel,
 } from "../models/requestsModel";
-import { publishToTelegram } from "../telegram/sender";
 import { notifySpecialist } from "../telegram/notify";
 import axios from "axios";
 
@@ -34,15 +38,147 @@ function mapSpecName(spec: string) {
                 : "Специалиста";
 }
 
+const LIST_DEFAULT_LIMIT = 50;
+const LIST_MAX_LIMIT = 500;
+const EXPORT_BATCH_SIZE = Number(process.env.EXPORT_BATCH_SIZE) || 1000;
+
+class BadQuery extends Error {}
+
+// ?status=PENDING,CLAIMED и ?status=PENDING&status=CLAIMED — одно и то же
+function listParam(value: unknown): string[] {
+    const items = Array.isArray(value) ? value : value === undefined ? [] : [value];
+    return items
+        .flatMap((v) => String(v).split(","))
+        .map((v) => v.trim())
+        .filter(Boolean);
+}
+
+function dateParam(value: unknown, name: string): string | undefined {
+    if (value === undefined || value === "") return undefined;
+    const text = String(value);
+    if (Number.isNaN(Date.parse(text))) throw new BadQuery(`Некорректная дата в ${name}`);
+    return text;
+}
+
+function parseFilters(query: Request["query"]): RequestFilters {
+    const filters: RequestFilters = {
+        status: listParam(query.status),
+        specialization: listParam(query.specialization),
+        from: dateParam(query.from, "from"),
+        to: dateParam(query.to, "to"),
+    };
+    if (query.claimed_by !== undefined && query.claimed_by !== "") {
+        const claimedBy = Number(query.claimed_by);
+        if (!Number.isInteger(claimedBy)) throw new BadQuery("claimed_by должен быть tg_id специалиста");
+        filters.claimedBy = claimedBy;
+    }
+    return filters;
+}
+
+// ?fields=id,name,status — только нужные колонки; по умолчанию все из REQUEST_COLUMNS
+function parseFields(query: Request["query"]): string[] {
+    const fields = listParam(query.fields);
+    if (fields.length === 0) return REQUEST_COLUMNS;
+    const unknown = fields.filter((f) => !REQUEST_COLUMNS.includes(f));
+    if (unknown.length) throw new BadQuery(`Неизвестные поля: ${unknown.join(", ")}`);
+    return fields;
+}
+
+// курсор для клиента непрозрачен: base64url от JSON
+function encodeCursor(value: unknown): string {
+    return Buffer.from(JSON.stringify(value)).toString("base64url");
+}
+
+function decodeCursor(value: unknown): any {
+    if (value === undefined || value === "") return null;
+    try {
+        return JSON.parse(Buffer.from(String(value), "base64url").toString());
+    } catch {
+        throw new BadQuery("Некорректный cursor");
+    }
+}
+
+// GET /requests — постранично, новые сверху:
+//   ?limit=50&cursor=<next_cursor прошлой страницы>
+//   &status=&specialization=&claimed_by=&from=&to=&fields=
+//   &q=текст — поиск (по релевантности) с теми же фильтрами
+// Ответ: { items, next_cursor } (next_cursor = null на последней странице)
 export async function getRequests(req: Request, res: Response) {
     try {
-        const list = await getAllRequests();
-        return ok(res, list);
+        const filters = parseFilters(req.query);
+        const fields = parseFields(req.query);
+        const limit = Math.min(Number(req.query.limit) || LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT);
+        const cursor = decodeCursor(req.query.cursor);
+        const q = typeof req.query.q === "string" ? req.query.q.trim() : "";
+
+        if (q) {
+            // по рангу keyset не построить — в курсоре смещение
+            const offset = Number(cursor?.offset) || 0;
+            const { rows, more } = await searchRequests(q, filters, fields, limit, offset);
+            return ok(res, {
+                items: rows,
+                next_cursor: more ? encodeCursor({ offset: offset + limit }) : null,
+            });
+        }
+
+        if (cursor && !(Array.isArray(cursor) && cursor.length === 2 && Number.isInteger(cursor[1])
+            && !Number.isNaN(Date.parse(cursor[0])))) {
+            throw new BadQuery("Некорректный cursor");
+        }
+        const after: ListCursor | null = cursor ? [cursor[0], cursor[1]] : null;
+        const { rows, next } = await listRequests(filters, fields, limit, after);
+        return ok(res, { items: rows, next_cursor: next ? encodeCursor(next) : null });
     } catch (err) {
+        if (err instanceof BadQuery) return error(res, "BAD_QUERY", err.message);
         return error(res, "INTERNAL_ERROR", "Не удалось загрузить список заявок", 500);
     }
 }
 
+// пишет кусок в ответ и ждёт drain, если буфер сокета полон;
+// клиент отключился — исключение, выгрузка прекращается
+function writeChunk(res: Response, chunk: string): Promise<void> {
+    return new Promise((resolve, reject) => {
+        if (res.destroyed) return reject(new Error("EXPORT_ABORTED"));
+        if (res.write(chunk)) return resolve();
+        const onDrain = () => {
+            res.off("close", onClose);
+            resolve();
+        };
+        const onClose = () => {
+            res.off("drain", onDrain);
+            reject(new Error("EXPORT_ABORTED"));
+        };
+        res.once("drain", onDrain);
+        res.once("close", onClose);
+    });
+}
+
+// GET /requests/export — все заявки по тем же фильтрам и fields, NDJSON (строка JSON на заявку)
+export async function exportRequests(req: Request, res: Response) {
+    let filters: RequestFilters;
+    let fields: string[];
+    try {
+        filters = parseFilters(req.query);
+        fields = parseFields(req.query);
+    } catch (err) {
+        return error(res, "BAD_QUERY", (err as Error).message);
+    }
+
+    res.status(200);
+    res.setHeader("Content-Type", "application/x-ndjson; charset=utf-8");
+    res.setHeader("Content-Disposition", 'attachment; filename="requests.ndjson"');
+    try {
+        await streamRequests(filters, fields, EXPORT_BATCH_SIZE, (rows) =>
+            writeChunk(res, rows.map((row) => JSON.stringify(row)).join("\n") + "\n")
+        );
+        res.end();
+    } catch (err) {
+        // заголовки уже ушли — JSON с ошибкой не отправить, обрываем ответ
+        if (!res.headersSent) return error(res, "INTERNAL_ERROR", "Не удалось выгрузить заявки", 500);
+        res.destroy();
+    }
+}
+
 export async function getRequest(req: Request, res: Response) {
     try {
         const request = await getRequestById(Number(req.params.id));
@@ -129,23 +265,34 @@ export async function deleteExistingRequest(req: Request, res: Response) {
 }
 
 
+// окно поиска повторов — как REQUEST_DEDUP_WINDOW в request-bot
+const REQUEST_DEDUP_WINDOW = Number(process.env.REQUEST_DEDUP_WINDOW ?? 24 * 60 * 60);
+
 export async function createAndPublish(req: Request, res: Response) {
     try {
         const data = req.body;
+        const key = req.header("Idempotency-Key");
 
-        const newRequest = await createRequestInChanel(data);
-
-        const { message_id, chat_id } = await publishToTelegram(newRequest);
+        const channelId = process.env[`CHANNEL_${data.specialization}_ID`];
+        if (!channelId) {
+            return error(res, "UNKNOWN_SPECIALIZATION", "Неизвестная категория заявки");
+        }
 
-        await saveChannelMessage(newRequest.id, message_id, chat_id, "request");
+        // в канал заявку постит OutboxPublisher request-bot (и рассылает в ЛС,
+        // если там включён FANOUT_NEW_REQUESTS) — здесь только запись в базу
+        const created = await createRequestInChanel(
+            data, channelId, key ? `admin:${key}` : null, REQUEST_DEDUP_WINDOW
+        );
 
         return ok(res, {
-            request_id: newRequest.id,
-            tg_message_id: message_id,
-            channel_id: chat_id
+            request_id: created.id,
+            duplicate_of: created.duplicate_of,
+            created: created.created,
+            queued: created.duplicate_of === null,
         });
 
     } catch (err) {
+        console.error(err);
         return error(res, "CREATE_PUBLISH_FAILED", "Не удалось создать и опубликовать заявку", 500);
     }
 }
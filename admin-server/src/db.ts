@@ -8,5 +8,8 @@ export const pool = new Pool({
 });
 
 pool.connect()
-  .then(() => console.log("🟢 Connected to PostgreSQL"))
+  .then((client) => {
+    client.release();
+    console.log("🟢 Connected to PostgreSQL");
+  })
   .catch((err) => console.error("🔴 PostgreSQL connection error:", err));
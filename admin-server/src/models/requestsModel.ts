@@ -1,12 +1,152 @@
 import { pool } from "../db";
 
-export async function getAllRequests() {
-    const res = await pool.query("SELECT * FROM requests ORDER BY created_at DESC");
-    return res.rows;
+// Колонки, которые можно выбрать через ?fields=; служебные (search_tsv,
+// content_hash, idempotency_key) в список не входят
+export const REQUEST_COLUMNS = [
+    "id", "phone", "name", "city", "description", "specialization", "status",
+    "tg_chat_id", "tg_message_id", "sent_by_bot",
+    "claimed_by_id", "claimed_by_username", "claimed_at",
+    "resend_at", "canceled_at", "finished_at", "cancel_note",
+    "duplicate_of", "created_at",
+];
+
+// Что админка может менять в заявке. Остальное (статус, claim, служебные
+// и вычисляемые триггерами content_hash/search_tsv) из тела PUT игнорируется
+export const EDITABLE_COLUMNS = ["name", "phone", "city", "description", "specialization"];
+
+export interface RequestFilters {
+    status?: string[];
+    specialization?: string[];
+    claimedBy?: number;
+    from?: string;  // created_at >= from
+    to?: string;    // created_at < to
+}
+
+// ключ строки в списке: created_at текстом — в Date теряются микросекунды
+export type ListCursor = [createdAt: string, id: number];
+
+function filterSql(filters: RequestFilters, values: any[]): string[] {
+    const where: string[] = [];
+    const add = (sql: (n: number) => string, value: any) => {
+        values.push(value);
+        where.push(sql(values.length));
+    };
+
+    if (filters.status?.length) add((n) => `r.status = ANY($${n}::text[])`, filters.status);
+    if (filters.specialization?.length) add((n) => `r.specialization = ANY($${n}::text[])`, filters.specialization);
+    if (filters.claimedBy !== undefined) add((n) => `r.claimed_by_id = $${n}`, filters.claimedBy);
+    if (filters.from) add((n) => `r.created_at >= $${n}::timestamptz`, filters.from);
+    if (filters.to) add((n) => `r.created_at < $${n}::timestamptz`, filters.to);
+    return where;
+}
+
+function projection(columns: string[]): string {
+    return columns.map((c) => `r.${c}`).join(", ");
+}
+
+// Страница заявок, новые сверху. Keyset по (created_at, id): cursor — ключ
+// последней строки предыдущей страницы, так что страница стоит одинаково
+// на первой и на тысячной странице. Одна лишняя строка — признак следующей.
+export async function listRequests(
+    filters: RequestFilters,
+    columns: string[],
+    limit: number,
+    cursor: ListCursor | null
+) {
+    const values: any[] = [];
+    const where = filterSql(filters, values);
+    if (cursor) {
+        values.push(cursor[0], cursor[1]);
+        where.push(`(r.created_at, r.id) < ($${values.length - 1}::timestamptz, $${values.length})`);
+    }
+    values.push(limit + 1);
+
+    const res = await pool.query(
+        `SELECT ${projection(columns)}, r.id AS _cursor_id, r.created_at::text AS _cursor_ts
+         FROM requests r
+         ${where.length ? "WHERE " + where.join(" AND ") : ""}
+         ORDER BY r.created_at DESC, r.id DESC
+         LIMIT $${values.length}`,
+        values
+    );
+
+    const rows = res.rows.slice(0, limit);
+    const last = rows[rows.length - 1];
+    const next: ListCursor | null = res.rows.length > limit ? [last._cursor_ts, last._cursor_id] : null;
+    for (const row of rows) {
+        delete row._cursor_id;
+        delete row._cursor_ts;
+    }
+    return { rows, next };
+}
+
+// Полнотекстовый поиск по описанию (search_tsv, russian) и подстрока
+// в городе/имени (триграммные индексы), сначала самые релевантные
+export async function searchRequests(
+    q: string,
+    filters: RequestFilters,
+    columns: string[],
+    limit: number,
+    offset: number
+) {
+    const pattern = "%" + q.replace(/[\\%_]/g, (c) => "\\" + c) + "%";
+    const values: any[] = [q, pattern];
+    const where = filterSql(filters, values);
+    values.push(limit + 1, offset);
+
+    const res = await pool.query(
+        `SELECT ${projection(columns)},
+                ts_rank_cd(r.search_tsv, q)
+                + CASE WHEN r.city ILIKE $2 THEN 0.5 ELSE 0 END
+                + CASE WHEN r.name ILIKE $2 THEN 0.3 ELSE 0 END AS rank
+         FROM requests r, websearch_to_tsquery('russian', $1) AS q
+         WHERE (r.search_tsv @@ q OR r.city ILIKE $2 OR r.name ILIKE $2)
+         ${where.map((w) => "AND " + w).join(" ")}
+         ORDER BY rank DESC, r.id DESC
+         LIMIT $${values.length - 1} OFFSET $${values.length}`,
+        values
+    );
+    return { rows: res.rows.slice(0, limit), more: res.rows.length > limit };
+}
+
+// Выгрузка всех подходящих заявок через серверный курсор Postgres:
+// в памяти Node не больше batchSize строк, write ждёт, пока клиент
+// заберёт предыдущую пачку. Исключение из write прерывает выгрузку.
+export async function streamRequests(
+    filters: RequestFilters,
+    columns: string[],
+    batchSize: number,
+    write: (rows: any[]) => Promise<void>
+) {
+    const values: any[] = [];
+    const where = filterSql(filters, values);
+    const client = await pool.connect();
+    try {
+        await client.query("BEGIN READ ONLY");
+        await client.query(
+            `DECLARE requests_export NO SCROLL CURSOR FOR
+             SELECT ${projection(columns)}
+             FROM requests r
+             ${where.length ? "WHERE " + where.join(" AND ") : ""}
+             ORDER BY r.created_at DESC, r.id DESC`,
+            values
+        );
+        while (true) {
+            const res = await client.query(`FETCH ${batchSize} FROM requests_export`);
+            if (res.rows.length > 0) await write(res.rows);
+            if (res.rows.length < batchSize) break;
+        }
+        await client.query("COMMIT");
+    } catch (err) {
+        await client.query("ROLLBACK").catch(() => undefined);
+        throw err;
+    } finally {
+        client.release();
+    }
 }
 
 export async function getRequestById(id: number) {
-    const res = await pool.query("SELECT * FROM requests WHERE id = $1", [id]);
+    const res = await pool.query(`SELECT ${REQUEST_COLUMNS.join(", ")} FROM requests WHERE id = $1`, [id]);
     return res.rows[0];
 }
 
@@ -28,21 +168,23 @@ export async function createRequest(data: any) {
     return res.rows[0];
 }
 export async function updateRequest(id: number, data: any) {
-    const fields = [];
+    const fields: string[] = [];
     const values: any[] = [];
 
-    Object.entries(data).forEach(([key, value], index) => {
-        fields.push(`${key} = $${index + 1}`);
-        values.push(value);
-    });
+    for (const key of EDITABLE_COLUMNS) {
+        if (data[key] === undefined) continue;
+        values.push(data[key]);
+        fields.push(`${key} = $${values.length}`);
+    }
 
-    if (fields.length === 0) return null;
+    // менять нечего — отдаём заявку как есть (или undefined, если её нет)
+    if (fields.length === 0) return getRequestById(id);
 
     const query = `
     UPDATE requests
     SET ${fields.join(", ")}
     WHERE id = $${fields.length + 1}
-    RETURNING *;
+    RETURNING ${REQUEST_COLUMNS.join(", ")};
   `;
 
     values.push(id);
@@ -55,11 +197,46 @@ export async function deleteRequest(id: number) {
     return res.rowCount > 0 ? { message: "Request deleted" } : null;
 }
 
-export async function createRequestInChanel(data: any) {
+// Заявка из админки и задание на публикацию — одним запросом, как save_request
+// в request-bot: пост в канал делает OutboxPublisher request-bot, поэтому
+// повтор с тем же ключом или параллельный вызов не публикует заявку дважды.
+// Тот же телефон + описание в пределах dedupWindow секунд, пока первая заявка
+// в работе, — новая сохраняется как DUPLICATE со ссылкой duplicate_of и в канал не идёт.
+export async function createRequestInChanel(
+  data: any,
+  channelId: string,
+  idempotencyKey: string | null,
+  dedupWindow: number
+): Promise<{ id: number; duplicate_of: number | null; created: boolean }> {
   const query = `
-    INSERT INTO requests (name, phone, city, description, specialization, status)
-    VALUES ($1, $2, $3, $4, $5, 'PENDING')
-    RETURNING *;
+    WITH dup AS (
+      SELECT id FROM requests
+      WHERE $8::float8 > 0
+        AND content_hash = request_content_hash($2, $4)
+        AND duplicate_of IS NULL
+        AND status IN ('PENDING', 'CLAIMED', 'RESEND')
+        AND created_at > NOW() - make_interval(secs => $8::float8)
+      ORDER BY created_at DESC
+      LIMIT 1
+    ), req AS (
+      INSERT INTO requests (name, phone, city, description, specialization, status,
+                            idempotency_key, duplicate_of)
+      SELECT $1, $2, $3, $4, $5,
+             CASE WHEN dup.id IS NULL THEN 'PENDING' ELSE 'DUPLICATE' END,
+             $7, dup.id
+      FROM (SELECT 1) AS one
+      LEFT JOIN dup ON TRUE
+      ON CONFLICT (idempotency_key) DO NOTHING
+      RETURNING id, duplicate_of
+    ), outbox AS (
+      INSERT INTO channel_outbox (request_id, channel_id)
+      SELECT id, $6 FROM req
+      WHERE duplicate_of IS NULL
+    )
+    SELECT id, duplicate_of, TRUE AS created FROM req
+    UNION ALL
+    SELECT id, duplicate_of, FALSE FROM requests
+    WHERE idempotency_key = $7 AND NOT EXISTS (SELECT 1 FROM req)
   `;
 
   const values = [
@@ -68,10 +245,20 @@ export async function createRequestInChanel(data: any) {
     data.city,
     data.description,
     data.specialization,
+    channelId,
+    idempotencyKey,
+    dedupWindow,
   ];
 
   const res = await pool.query(query, values);
-  return res.rows[0];
+  if (res.rows[0]) return res.rows[0];
+
+  // тот же ключ прямо сейчас сохраняется в другой транзакции — перечитываем после коммита
+  const existing = await pool.query(
+    `SELECT id, duplicate_of, FALSE AS created FROM requests WHERE idempotency_key=$1`,
+    [idempotencyKey]
+  );
+  return existing.rows[0];
 }
 
 export async function saveChannelMessage(
@@ -88,3 +275,4 @@ export async function saveChannelMessage(
   );
 }
 
+// задание рассылки заявки специалистам в ЛС (spec-bot, fanout.py)
@@ -6,12 +6,14 @@ import {
     updateExistingRequest,
     deleteExistingRequest,
     createAndPublish,
-    updateAndRepublish
+    updateAndRepublish,
+    exportRequests
 } from "../controllers/requestsController";
 
 const router = Router();
 
 router.get("/", getRequests);
+router.get("/export", exportRequests);   // до /:id
 router.get("/:id", getRequest);
 router.post("/", createNewRequest);
 router.put("/:id", updateExistingRequest);
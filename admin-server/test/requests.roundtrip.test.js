@@ -0,0 +1,87 @@
+// GET /requests/:id → PUT обратно всей строкой, как делает RequestEdit.
+// Нужен DATABASE_URL с применёнными миграциями ботов; запуск: npm test
+const { test, before, after } = require("node:test");
+const assert = require("node:assert/strict");
+
+const DATABASE_URL = process.env.DATABASE_URL;
+
+let server;
+let baseUrl;
+let pool;
+let requestId;
+
+before(async () => {
+    if (!DATABASE_URL) return;
+    const app = require("../dist/app").default;
+    ({ pool } = require("../dist/db"));
+
+    server = app.listen(0);
+    await new Promise((resolve) => server.once("listening", resolve));
+    baseUrl = `http://127.0.0.1:${server.address().port}/api/requests`;
+
+    // без tg_chat_id и claim: publish-update не ходит в Telegram
+    const res = await pool.query(`
+        INSERT INTO requests (phone, name, city, description, specialization)
+        VALUES ('+77000000099', 'roundtrip', 'Алматы', 'проверка редактирования', 'LAW')
+        RETURNING id
+    `);
+    requestId = res.rows[0].id;
+});
+
+after(async () => {
+    if (!DATABASE_URL) return;
+    if (requestId) await pool.query("DELETE FROM requests WHERE id = $1", [requestId]);
+    await new Promise((resolve) => server.close(resolve));
+    await pool.end();
+});
+
+async function call(method, path, body) {
+    const res = await fetch(baseUrl + path, {
+        method,
+        headers: { "Content-Type": "application/json" },
+        body: body === undefined ? undefined : JSON.stringify(body),
+    });
+    return { status: res.status, body: await res.json() };
+}
+
+test("GET не отдаёт служебные и вычисляемые колонки", { skip: !DATABASE_URL && "нет DATABASE_URL" }, async () => {
+    const { status, body } = await call("GET", `/${requestId}`);
+    assert.equal(status, 200);
+    assert.equal(body.data.name, "roundtrip");
+    for (const column of ["content_hash", "search_tsv", "idempotency_key"]) {
+        assert.ok(!(column in body.data), `${column} в ответе`);
+    }
+});
+
+test("PUT /:id принимает строку из GET целиком", { skip: !DATABASE_URL && "нет DATABASE_URL" }, async () => {
+    const { body: got } = await call("GET", `/${requestId}`);
+    // и старый клиент, присылавший вычисляемые колонки, тоже не ломает сохранение
+    const { status, body } = await call("PUT", `/${requestId}`, {
+        ...got.data,
+        name: "roundtrip 2",
+        status: "DONE",
+        content_hash: "x",
+        search_tsv: "x",
+    });
+    assert.equal(status, 200, JSON.stringify(body));
+    assert.equal(body.data.name, "roundtrip 2");
+    assert.equal(body.data.status, got.data.status, "статус через PUT не меняется");
+});
+
+test("PUT /:id/publish-update принимает строку из GET целиком", { skip: !DATABASE_URL && "нет DATABASE_URL" }, async () => {
+    const { body: got } = await call("GET", `/${requestId}`);
+    const { status, body } = await call("PUT", `/${requestId}/publish-update`, {
+        ...got.data,
+        city: "Астана",
+        description: "налоговая декларация",
+    });
+    assert.equal(status, 200, JSON.stringify(body));
+    assert.equal(body.data.updated.city, "Астана");
+
+    // search_tsv пересчитался из нового описания
+    const found = await pool.query(
+        "SELECT id FROM requests WHERE id = $1 AND search_tsv @@ websearch_to_tsquery('russian', 'декларация')",
+        [requestId]
+    );
+    assert.equal(found.rowCount, 1);
+});
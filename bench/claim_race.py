@@ -0,0 +1,103 @@
+"""
+Гонка claim без Telegram: сотни одновременных try_claim_request на одну
+заявку прямо через db.py — победитель должен быть ровно один.
+
+    python bench/claim_race.py                        # 300 claim на заявку, 20 заявок, оба бота
+    python bench/claim_race.py --claims 1000 --rounds 5 --bots request
+
+claim_storm в run.py проверяет то же через бота, но упирается в Bot API
+и throttle; здесь нагрузка идёт прямо в Postgres. Каждый claim — от своего
+одобренного специалиста и через пул на --connections соединений, так что
+запросы действительно выполняются параллельно.
+
+Нужен тот же Postgres, что и для run.py: BENCH_DATABASE_URL (или DATABASE_URL).
+Код выхода 1, если хоть в одном раунде победителей не ровно один.
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import sys
+from collections import Counter
+from types import ModuleType
+
+import asyncpg
+from dotenv import load_dotenv
+
+from harness import BOT_DIRS, throwaway_database
+from scenarios import SPECIALIST_BASE, _seed_channel_requests, _seed_specialists
+
+
+def load_db(name: str) -> ModuleType:
+    """db.py бота name под именем {name}_db: у обоих ботов модуль называется db."""
+    path = str(BOT_DIRS[name])
+    sys.path.insert(0, path)  # для metrics — он одинаковый в обоих ботах
+    try:
+        spec = importlib.util.spec_from_file_location(f"{name}_db", BOT_DIRS[name] / "db.py")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(path)
+    return module
+
+
+async def race(db: ModuleType, pool: asyncpg.Pool, claims: int, rounds: int) -> list[str]:
+    """rounds заявок, на каждую claims одновременных claim. Возвращает список проблем."""
+    db._pool = pool
+    spec_ids = [SPECIALIST_BASE + i for i in range(claims)]
+    async with pool.acquire() as conn:
+        await _seed_specialists(conn, spec_ids)
+        req_ids = await _seed_channel_requests(conn, rounds)
+
+    problems = []
+    for req_id in req_ids:
+        results = await asyncio.gather(*(
+            db.try_claim_request(req_id, tg_id, f"u{tg_id}") for tg_id in spec_ids
+        ))
+        statuses = Counter(status for status, _ in results)
+        winners = [tg_id for tg_id, (status, _) in zip(spec_ids, results) if status == db.CLAIM_OK]
+        owner = await pool.fetchval("SELECT claimed_by_id FROM requests WHERE id=$1", req_id)
+        if len(winners) != 1:
+            problems.append(f"заявка {req_id}: победителей {len(winners)}, ожидался ровно один")
+        elif owner != winners[0]:
+            problems.append(f"заявка {req_id}: в базе claimed_by_id={owner}, победил {winners[0]}")
+        if statuses[db.CLAIM_TAKEN] != claims - 1:
+            problems.append(f"заявка {req_id}: ответы {dict(statuses)}")
+    return problems
+
+
+async def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--claims", type=int, default=300, help="одновременных claim на заявку")
+    parser.add_argument("--rounds", type=int, default=20, help="сколько заявок штурмуем")
+    parser.add_argument("--connections", type=int, default=50, help="размер пула")
+    parser.add_argument("--bots", nargs="+", choices=list(BOT_DIRS), default=list(BOT_DIRS),
+                        help="чей try_claim_request проверяем")
+    args = parser.parse_args()
+
+    server_url = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+    if not server_url:
+        sys.exit("BENCH_DATABASE_URL / DATABASE_URL не задан")
+
+    failed = False
+    for name in args.bots:
+        db = load_db(name)
+        async with throwaway_database(server_url) as database_url:
+            pool = await asyncpg.create_pool(database_url, min_size=args.connections, max_size=args.connections)
+            try:
+                problems = await race(db, pool, args.claims, args.rounds)
+            finally:
+                await pool.close()
+        for problem in problems:
+            print(f"  {name}: {problem}")
+        print(f"{name}-bot: {args.rounds} заявок × {args.claims} claim — "
+              f"{'ОШИБКА' if problems else 'ровно один победитель в каждом раунде'}")
+        failed = failed or bool(problems)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,194 @@
+"""
+Локальная замена Telegram Bot API для бенчмарков.
+
+Боты ходят сюда через TELEGRAM_API_URL=http://127.0.0.1:<port>.
+Сервер отдаёт апдейты через getUpdates (long polling), отвечает на
+sendMessage / editMessageText / deleteMessage(s) / answerCallbackQuery
+и прочие методы, записывает каждый вызов и умеет:
+- добавлять задержку к каждому ответу (latency, jitter);
+- отвечать 429 с заданной вероятностью на выбранные методы.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from aiohttp import web
+
+# Методы, на которые по умолчанию может прийти 429 — то, что реально лимитирует Telegram
+RATE_LIMITED_METHODS = ("sendMessage", "editMessageText", "deleteMessage", "deleteMessages")
+
+
+@dataclass
+class Call:
+    token: str
+    method: str
+    params: dict[str, Any]
+    at: float = field(default_factory=time.monotonic)
+    result: Any = None
+
+
+def _parse_value(value: str) -> Any:
+    # aiogram шлёт multipart: числа — строками, вложенные объекты — JSON-строками
+    if value[:1] in "{[":
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+class FakeTelegramAPI:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_limit_prob: float = 0.0,
+        retry_after: int = 1,
+        rate_limited_methods: tuple[str, ...] = RATE_LIMITED_METHODS,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_prob = rate_limit_prob
+        self.retry_after = retry_after
+        self.rate_limited_methods = set(rate_limited_methods)
+
+        self.calls: list[Call] = []
+        self.method_counts: Counter[str] = Counter()
+        self.rate_limited: Counter[str] = Counter()
+
+        self._updates: dict[str, list[dict]] = defaultdict(list)
+        self._update_id = 0
+        self._new_updates: dict[str, asyncio.Event] = defaultdict(asyncio.Event)
+        self._polling: dict[str, asyncio.Event] = defaultdict(asyncio.Event)
+        self._message_ids: Counter = Counter()
+        self._waiters: list[tuple[Callable[[Call], bool], asyncio.Future]] = []
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+    # ---------------------------
+    #  Управление из сценария
+    # ---------------------------
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=10 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def push_update(self, token: str, update: dict) -> int:
+        self._update_id += 1
+        update = {"update_id": self._update_id, **update}
+        self._updates[token].append(update)
+        self._new_updates[token].set()
+        return self._update_id
+
+    async def wait_polling(self, token: str, timeout: float = 30):
+        """Ждёт, пока бот с этим токеном начнёт забирать апдейты."""
+        await asyncio.wait_for(self._polling[token].wait(), timeout)
+
+    async def wait_for(self, predicate: Callable[[Call], bool], timeout: float = 30) -> Call:
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((predicate, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._waiters = [(p, f) for p, f in self._waiters if f is not future]
+
+    def find(self, predicate: Callable[[Call], bool]) -> list[Call]:
+        return [c for c in self.calls if predicate(c)]
+
+    # ---------------------------
+    #  HTTP
+    # ---------------------------
+    async def _handle(self, request: web.Request) -> web.Response:
+        token = request.match_info["token"]
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = {k: _parse_value(v) for k, v in (await request.post()).items()}
+
+        if method.lower() == "getupdates":
+            return self._ok(await self._get_updates(token, params))
+
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        self.method_counts[method] += 1
+        if method in self.rate_limited_methods and random.random() < self.rate_limit_prob:
+            self.rate_limited[method] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            })
+
+        call = Call(token, method, params)
+        call.result = self._result(token, method, params)
+        self.calls.append(call)
+        for predicate, future in list(self._waiters):
+            if not future.done() and predicate(call):
+                future.set_result(call)
+        return self._ok(call.result)
+
+    @staticmethod
+    def _ok(result: Any) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, token: str, params: dict) -> list[dict]:
+        self._polling[token].set()
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+
+        queue = self._updates[token]
+        queue[:] = [u for u in queue if u["update_id"] >= offset]
+        if not queue and timeout:
+            event = self._new_updates[token]
+            event.clear()
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return queue[:100]
+
+    def _message(self, chat_id: Any, text: str | None, message_id: int | None = None) -> dict:
+        if message_id is None:
+            self._message_ids[chat_id] += 1
+            message_id = self._message_ids[chat_id]
+        chat_type = "channel" if str(chat_id).startswith(("-", "@")) else "private"
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id if isinstance(chat_id, int) else 0, "type": chat_type},
+            "text": text or "",
+        }
+
+    def _result(self, token: str, method: str, params: dict) -> Any:
+        if method == "getMe":
+            bot_id = int(token.split(":")[0])
+            return {"id": bot_id, "is_bot": True, "first_name": "bench", "username": f"bench{bot_id}_bot"}
+        if method == "sendMessage":
+            return self._message(params.get("chat_id"), params.get("text"))
+        if method == "editMessageText":
+            if "inline_message_id" in params:
+                return True
+            return self._message(params.get("chat_id"), params.get("text"), params.get("message_id"))
+        return True
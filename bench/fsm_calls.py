@@ -0,0 +1,158 @@
+"""
+Сколько обращений к FSM-хранилищу делает мастер заявки request-bot на каждом шаге
+— без FSMBufferMiddleware и с ней.
+
+    python bench/fsm_calls.py
+
+Telegram и Postgres не нужны: Bot работает через фейковую сессию,
+хранилище — MemoryStorage со счётчиком вызовов.
+"""
+import asyncio
+import os
+import sys
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+os.environ.setdefault("REQUEST_BOT_TOKEN", "42:TEST")
+os.environ.setdefault("SPEC_BOT_TOKEN", "43:TEST")
+os.environ["FSM_STORAGE"] = "memory"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "request-bot"))
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.methods import EditMessageText, SendMessage  # noqa: E402
+from aiogram.types import Chat, Message  # noqa: E402
+
+import bot as request_bot  # noqa: E402
+
+USER_ID = 1001
+
+
+class FakeSession(BaseSession):
+    """Отвечает на методы Bot API без сети: sendMessage -> Message, остальное -> True."""
+
+    def __init__(self):
+        super().__init__()
+        self._message_id = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, (SendMessage, EditMessageText)):
+            self._message_id += 1
+            return Message(
+                message_id=self._message_id,
+                date=datetime.now(),
+                chat=Chat(id=method.chat_id, type="private"),
+                text=method.text,
+            )
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class CountingStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.calls = Counter()
+
+    async def get_state(self, key):
+        self.calls["get_state"] += 1
+        return await super().get_state(key)
+
+    async def set_state(self, key, state=None):
+        self.calls["set_state"] += 1
+        await super().set_state(key, state)
+
+    async def get_data(self, key):
+        self.calls["get_data"] += 1
+        return await super().get_data(key)
+
+    async def set_data(self, key, data):
+        self.calls["set_data"] += 1
+        await super().set_data(key, data)
+
+
+def _message(update_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": 10_000 + update_id,
+            "date": int(datetime.now().timestamp()),
+            "chat": {"id": USER_ID, "type": "private"},
+            "from": {"id": USER_ID, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+
+def _callback(update_id: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": "bench",
+            "from": {"id": USER_ID, "is_bot": False, "first_name": "Test"},
+            "message": {
+                "message_id": 1,
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": USER_ID, "type": "private"},
+                "text": "-",
+            },
+            "data": data,
+        },
+    }
+
+
+WIZARD = [
+    ("start", _message, "/start"),
+    ("phone", _message, "+77001234567"),
+    ("name", _message, "Иван"),
+    ("city", _message, "Алматы"),
+    ("desc", _message, "Нужна консультация"),
+    ("category", _callback, "cat:LAW"),
+    ("confirm:edit", _callback, "confirm:edit"),
+    ("edit:city", _callback, "edit:city"),
+    ("city (edit)", _message, "Астана"),
+]
+
+
+async def run(buffered: bool) -> list[tuple[str, int]]:
+    dp = request_bot.dp
+    storage = CountingStorage()
+    dp.fsm.storage = storage
+
+    if not buffered:
+        dp.message.middleware.unregister(request_bot.fsm_buffer)
+        dp.callback_query.middleware.unregister(request_bot.fsm_buffer)
+
+    bot = Bot("42:TEST", session=FakeSession())
+    result = []
+    try:
+        for update_id, (step, make, payload) in enumerate(WIZARD, start=1):
+            storage.calls.clear()
+            await dp.feed_raw_update(bot, make(update_id, payload))
+            result.append((step, sum(storage.calls.values())))
+    finally:
+        if not buffered:
+            dp.message.middleware(request_bot.fsm_buffer)
+            dp.callback_query.middleware(request_bot.fsm_buffer)
+    return result
+
+
+async def main():
+    before = await run(buffered=False)
+    after = await run(buffered=True)
+
+    print(f"{'шаг':<14}{'без буфера':>12}{'с буфером':>12}")
+    for (step, b), (_, a) in zip(before, after):
+        print(f"{step:<14}{b:>12}{a:>12}")
+    print(f"{'итого':<14}{sum(c for _, c in before):>12}{sum(c for _, c in after):>12}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,266 @@
+"""
+Обвязка бенчмарков: временная база, процессы ботов, «пользователи» и статистика.
+
+Боты запускаются настоящими процессами (python bot.py) против FakeTelegramAPI
+и отдельной базы, созданной на время прогона на сервере из BENCH_DATABASE_URL
+(по умолчанию DATABASE_URL) и удалённой после.
+"""
+import asyncio
+import itertools
+import math
+import os
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+import asyncpg
+
+from fake_telegram import Call, FakeTelegramAPI
+
+ROOT = Path(__file__).resolve().parent.parent
+BOT_DIRS = {"request": ROOT / "request-bot", "spec": ROOT / "spec-bot"}
+
+TOKENS = {
+    "request": "1000001:BENCH-request-token",
+    "spec": "1000002:BENCH-spec-token",
+}
+CHANNELS = {
+    "ACCOUNTING": -1001000000001,
+    "LAW": -1001000000002,
+    "EGOV": -1001000000003,
+}
+
+
+# ---------------------------
+#  Временная база
+# ---------------------------
+def _with_database(url: str, database: str) -> str:
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(path=f"/{database}"))
+
+
+@asynccontextmanager
+async def throwaway_database(server_url: str):
+    """Создаёт пустую базу bench_<uuid>, прогоняет миграции, в конце удаляет её."""
+    name = f"bench_{uuid.uuid4().hex[:12]}"
+    admin = await asyncpg.connect(server_url)
+    await admin.execute(f'CREATE DATABASE "{name}"')
+    url = _with_database(server_url, name)
+    try:
+        subprocess.run(
+            [sys.executable, "migrate.py"],
+            cwd=BOT_DIRS["request"],
+            env={**os.environ, "DATABASE_URL": url},
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        yield url
+    finally:
+        await admin.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+        await admin.close()
+
+
+# ---------------------------
+#  Процессы ботов
+# ---------------------------
+def bot_env(api_url: str, database_url: str, real_limits: bool, extra: dict | None = None) -> dict:
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "TELEGRAM_API_URL": api_url,
+        "REQUEST_BOT_TOKEN": TOKENS["request"],
+        "SPEC_BOT_TOKEN": TOKENS["spec"],
+        "BOT_MODE": "polling",
+        "METRICS_PORT": "0",
+        "PYTHONUNBUFFERED": "1",
+        **{f"CHANNEL_{k}": str(v) for k, v in CHANNELS.items()},
+    }
+    if not real_limits:
+        # меряем свой код, а не лимиты Telegram
+        env.update(SEND_GLOBAL_RATE="100000", SEND_CHAT_RATE="100000", SEND_CHANNEL_RATE="100000")
+        # и без защиты от флуда: «пользователи» бенчмарка быстрее живых
+        env.update(THROTTLE_RATE="0")
+    env.update(extra or {})
+    return env
+
+
+@asynccontextmanager
+async def running_bots(api: FakeTelegramAPI, env: dict, names=("request", "spec"), verbose: bool = False,
+                       combined: bool = False):
+    """Процесс на бота или, с combined, один combined-bot на оба токена."""
+    output = None if verbose else subprocess.DEVNULL
+    if combined:
+        names = tuple(BOT_DIRS)
+        commands = [([sys.executable, "combined-bot/bot.py"], ROOT)]
+    else:
+        commands = [([sys.executable, "bot.py"], BOT_DIRS[name]) for name in names]
+    procs = [
+        subprocess.Popen(command, cwd=cwd, env=env, stdout=output, stderr=output)
+        for command, cwd in commands
+    ]
+    try:
+        for name in names:
+            await api.wait_polling(TOKENS[name], timeout=60)
+        yield
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+# ---------------------------
+#  Апдейты и ожидание ответа
+# ---------------------------
+_message_ids = itertools.count(1)
+_callback_ids = itertools.count(1)
+
+
+def message_update(user_id: int, text: str) -> dict:
+    return {
+        "message": {
+            "message_id": next(_message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"},
+            "text": text,
+        }
+    }
+
+
+def callback_update(user_id: int, data: str, chat_id: int | None = None, message_id: int = 1) -> tuple[str, dict]:
+    callback_id = f"cb{next(_callback_ids)}"
+    chat_id = user_id if chat_id is None else chat_id
+    chat_type = "channel" if chat_id < 0 else "private"
+    return callback_id, {
+        "callback_query": {
+            "id": callback_id,
+            "chat_instance": "bench",
+            "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}",
+                     "username": f"u{user_id}"},
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": chat_type},
+                "text": "-",
+            },
+            "data": data,
+        }
+    }
+
+
+@dataclass
+class Stats:
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    errors: dict[str, int] = field(default_factory=dict)
+    notes: list[str] = field(default_factory=list)
+    failed: bool = False
+    started: float = field(default_factory=time.monotonic)
+    finished: float = 0.0
+
+    def add(self, step: str, seconds: float):
+        self.latencies.setdefault(step, []).append(seconds)
+
+    def error(self, step: str):
+        self.errors[step] = self.errors.get(step, 0) + 1
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+
+class User:
+    """Пользователь Telegram: шлёт апдейт и ждёт видимую реакцию бота."""
+
+    def __init__(self, api: FakeTelegramAPI, stats: Stats, user_id: int, timeout: float = 30):
+        self.api = api
+        self.stats = stats
+        self.user_id = user_id
+        self.timeout = timeout
+
+    async def send(self, bot: str, step: str, text: str, expect: str) -> Call | None:
+        """Сообщение боту; ответ — sendMessage/editMessageText в этот чат с текстом expect."""
+        token = TOKENS[bot]
+
+        def reply(call: Call) -> bool:
+            return (
+                call.token == token
+                and call.method in ("sendMessage", "editMessageText")
+                and call.params.get("chat_id") == self.user_id
+                and expect in str(call.params.get("text", ""))
+            )
+
+        return await self._measure(step, reply, token, message_update(self.user_id, text))
+
+    async def click(self, bot: str, step: str, data: str, chat_id: int | None = None,
+                    message_id: int = 1) -> Call | None:
+        """Нажатие inline-кнопки; ответ — answerCallbackQuery на этот callback."""
+        token = TOKENS[bot]
+        callback_id, update = callback_update(self.user_id, data, chat_id, message_id)
+
+        def answered(call: Call) -> bool:
+            return call.method == "answerCallbackQuery" and call.params.get("callback_query_id") == callback_id
+
+        return await self._measure(step, answered, token, update)
+
+    async def _measure(self, step, predicate, token, update) -> Call | None:
+        waiter = asyncio.ensure_future(self.api.wait_for(predicate, self.timeout))
+        await asyncio.sleep(0)  # ждущий должен встать в очередь раньше, чем придёт ответ
+        start = time.monotonic()
+        self.api.push_update(token, update)
+        try:
+            call = await waiter
+        except asyncio.TimeoutError:
+            self.stats.error(step)
+            return None
+        self.stats.add(step, call.at - start)
+        return call
+
+
+# ---------------------------
+#  Отчёт
+# ---------------------------
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def report(results: dict[str, Stats], api: FakeTelegramAPI) -> dict:
+    summary = {}
+    print(f"\n{'сценарий / шаг':<34}{'n':>7}{'ошибок':>8}{'оп/с':>9}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}")
+    for scenario, stats in results.items():
+        wall = max(stats.finished - stats.started, 1e-9)
+        print(f"{scenario}{'  FAILED' if stats.failed else ''}  ({wall:.2f} с)")
+        steps = {}
+        for step in list(stats.latencies) + [s for s in stats.errors if s not in stats.latencies]:
+            values = stats.latencies.get(step, [])
+            row = {
+                "n": len(values),
+                "errors": stats.errors.get(step, 0),
+                "ops_per_sec": len(values) / wall,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            }
+            steps[step] = row
+            print(f"  {step:<32}{row['n']:>7}{row['errors']:>8}{row['ops_per_sec']:>9.1f}"
+                  f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}")
+        for note in stats.notes:
+            print(f"  * {note}")
+        summary[scenario] = {"wall_seconds": wall, "failed": stats.failed, "steps": steps, "notes": stats.notes}
+
+    print("\nBot API:", ", ".join(f"{m}={n}" for m, n in api.method_counts.most_common()))
+    if api.rate_limited:
+        print("429:", ", ".join(f"{m}={n}" for m, n in api.rate_limited.most_common()))
+    summary["bot_api"] = {"calls": dict(api.method_counts), "rate_limited": dict(api.rate_limited)}
+    return summary
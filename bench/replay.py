@@ -0,0 +1,239 @@
+"""
+Повтор записанного трафика (RECORD_UPDATES=updates.jsonl.gz) против фейкового
+Bot API и временной базы Postgres.
+
+    python bench/replay.py updates.jsonl.gz                  # с записанной скоростью
+    python bench/replay.py updates.jsonl.gz --speed 10       # в 10 раз быстрее
+    python bench/replay.py updates.jsonl.gz --speed 0        # так быстро, как получится
+    python bench/replay.py updates.jsonl.gz --bot spec --json result.json
+    python bench/replay.py updates.jsonl.gz.0 updates.jsonl.gz.1   # запись воркеров (WORKERS=2)
+
+Апдейты идут прямо в dp.feed_update (без getUpdates), TelegramMethod из
+хендлеров выполняется так же, как в polling. Апдейты одного пользователя
+обрабатываются строго по порядку, разных — параллельно, как в проде.
+Каждый бот работает в своём процессе (модули ботов называются одинаково),
+база у них общая. В отчёте — задержка по типу апдейта, пропускная способность
+и расхождения с записанным итогом (handled / unhandled / error:...).
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+
+from fake_telegram import RATE_LIMITED_METHODS, FakeTelegramAPI
+from harness import BOT_DIRS, Stats, bot_env, report, throwaway_database
+
+# сколько примеров расхождений показывать в отчёте
+MAX_DIVERGENCE_EXAMPLES = 10
+
+
+def load_capture(paths: list[str]) -> list[dict]:
+    """Несколько файлов (например, по одному на воркер при WORKERS > 1) сливаются по времени."""
+    records = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    records.sort(key=lambda r: r["t"])
+    return records
+
+
+def _ordering_key(update: dict):
+    # апдейты одного пользователя — в порядке записи (FSM), остальное не связано
+    for kind in ("message", "edited_message", "callback_query", "my_chat_member"):
+        event = update.get(kind)
+        if event:
+            sender = event.get("from") or event.get("chat") or {}
+            if "id" in sender:
+                return sender["id"]
+    return ("update", update.get("update_id"))
+
+
+# ---------------------------
+#  Процесс одного бота
+# ---------------------------
+async def replay_bot(name: str, records: list[dict], speed: float, origin: float, start_at: float) -> dict:
+    """Кормит записи в dp.feed_update бота name. Окружение уже выставлено родителем."""
+    from aiogram.methods import TelegramMethod
+    from aiogram.types import Update
+
+    sys.path.insert(0, str(BOT_DIRS[name]))
+    import bot as module  # noqa: E402 — модуль бота читает окружение при импорте
+    from recorder import outcome_of
+
+    dp, bot = module.dp, module.bot
+    await module.startup()
+
+    stats = Stats()
+    outcomes: Counter[str] = Counter()
+    divergences: list[str] = []
+    chains: dict = {}
+
+    async def process(record: dict, previous: asyncio.Task | None):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        update = Update.model_validate(record["update"], context={"bot": bot})
+        result, error = None, None
+        start = time.monotonic()
+        try:
+            result = await dp.feed_update(bot, update)
+            if isinstance(result, TelegramMethod):
+                await dp.silent_call_request(bot, result)
+        except Exception as e:
+            error = e
+        stats.add(update.event_type, time.monotonic() - start)
+        outcome = outcome_of(result, error)
+        outcomes[outcome] += 1
+        expected = record.get("outcome")
+        if expected is not None and outcome != expected:
+            stats.error(update.event_type)
+            divergences.append(f"update {update.update_id} ({update.event_type}): было {expected}, стало {outcome}")
+
+    try:
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        stats.started = time.monotonic()
+        tasks = []
+        for record in records:
+            if speed:
+                due = stats.started + (record["t"] - origin) / speed
+                await asyncio.sleep(max(0.0, due - time.monotonic()))
+            key = _ordering_key(record["update"])
+            task = asyncio.create_task(process(record, chains.get(key)))
+            chains[key] = task
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+        stats.finish()
+    finally:
+        # фоновые задачи хендлеров и outbox доводятся до конца, но в замер не входят
+        await module.shutdown()
+
+    wall = max(stats.finished - stats.started, 1e-9)
+    stats.notes.append(f"апдейтов: {len(records)}, {len(records) / wall:.1f}/с; итоги: "
+                       + ", ".join(f"{k}={v}" for k, v in outcomes.most_common()))
+    if divergences:
+        stats.failed = True
+        stats.notes.append(f"расхождений с записью: {len(divergences)}")
+        stats.notes.extend(divergences[:MAX_DIVERGENCE_EXAMPLES])
+    return {
+        "latencies": stats.latencies, "errors": stats.errors, "notes": stats.notes,
+        "failed": stats.failed, "wall": wall,
+    }
+
+
+# ---------------------------
+#  Родительский процесс
+# ---------------------------
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", nargs="+", help="файлы записи *.jsonl.gz")
+    parser.add_argument("--bot", action="append", choices=list(BOT_DIRS),
+                        help="чьи апдейты повторять (по умолчанию все, что есть в записи)")
+    parser.add_argument("--speed", type=float, default=1,
+                        help="1 — как записано, N — в N раз быстрее, 0 — без пауз")
+    parser.add_argument("--warmup", type=float, default=5,
+                        help="секунд на запуск процессов ботов до первого апдейта")
+    parser.add_argument("--latency-ms", type=float, default=0, help="задержка ответа фейкового API")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="случайная добавка к задержке")
+    parser.add_argument("--rate-limit", type=float, default=0,
+                        help=f"вероятность 429 на {', '.join(RATE_LIMITED_METHODS)}")
+    parser.add_argument("--real-limits", action="store_true",
+                        help="оставить лимиты SendQueue как в проде (по умолчанию сняты)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="доп. переменные окружения для ботов")
+    parser.add_argument("--json", help="сохранить результат в файл")
+    parser.add_argument("--verbose", action="store_true", help="показывать вывод ботов")
+    # внутренний режим: процесс одного бота
+    parser.add_argument("--child", choices=list(BOT_DIRS), help=argparse.SUPPRESS)
+    parser.add_argument("--origin", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.speed < 0:
+        parser.error("--speed не может быть отрицательной")
+    return args
+
+
+def _to_stats(result: dict) -> Stats:
+    stats = Stats(latencies=result["latencies"], errors=result["errors"],
+                  notes=result["notes"], failed=result["failed"])
+    stats.started, stats.finished = 0.0, result["wall"]
+    return stats
+
+
+async def run_children(args, records: list[dict], names: list[str], server_url: str):
+    api = FakeTelegramAPI(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        rate_limit_prob=args.rate_limit,
+    )
+    api_url = await api.start()
+    extra = dict(item.split("=", 1) for item in args.env)
+    results = {}
+    try:
+        async with throwaway_database(server_url) as database_url:
+            env = bot_env(api_url, database_url, args.real_limits, {**extra, "RECORD_UPDATES": ""})
+            output = None if args.verbose else subprocess.DEVNULL
+            start_at = time.time() + args.warmup
+            with tempfile.TemporaryDirectory() as tmp:
+                procs = {}
+                for name in names:
+                    procs[name] = await asyncio.create_subprocess_exec(
+                        sys.executable, os.path.abspath(__file__), *args.capture,
+                        "--child", name, "--speed", str(args.speed),
+                        "--origin", str(records[0]["t"]), "--start-at", str(start_at),
+                        "--result", os.path.join(tmp, f"{name}.json"),
+                        env=env, stdout=output, stderr=output,
+                    )
+                for name, proc in procs.items():
+                    if await proc.wait() != 0:
+                        sys.exit(f"replay {name}: процесс завершился с кодом {proc.returncode}")
+                    with open(os.path.join(tmp, f"{name}.json"), encoding="utf-8") as f:
+                        results[f"replay:{name}"] = _to_stats(json.load(f))
+    finally:
+        await api.stop()
+    return results, api
+
+
+async def main():
+    load_dotenv()
+    args = parse_args()
+    records = load_capture(args.capture)
+    if not records:
+        sys.exit(f"{', '.join(args.capture)}: пустая запись")
+
+    if args.child:
+        mine = [r for r in records if r["bot"] == args.child]
+        result = await replay_bot(args.child, mine, args.speed, args.origin, args.start_at)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        return
+
+    server_url = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+    if not server_url:
+        sys.exit("BENCH_DATABASE_URL / DATABASE_URL не задан")
+    recorded = {r["bot"] for r in records}
+    names = [name for name in (args.bot or BOT_DIRS) if name in recorded]
+    if not names:
+        sys.exit(f"в записи нет апдейтов для {', '.join(args.bot)}")
+    span = records[-1]["t"] - records[0]["t"]
+    print(f"→ replay {', '.join(args.capture)}: {len(records)} апдейтов за {span:.1f} с, "
+          f"скорость {'max' if not args.speed else f'{args.speed:g}×'}", flush=True)
+
+    results, api = await run_children(args, records, names, server_url)
+    summary = report(results, api)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    if any(stats.failed for stats in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""
+Бенчмарк ботов против фейкового Bot API и временной базы Postgres.
+
+    python bench/run.py                       # все сценарии
+    python bench/run.py claim_storm wizard    # выбранные
+    python bench/run.py --latency-ms 50 --rate-limit 0.02 --json result.json
+    python bench/run.py --combined            # оба бота одним процессом
+
+Нужен доступный Postgres: BENCH_DATABASE_URL (или DATABASE_URL) — адрес сервера,
+на котором можно создать и удалить базу. Telegram не нужен.
+Для каждого сценария создаётся чистая база и свежие процессы ботов.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from dotenv import load_dotenv
+
+from fake_telegram import RATE_LIMITED_METHODS, FakeTelegramAPI
+from harness import bot_env, report, running_bots, throwaway_database
+from scenarios import SCENARIO_BOTS, SCENARIO_ENV, SCENARIOS
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"{', '.join(SCENARIOS)} (по умолчанию все)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="задержка ответа фейкового API")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="случайная добавка к задержке")
+    parser.add_argument("--rate-limit", type=float, default=0,
+                        help=f"вероятность 429 на {', '.join(RATE_LIMITED_METHODS)}")
+    parser.add_argument("--real-limits", action="store_true",
+                        help="оставить лимиты SendQueue как в проде (по умолчанию сняты)")
+    parser.add_argument("--users", type=int, default=50, help="wizard, flood: параллельных пользователей")
+    parser.add_argument("--specialists", type=int, default=100, help="claim_storm: специалистов в шторме")
+    parser.add_argument("--rounds", type=int, default=5, help="claim_storm: сколько заявок штурмуем")
+    parser.add_argument("--claims", type=int, default=10_000, help="my_requests: активных заявок у специалиста")
+    parser.add_argument("--pages", type=int, default=20, help="my_requests: страниц листаем за раз")
+    parser.add_argument("--cycles", type=int, default=10, help="cancel_resend: циклов на специалиста")
+    parser.add_argument("--rows", type=int, default=200_000, help="search: заявок в базе")
+    parser.add_argument("--recipients", type=int, default=2000, help="fanout: специалистов нужной специализации")
+    parser.add_argument("--combined", action="store_true",
+                        help="оба бота одним процессом (combined-bot) вместо двух")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="доп. переменные окружения для ботов (например WIZARD_MODE=inplace)")
+    parser.add_argument("--json", help="сохранить результат в файл")
+    parser.add_argument("--verbose", action="store_true", help="показывать вывод ботов")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(unknown)}")
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    return args
+
+
+async def run_scenario(name: str, args, server_url: str):
+    api = FakeTelegramAPI(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        rate_limit_prob=args.rate_limit,
+    )
+    api_url = await api.start()
+    extra = dict(item.split("=", 1) for item in args.env)
+    try:
+        async with throwaway_database(server_url) as database_url:
+            env = bot_env(api_url, database_url, args.real_limits, {**SCENARIO_ENV.get(name, {}), **extra})
+            async with running_bots(api, env, SCENARIO_BOTS[name], args.verbose, args.combined):
+                params = dict(users=args.users, rounds=args.rounds, claims=args.claims,
+                              pages=args.pages, cycles=args.cycles, recipients=args.recipients,
+                              rows=args.rows)
+                # --specialists только для шторма: в cancel_resend у каждого своя заявка
+                if name == "claim_storm":
+                    params["specialists"] = args.specialists
+                stats = await SCENARIOS[name](api, database_url, **params)
+    finally:
+        await api.stop()
+    return stats, api
+
+
+async def main():
+    load_dotenv()
+    args = parse_args()
+    server_url = os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL")
+    if not server_url:
+        sys.exit("BENCH_DATABASE_URL / DATABASE_URL не задан")
+
+    summary = {}
+    failed = False
+    for name in args.scenarios:
+        print(f"→ {name} ...", flush=True)
+        stats, api = await run_scenario(name, args, server_url)
+        result = report({name: stats}, api)
+        summary[name] = {**result[name], "bot_api": result["bot_api"]}
+        failed = failed or stats.failed
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
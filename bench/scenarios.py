@@ -0,0 +1,423 @@
+"""
+Сценарии бенчмарка. Каждый получает FakeTelegramAPI, URL временной базы
+и параметры, возвращает Stats с задержками по шагам.
+"""
+import asyncio
+import time
+
+import asyncpg
+
+from fake_telegram import Call, FakeTelegramAPI
+from harness import CHANNELS, TOKENS, Stats, User
+
+USER_BASE = 7_000_000_000
+SPECIALIST_BASE = 8_000_000_000
+
+def wizard_steps(user_id: int) -> list[tuple[str, str, str]]:
+    """(шаг, текст, чего ждём в ответе); телефон у каждого свой — иначе заявки склеятся как повторы."""
+    return [
+        ("/start", "/start", "📞"),
+        ("phone", f"+7{user_id % 10**10:010d}", "👤"),
+        ("name", "Иван", "🏙"),
+        ("city", "Алматы", "📝"),
+        ("desc", "Нужна консультация по договору", "📌"),
+    ]
+
+
+async def _seed_specialists(conn: asyncpg.Connection, tg_ids: list[int]):
+    await conn.executemany("""
+        INSERT INTO specialists (tg_id, username, name, phone, is_approved, specializations)
+        VALUES ($1, $2, 'bench', '+70000000000', TRUE, '{LAW}')
+        ON CONFLICT (tg_id) DO NOTHING
+    """, [(tg_id, f"u{tg_id}") for tg_id in tg_ids])
+
+
+async def _seed_channel_requests(conn: asyncpg.Connection, count: int, claimed_by: int | None = None) -> list[int]:
+    """Заявки, уже опубликованные в канал LAW (есть tg_chat_id/tg_message_id)."""
+    rows = await conn.fetch("""
+        INSERT INTO requests (phone, name, city, description, specialization, status,
+                              tg_chat_id, tg_message_id, sent_by_bot,
+                              claimed_by_id, claimed_by_username, claimed_at)
+        SELECT '+70000000000', 'bench', 'Алматы', 'bench #' || g, 'LAW',
+               CASE WHEN $2::bigint IS NULL THEN 'PENDING' ELSE 'CLAIMED' END,
+               $3, (1000 + g)::text, 'request',
+               $2, CASE WHEN $2::bigint IS NULL THEN NULL ELSE 'u' || $2 END,
+               CASE WHEN $2::bigint IS NULL THEN NULL ELSE NOW() - make_interval(secs => g) END
+        FROM generate_series(1, $1) AS g
+        RETURNING id
+    """, count, claimed_by, str(CHANNELS["LAW"]))
+    return [r["id"] for r in rows]
+
+
+# ---------------------------
+#  1. Мастер заявки
+# ---------------------------
+async def wizard(api: FakeTelegramAPI, database_url: str, users: int = 50, **_) -> Stats:
+    """users пользователей параллельно проходят ReqForm до конца и жмут «Все верно»."""
+    stats = Stats()
+
+    async def one(user_id: int):
+        user = User(api, stats, user_id)
+        for step, text, expect in wizard_steps(user_id):
+            if await user.send("request", step, text, expect) is None:
+                return
+        if await user.click("request", "cat:LAW", "cat:LAW") is None:
+            return
+        await user.click("request", "confirm:send", "confirm:send")
+
+    await asyncio.gather(*(one(USER_BASE + i) for i in range(users)))
+
+    # публикация в канал идёт через outbox — ждём, пока дойдут все посты
+    def posted() -> list[Call]:
+        return api.find(lambda c: c.method == "sendMessage" and c.params.get("chat_id") == CHANNELS["LAW"])
+
+    submitted = users - sum(stats.errors.values())
+    deadline = asyncio.get_running_loop().time() + 60
+    while len(posted()) < submitted and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.05)
+    stats.finish()
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        saved = await conn.fetchval("SELECT COUNT(*) FROM requests WHERE tg_message_id IS NOT NULL")
+    finally:
+        await conn.close()
+    stats.notes.append(f"опубликовано в канал: {len(posted())}, с message_id в базе: {saved} из {submitted}")
+    stats.failed = saved != submitted
+    return stats
+
+
+# ---------------------------
+#  2. Шторм кликов «Взять в работу»
+# ---------------------------
+async def claim_storm(api: FakeTelegramAPI, database_url: str, specialists: int = 100, rounds: int = 5, **_) -> Stats:
+    """specialists одобренных специалистов одновременно жмут claim на одну заявку; rounds раз."""
+    stats = Stats()
+    spec_ids = [SPECIALIST_BASE + i for i in range(specialists)]
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        await _seed_specialists(conn, spec_ids)
+        req_ids = await _seed_channel_requests(conn, rounds)
+    finally:
+        await conn.close()
+    stats.started = time.monotonic()
+
+    for req_id in req_ids:
+        users = [User(api, stats, tg_id) for tg_id in spec_ids]
+        answers = await asyncio.gather(*(
+            u.click("request", "claim", f"claim:{req_id}", chat_id=CHANNELS["LAW"], message_id=1000)
+            for u in users
+        ))
+        winners = [a for a in answers if a is not None and "взяли" in str(a.params.get("text", ""))]
+        if len(winners) != 1:
+            stats.failed = True
+            stats.notes.append(f"заявка {req_id}: победителей {len(winners)}, ожидался ровно один")
+    stats.finish()
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        claimed = await conn.fetchval(
+            "SELECT COUNT(*) FROM requests WHERE id = ANY($1::int[]) AND claimed_by_id IS NOT NULL", req_ids
+        )
+    finally:
+        await conn.close()
+    stats.notes.append(f"раундов: {len(req_ids)}, заявок взято: {claimed}")
+    stats.failed = stats.failed or claimed != len(req_ids)
+    return stats
+
+
+# ---------------------------
+#  3. /my_requests с большой историей
+# ---------------------------
+def _next_button(call: Call) -> str | None:
+    markup = call.params.get("reply_markup") or {}
+    for row in markup.get("inline_keyboard", []):
+        for button in row:
+            if button.get("callback_data", "").startswith("myreq:next:"):
+                return button["callback_data"]
+    return None
+
+
+async def my_requests(api: FakeTelegramAPI, database_url: str, claims: int = 10_000, pages: int = 20,
+                      repeats: int = 20, **_) -> Stats:
+    """Специалист с claims активными заявками: repeats раз /my_requests и листание pages страниц вперёд."""
+    stats = Stats()
+    tg_id = SPECIALIST_BASE + 500_000
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        await _seed_specialists(conn, [tg_id])
+        await _seed_channel_requests(conn, claims, claimed_by=tg_id)
+        await conn.execute("ANALYZE requests")
+    finally:
+        await conn.close()
+    stats.started = time.monotonic()
+
+    user = User(api, stats, tg_id)
+    for _ in range(repeats):
+        call = await user.send("spec", "/my_requests", "/my_requests", "Ваши заявки")
+        if call is None:
+            continue
+        message_id = call.result["message_id"]
+        data = _next_button(call)
+        for _ in range(pages):
+            if data is None:
+                break
+            answered = await user.click("spec", "page next", data, message_id=message_id)
+            if answered is None:
+                break
+            # хендлер правит сообщение до ответа на callback — правка уже записана
+            edit = api.find(lambda c: c.method == "editMessageText" and c.params.get("chat_id") == tg_id)[-1]
+            data = _next_button(edit)
+    stats.finish()
+    return stats
+
+
+# ---------------------------
+#  4. Отмена → возврат в канал → повторный claim
+# ---------------------------
+async def cancel_resend(api: FakeTelegramAPI, database_url: str, specialists: int = 20, cycles: int = 10, **_) -> Stats:
+    """Каждый специалист cycles раз отменяет свою заявку с причиной и снова берёт её из канала."""
+    stats = Stats()
+    spec_ids = [SPECIALIST_BASE + 600_000 + i for i in range(specialists)]
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        await _seed_specialists(conn, spec_ids)
+        req_ids = [(await _seed_channel_requests(conn, 1, claimed_by=tg_id))[0] for tg_id in spec_ids]
+    finally:
+        await conn.close()
+    stats.started = time.monotonic()
+
+    async def one(tg_id: int, req_id: int):
+        user = User(api, stats, tg_id)
+        for _ in range(cycles):
+            if await user.click("spec", "cancel", f"cancel:{req_id}") is None:
+                return
+            if await user.send("spec", "cancel note", "bench: не успеваю", "возвращена в канал") is None:
+                return
+            answer = await user.click("request", "re-claim", f"claim:{req_id}",
+                                      chat_id=CHANNELS["LAW"], message_id=1000)
+            if answer is None or "взяли" not in str(answer.params.get("text", "")):
+                stats.failed = True
+                stats.notes.append(f"заявка {req_id}: повторный claim не прошёл")
+                return
+
+    await asyncio.gather(*(one(tg_id, req_id) for tg_id, req_id in zip(spec_ids, req_ids)))
+    stats.finish()
+    return stats
+
+
+# ---------------------------
+#  5. Рассылка новой заявки специалистам в ЛС
+# ---------------------------
+async def fanout(api: FakeTelegramAPI, database_url: str, recipients: int = 2000, **_) -> Stats:
+    """
+    recipients одобренных LAW-специалистов (плюс чужая специализация и неодобренные):
+    клиент отправляет заявку LAW, spec-bot рассылает её в ЛС, первый получатель берёт её из ЛС.
+    """
+    stats = Stats()
+    base = SPECIALIST_BASE + 700_000
+    law_ids = [base + i for i in range(recipients)]
+    egov_ids = [base + recipients + i for i in range(50)]
+    unapproved_ids = [base + recipients + 50 + i for i in range(50)]
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        await _seed_specialists(conn, law_ids)
+        await conn.executemany("""
+            INSERT INTO specialists (tg_id, username, name, phone, is_approved, specializations)
+            VALUES ($1, $2, 'bench', '+70000000000', $3, $4)
+        """, [(tg_id, f"u{tg_id}", True, ["EGOV"]) for tg_id in egov_ids]
+           + [(tg_id, f"u{tg_id}", False, ["LAW"]) for tg_id in unapproved_ids])
+        await conn.execute("ANALYZE specialists")
+    finally:
+        await conn.close()
+    stats.started = time.monotonic()
+
+    user = User(api, stats, USER_BASE + 900_000)
+    for step, text, expect in wizard_steps(user.user_id):
+        if await user.send("request", step, text, expect) is None:
+            stats.failed = True
+            return stats
+    await user.click("request", "cat:LAW", "cat:LAW")
+    confirmed = await user.click("request", "confirm:send", "confirm:send")
+    if confirmed is None:
+        stats.failed = True
+        return stats
+
+    def delivered() -> list[Call]:
+        return api.find(lambda c: c.token == TOKENS["spec"] and c.method == "sendMessage"
+                        and "Новая заявка" in str(c.params.get("text", "")))
+
+    deadline = asyncio.get_running_loop().time() + 120
+    while len(delivered()) < recipients and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.05)
+    dms = delivered()
+    if dms:
+        stats.add("fanout: last DM", dms[-1].at - confirmed.at)
+        stats.add("fanout: first DM", dms[0].at - confirmed.at)
+    got = {c.params.get("chat_id") for c in dms}
+    if got != set(law_ids) or len(dms) != recipients:
+        stats.failed = True
+        stats.notes.append(f"рассылка: {len(dms)} ЛС, {len(got & set(law_ids))} из {recipients} нужных, "
+                           f"лишних {len(got - set(law_ids))}")
+
+    req_id = int(dms[0].params["reply_markup"]["inline_keyboard"][0][0]["callback_data"].split(":")[1]) if dms else 0
+    winner = User(api, stats, law_ids[0])
+    message_id = dms[0].result["message_id"] if dms else 1
+    answer = await winner.click("spec", "claim from DM", f"claim:{req_id}", message_id=message_id)
+    if answer is None or "взяли" not in str(answer.params.get("text", "")):
+        stats.failed = True
+        stats.notes.append(f"заявка {req_id}: claim из ЛС не прошёл")
+    else:
+        # карточку правит фон — она может уйти раньше ответа на callback
+        def card_edited() -> list[Call]:
+            return api.find(lambda c: c.token == TOKENS["request"] and c.method == "editMessageText"
+                            and c.params.get("chat_id") == CHANNELS["LAW"])
+
+        deadline = asyncio.get_running_loop().time() + 10
+        while not card_edited() and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.05)
+        if not card_edited():
+            stats.failed = True
+            stats.notes.append(f"заявка {req_id}: карточка в канале не обновлена")
+    stats.finish()
+    stats.notes.append(f"разослано в ЛС: {len(dms)} из {recipients}")
+    return stats
+
+
+# ---------------------------
+#  6. Флуд: спам /start и двойной тап «Все верно»
+# ---------------------------
+async def flood(api: FakeTelegramAPI, database_url: str, users: int = 50, **_) -> Stats:
+    """
+    users пользователей шлют по 20 /start разом, проходят мастер и дважды
+    одновременно жмут «Все верно», а потом отправляют ту же заявку ещё раз.
+    Ждём: ответов на /start не больше лимита, по одной опубликованной заявке
+    на пользователя, повторная — DUPLICATE.
+    """
+    stats = Stats()
+    spam = 20
+
+    async def one(user_id: int):
+        user = User(api, stats, user_id, timeout=5)
+        steps = wizard_steps(user_id)
+        await asyncio.gather(*(user.send("request", "/start spam", "/start", "📞") for _ in range(spam)))
+        for step, text, expect in steps[1:]:
+            if await user.send("request", step, text, expect) is None:
+                return
+        if await user.click("request", "cat:LAW", "cat:LAW") is None:
+            return
+        await asyncio.gather(*(user.click("request", "confirm:send", "confirm:send") for _ in range(2)))
+
+        # тот же телефон и описание ещё раз — после паузы, чтобы /start пропустил лимит
+        await asyncio.sleep(6)
+        for step, text, expect in steps:
+            if await user.send("request", f"repeat {step}", text, expect) is None:
+                return
+        if await user.click("request", "repeat cat:LAW", "cat:LAW") is None:
+            return
+        await user.click("request", "repeat confirm:send", "confirm:send")
+
+    await asyncio.gather(*(one(USER_BASE + 800_000 + i) for i in range(users)))
+    stats.finish()
+
+    start_replies = api.find(lambda c: c.method == "sendMessage" and "Укажите номер" in str(c.params.get("text", "")))
+    throttled = api.find(lambda c: "Слишком часто" in str(c.params.get("text", "")))
+    conn = await asyncpg.connect(database_url)
+    try:
+        statuses = dict(await conn.fetch("SELECT status, COUNT(*) FROM requests GROUP BY status"))
+    finally:
+        await conn.close()
+    duplicates = statuses.pop("DUPLICATE", 0)
+    published = sum(statuses.values())
+    stats.notes.append(f"ответов на /start: {len(start_replies)} из {users * spam}, "
+                       f"предупреждений «подождите»: {len(throttled)}")
+    stats.notes.append(f"заявок: {published} + повторов {duplicates} на {users} пользователей")
+    # таймауты /start ожидаемы — это и есть отброшенные апдейты
+    stats.errors.pop("/start spam", None)
+    stats.failed = (published != users or duplicates != users
+                    or len(start_replies) > users * 4 or bool(stats.errors))
+    return stats
+
+
+# ---------------------------
+#  7. /search по большой таблице заявок
+# ---------------------------
+SEARCH_WORDS = ["договор", "аренда", "налог", "наследство", "развод", "декларация",
+                "регистрация", "банкротство", "алименты", "справка", "пособие", "ипотека"]
+SEARCH_CITIES = ["Алматы", "Астана", "Шымкент", "Караганда", "Актобе", "Павлодар"]
+SEARCH_QUERIES = ["договор аренды", "наследство", "Шымкент", "налог декларация", "алименты развод"]
+
+
+async def search(api: FakeTelegramAPI, database_url: str, rows: int = 200_000, repeats: int = 20, **_) -> Stats:
+    """rows заявок (открыта каждая пятая) со случайными описаниями; специалист repeats раз ищет и листает на 2 стр."""
+    stats = Stats()
+    tg_id = SPECIALIST_BASE + 900_000
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        await _seed_specialists(conn, [tg_id])
+        await conn.execute("""
+            INSERT INTO requests (phone, name, city, description, specialization, status, created_at)
+            SELECT '+70000000000', 'bench ' || g, ($2::text[])[1 + g % array_length($2::text[], 1)],
+                   ($1::text[])[1 + g % array_length($1::text[], 1)] || ' '
+                   || ($1::text[])[1 + (g / 7) % array_length($1::text[], 1)]
+                   || ', заявка №' || g,
+                   (ARRAY['LAW', 'ACCOUNTING', 'EGOV'])[1 + (g / 84) % 3],
+                   CASE WHEN g % 5 = 0 THEN 'PENDING' ELSE 'DONE' END,  -- открыта каждая пятая
+                   NOW() - make_interval(secs => g)
+            FROM generate_series(1, $3) AS g
+        """, SEARCH_WORDS, SEARCH_CITIES, rows)
+        await conn.execute("ANALYZE requests")
+    finally:
+        await conn.close()
+    stats.started = time.monotonic()
+
+    user = User(api, stats, tg_id)
+    empty = 0
+    for i in range(repeats):
+        query = SEARCH_QUERIES[i % len(SEARCH_QUERIES)]
+        call = await user.send("spec", "/search", f"/search {query}", "🔎")
+        if call is None:
+            continue
+        if "нет" in str(call.params.get("text", "")).split("\n")[0]:
+            empty += 1
+            continue
+        answered = await user.click("spec", "search next", "srch:2", message_id=call.result["message_id"])
+        if answered is None:
+            continue
+    stats.finish()
+    stats.notes.append(f"заявок в базе: {rows}, запросов без результатов: {empty} из {repeats}")
+    stats.failed = empty > 0
+    return stats
+
+
+SCENARIOS = {
+    "wizard": wizard,
+    "claim_storm": claim_storm,
+    "my_requests": my_requests,
+    "cancel_resend": cancel_resend,
+    "fanout": fanout,
+    "flood": flood,
+    "search": search,
+}
+
+# каким ботам нужно работать для сценария
+SCENARIO_BOTS = {
+    "wizard": ("request",),
+    "claim_storm": ("request",),
+    "my_requests": ("spec",),
+    "cancel_resend": ("request", "spec"),
+    "fanout": ("request", "spec"),
+    "flood": ("request",),
+    "search": ("spec",),
+}
+
+# окружение ботов, без которого сценарий не имеет смысла
+SCENARIO_ENV = {
+    "fanout": {"FANOUT_NEW_REQUESTS": "1"},
+    "flood": {"THROTTLE_RATE": "1"},
+}
@@ -0,0 +1,118 @@
+"""
+request-bot и spec-bot в одном процессе: один event loop, один пул Postgres,
+одна aiohttp-сессия (и общие экземпляры Bot) на оба токена.
+
+Модули ботов называются одинаково (bot, db, keyboards, states), поэтому каждый
+бот импортируется отдельно: перед загрузкой следующего его модули убираются
+из sys.modules — хендлеры держат ссылки на «свои» db/keyboards через глобалы.
+Одинаковые в обоих ботах модули (sender, metrics, send_queue и т.д.)
+загружаются один раз — так общими получаются сессия, Bot и реестр метрик.
+
+В режиме webhook оба бота слушают один порт: {WEBHOOK_PATH}/request и {WEBHOOK_PATH}/spec.
+Раздельный запуск (python request-bot/bot.py, python spec-bot/bot.py) не меняется.
+"""
+import asyncio
+import importlib
+import signal
+import sys
+from contextlib import suppress
+from pathlib import Path
+from types import ModuleType
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ROOT = Path(__file__).resolve().parent.parent
+BOT_DIRS = {"request": ROOT / "request-bot", "spec": ROOT / "spec-bot"}
+
+# Файлы, одинаковые в обоих ботах: грузятся один раз из request-bot
+SHARED_MODULES = (
+    "sender", "metrics", "webhook", "send_queue", "tasks", "recorder",
+    "fsm_storage", "specialists_cache", "migrate", "shards", "throttle",
+)
+# Свои у каждого бота
+OWN_MODULES = ("bot", "db", "keyboards", "states", "fsm_buffer", "outbox", "sweeper", "fanout")
+
+
+def load_bot(name: str) -> ModuleType:
+    """Импортирует bot.py из папки бота name так, чтобы его db/keyboards не встретились с чужими."""
+    path = str(BOT_DIRS[name])
+    sys.path.insert(0, path)
+    try:
+        module = importlib.import_module("bot")
+    finally:
+        sys.path.remove(path)
+        for own in OWN_MODULES:
+            loaded = sys.modules.pop(own, None)
+            if loaded is not None:
+                sys.modules[f"{name}_bot.{own}"] = loaded
+    return module
+
+
+def load_bots() -> dict[str, ModuleType]:
+    bots = {"request": load_bot("request")}
+    shared = {name: sys.modules[name] for name in SHARED_MODULES if name in sys.modules}
+    bots["spec"] = load_bot("spec")
+    # общий модуль не должен был загрузиться второй раз из spec-bot
+    for name, module in shared.items():
+        assert sys.modules[name] is module, f"{name} загружен дважды"
+    return bots
+
+
+async def run_polling(bots: dict[str, ModuleType]):
+    """Long polling обоих токенов; SIGINT/SIGTERM останавливает оба."""
+    loop = asyncio.get_running_loop()
+
+    async def stop():
+        for module in bots.values():
+            with suppress(RuntimeError):  # polling ещё не запущен
+                await module.dp.stop_polling()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, lambda: asyncio.ensure_future(stop()))
+
+    for module in bots.values():
+        await module.bot.delete_webhook()
+    # сессию закрываем сами в конце: она общая
+    await asyncio.gather(*(
+        module.dp.start_polling(module.bot, handle_signals=False, close_bot_session=False)
+        for module in bots.values()
+    ))
+
+
+async def main():
+    bots = load_bots()
+    request, spec = bots["request"], bots["spec"]
+    sender = sys.modules["sender"]
+    metrics = sys.modules["metrics"]
+    webhook = sys.modules["webhook"]
+    if webhook.BOT_MODE == "webhook":
+        webhook.require_webhook_secret()
+
+    pool = await request.init_pool()
+    for module in bots.values():
+        await module.startup(pool)
+    metrics_runner = await metrics.start_metrics_server()
+    print("Request Bot + SPEC-BOT started...")
+    try:
+        if webhook.BOT_MODE == "webhook":
+            await webhook.run_webhooks([
+                (module.dp, module.bot, f"{webhook.WEBHOOK_PATH}/{name}")
+                for name, module in bots.items()
+            ])
+        else:
+            await run_polling(bots)
+    finally:
+        # сначала боты доделывают своё, общие пул и сессию закрываем последними
+        for module in bots.values():
+            await module.shutdown(shared=True)
+        await sender.close_bots()
+        await request.close_pool()
+        await spec.close_pool()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,36 +1,81 @@
 import asyncio
+import asyncpg
+import html
+import logging
 import os
-from aiogram import Bot, Dispatcher, F
+import uuid
+from aiogram import Dispatcher, F
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
+from aiogram.methods import SendMessage, EditMessageText
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import (
-    Message, CallbackQuery, ReplyKeyboardRemove
+    Message, CallbackQuery, ReplyKeyboardRemove,
+    InlineKeyboardMarkup, ReplyKeyboardMarkup
 )
-from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
+from webhook import BOT_MODE, require_webhook_secret, run_webhook
+from sender import get_bot_by_sender, get_session, close_bots
 
 from states import ReqForm
 from keyboards import (
     phone_kb, category_kb, claim_kb,
     confirm_kb, edit_field_kb
 )
+from specialists_cache import SpecialistsCache
+from fsm_storage import create_storage
+from migrate import migrate
+from fsm_buffer import FSMBufferMiddleware
+from send_queue import SendQueue, PRIORITY_USER, PRIORITY_CHANNEL
+from outbox import OutboxPublisher
+from sweeper import Sweeper, SWEEP_NOTE
+from tasks import BackgroundTasks
+from recorder import setup_recorder
+from throttle import setup_throttling
+from shards import WORKERS, run_sharded
+from metrics import (
+    setup_metrics,
+    start_metrics_server,
+    SEND_QUEUE_DEPTH,
+    BACKGROUND_PENDING,
+)
 from db import (
     save_request,
-    save_message_id,
-    request_already_claimed,
-    check_approved_specialist,
-    set_claimed,
-    get_request_data,
+    try_claim_request,
+    get_specialist_status,
+    init_pool,
+    get_pool,
+    close_pool,
+    CLAIM_NOT_APPROVED,
+    CLAIM_TAKEN,
+    CLAIM_NOT_FOUND,
 )
 
 load_dotenv()
 
-REQUEST_BOT_TOKEN = os.getenv("REQUEST_BOT_TOKEN")
-SPEC_BOT_TOKEN = os.getenv("SPEC_BOT_TOKEN")
+bot = get_bot_by_sender("request")
+spec_bot = get_bot_by_sender("spec")
+dp = Dispatcher(storage=create_storage(get_pool))
+specialists_cache = SpecialistsCache(get_specialist_status)
+send_queue = SendQueue()
+# побочные эффекты хендлеров (правки каналов, ЛС, очистка чата)
+background = BackgroundTasks()
+
+# флуд: лимиты на пользователя и хендлер, двойные тапы по кнопкам (throttle.py)
+throttling = setup_throttling(dp)
+
+# /metrics: время апдейтов и хендлеров, запросы к БД, вызовы Bot API
+setup_metrics(dp, get_session())
+SEND_QUEUE_DEPTH.labels("request").set_function(lambda: send_queue.stats()["depth"])
+BACKGROUND_PENDING.labels("request").set_function(lambda: background.stats()["pending"])
 
-bot = Bot(REQUEST_BOT_TOKEN)
-spec_bot = Bot(SPEC_BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+# RECORD_UPDATES=path.jsonl.gz — запись входящих апдейтов для bench/replay.py
+recorder = setup_recorder(dp, "request")
+
+# одно чтение и одна запись FSM-данных на апдейт
+fsm_buffer = FSMBufferMiddleware()
+dp.message.middleware(fsm_buffer)
+dp.callback_query.middleware(fsm_buffer)
 
 CHANNELS = {
     "ACCOUNTING": os.getenv("CHANNEL_ACCOUNTING"),
@@ -38,33 +83,137 @@ CHANNELS = {
     "EGOV": os.getenv("CHANNEL_EGOV")
 }
 
+# messages — новый вопрос отдельным сообщением (с последующей очисткой чата)
+# inplace  — одна карточка-анкета, которая редактируется на каждом шаге
+WIZARD_MODE = os.getenv("WIZARD_MODE", "messages")
+# за сколько секунд заявка с тем же телефоном и описанием считается повтором; 0 — не искать
+REQUEST_DEDUP_WINDOW = float(os.getenv("REQUEST_DEDUP_WINDOW", str(24 * 60 * 60)))
+
+logger = logging.getLogger(__name__)
+
 # ======================================================
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ: запомнить/очистить сообщения
 # ======================================================
 
 async def remember_msg(state: FSMContext, msg: Message):
+    if WIZARD_MODE == "inplace":
+        return  # в режиме карточки чистить нечего
     data = await state.get_data()
     ids = data.get("msg_ids", [])
     ids.append(msg.message_id)
     await state.update_data(msg_ids=ids)
 
 
-async def cleanup_chat(state: FSMContext, msg: Message):
+CLEANUP_CHUNK = 100  # максимум id в одном deleteMessages
+cleanup_stats = {"deleted": 0, "failed": 0}
+
+
+async def cleanup_chat(chat_id: int, ids: list[int]):
+    ids = list(dict.fromkeys(ids))
+    chunks = [ids[i:i + CLEANUP_CHUNK] for i in range(0, len(ids), CLEANUP_CHUNK)]
+
+    results = await asyncio.gather(
+        *(bot.delete_messages(chat_id, chunk) for chunk in chunks),
+        return_exceptions=True,
+    )
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, Exception):
+            cleanup_stats["failed"] += len(chunk)
+            logger.warning("deleteMessages in chat %s failed: %s", chat_id, result)
+        else:
+            cleanup_stats["deleted"] += len(chunk)
+
+
+def channel_post(job: dict) -> SendMessage:
+    req_id = job["request_id"]
+    return SendMessage(
+        chat_id=job["channel_id"],
+        text=f"📩 <b>Новая заявка (ID: {req_id})</b>\n\n"
+             f"👤 Имя: {job['name']}\n"
+             f"🏙 Город: {job['city']}\n"
+             f"📝 Описание: {job['description']}",
+        parse_mode="HTML",
+        reply_markup=claim_kb(req_id)
+    )
+
+
+outbox_publisher = OutboxPublisher(bot, send_queue, channel_post)
+
+
+def released_card(row: dict) -> EditMessageText:
+    # заявка вернулась в канал sweeper'ом — та же карточка, что после отмены специалистом
+    return EditMessageText(
+        chat_id=row["tg_chat_id"],
+        message_id=row["tg_message_id"],
+        text=f"📩 <b>Заявка (ID: {row['id']})</b>\n\n"
+             f"👤 Имя: {row['name']}\n"
+             f"🏙 {row['city']}\n"
+             f"📝 {row['description']}\n"
+             f"❌ <b>Отменено специалистом</b>\n"
+             f"\n⚠️ Причина: <i>{SWEEP_NOTE}</i>\n",
+        parse_mode="HTML",
+        reply_markup=claim_kb(row["id"])
+    )
+
+
+# зависшие CLAIMED и заявки без поста в канале (sweeper.py)
+sweeper = Sweeper(send_queue, outbox_publisher, CHANNELS, released_card)
+
+
+def render_card(data: dict, question: str) -> str:
+    def field(key: str) -> str:
+        return html.escape(str(data[key])) if data.get(key) else "—"
+
+    return (
+        "📄 <b>Ваша заявка</b>\n\n"
+        f"📞 Телефон: {field('phone')}\n"
+        f"👤 Имя: {field('name')}\n"
+        f"🏙 Город: {field('city')}\n"
+        f"📝 Описание: {field('desc')}\n"
+        f"📌 Категория: {field('category')}\n\n"
+        f"{question}"
+    )
+
+
+async def ask(message: Message, state: FSMContext, question: str, reply_markup=None):
+    """
+    Следующий шаг мастера.
+    В режиме messages — новое сообщение, которое потом удалит cleanup_chat.
+    В режиме inplace — правка карточки-анкеты; новая карточка отправляется,
+    только если её ещё нет или нужна reply-клавиатура (её нельзя поставить правкой).
+    """
+    if WIZARD_MODE != "inplace":
+        q = await message.answer(question, reply_markup=reply_markup)
+        await remember_msg(state, q)
+        return
+
     data = await state.get_data()
-    ids = data.get("msg_ids", [])
-    chat_id = msg.chat.id
+    text = render_card(data, question)
+    card_id = data.get("card_id")
 
-    for m_id in ids:
+    if card_id and not isinstance(reply_markup, ReplyKeyboardMarkup):
         try:
-            await bot.delete_message(chat_id, m_id)
-        except Exception:
-            pass
-
-    # очистим список сообщений в стейте
-    await state.update_data(msg_ids=[])
+            await message.bot.edit_message_text(
+                text,
+                chat_id=message.chat.id,
+                message_id=card_id,
+                parse_mode="HTML",
+                reply_markup=reply_markup if isinstance(reply_markup, InlineKeyboardMarkup) else None,
+            )
+            return
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                return
+            # карточку удалили или она слишком старая — пришлём новую
+
+    card = await message.answer(text, parse_mode="HTML", reply_markup=reply_markup)
+    await state.update_data(card_id=card.message_id)
 
 
 async def show_preview(message: Message, state: FSMContext):
+    if WIZARD_MODE == "inplace":
+        return await ask(message, state, "Все верно?", confirm_kb())
+
     data = await state.get_data()
     preview = (
         "📄 <b>Проверьте вашу заявку:</b>\n\n"
@@ -83,11 +232,12 @@ async def show_preview(message: Message, state: FSMContext):
 # 1) START → FSM
 # ======================================================
 
-@dp.message(CommandStart())
+@dp.message(CommandStart(), flags={"throttle": {"rate": 0.2, "burst": 3}})
 async def start(msg: Message, state: FSMContext):
-    q = await msg.answer("📞 Укажите номер телефона:", reply_markup=phone_kb())
+    # новая отправка: из этого id и чата складывается ключ идемпотентности заявки
+    await state.update_data(submission_id=uuid.uuid4().hex)
     await remember_msg(state, msg)   # /start
-    await remember_msg(state, q)
+    await ask(msg, state, "📞 Укажите номер телефона:", phone_kb())
     await state.set_state(ReqForm.phone)
 
 
@@ -106,8 +256,7 @@ async def get_phone(msg: Message, state: FSMContext):
         await show_preview(msg, state)
         return
 
-    q = await msg.answer("👤 Как вас зовут?")
-    await remember_msg(state, q)
+    await ask(msg, state, "👤 Как вас зовут?")
     await state.set_state(ReqForm.name)
 
 
@@ -124,8 +273,7 @@ async def get_name(msg: Message, state: FSMContext):
         await show_preview(msg, state)
         return
 
-    q = await msg.answer("🏙 Из какого вы города?")
-    await remember_msg(state, q)
+    await ask(msg, state, "🏙 Из какого вы города?")
     await state.set_state(ReqForm.city)
 
 
@@ -142,8 +290,7 @@ async def get_city(msg: Message, state: FSMContext):
         await show_preview(msg, state)
         return
 
-    q = await msg.answer("📝 Опишите вашу проблему:")
-    await remember_msg(state, q)
+    await ask(msg, state, "📝 Опишите вашу проблему:")
     await state.set_state(ReqForm.desc)
 
 
@@ -160,8 +307,7 @@ async def get_desc(msg: Message, state: FSMContext):
         await show_preview(msg, state)
         return
 
-    q = await msg.answer("📌 Выберите категорию:", reply_markup=category_kb())
-    await remember_msg(state, q)
+    await ask(msg, state, "📌 Выберите категорию:", category_kb())
     await state.set_state(ReqForm.category)
 
 
@@ -177,55 +323,62 @@ async def select_category(call: CallbackQuery, state: FSMContext):
     # если это редактирование категории → сразу к превью
     await state.update_data(edit_field=None)
     await show_preview(call.message, state)
+    return call.answer()
 
 
 # ======================================================
 # 2) КНОПКИ: подтвердить / изменить
 # ======================================================
 
-@dp.callback_query(F.data == "confirm:send")
+@dp.callback_query(F.data == "confirm:send", flags={"throttle": {"rate": 0.2, "burst": 1}})
 async def final_send(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-
-    await cleanup_chat(state, call.message)
-
-    req_id = await save_request(data)
-    channel_id = CHANNELS[data["category"]]
-
-    msg = await bot.send_message(
-        channel_id,
-        f"📩 <b>Новая заявка (ID: {req_id})</b>\n\n"
-        f"👤 Имя: {data['name']}\n"
-        f"🏙 Город: {data['city']}\n"
-        f"📝 Описание: {data['desc']}",
-        parse_mode="HTML",
-        reply_markup=claim_kb(req_id)
+    if not data.get("category"):
+        # повторное нажатие после отправки: анкета уже очищена
+        return call.answer("✔ Заявка уже отправлена")
+
+    # анкеты, начатые до появления submission_id, различаем по сообщению с кнопкой
+    submission = data.get("submission_id") or f"msg{call.message.message_id}"
+    # в канал заявку опубликует outbox_publisher, Telegram здесь не ждём
+    saved = await save_request(
+        data, CHANNELS[data["category"]], f"tg:{call.message.chat.id}:{submission}", REQUEST_DEDUP_WINDOW
     )
+    req_id = saved["duplicate_of"] or saved["id"]
+    if saved["duplicate_of"] is None:
+        outbox_publisher.wake()
+        status = "✔ Ваша заявка отправлена! Скоро с вами свяжутся."
+    else:
+        status = f"ℹ️ Такая заявка уже отправлена (ID: {req_id}), повторно публиковать её не будем."
 
-    await save_message_id(req_id, msg.message_id, channel_id)
+    await call.message.answer(status, reply_markup=ReplyKeyboardRemove())
 
-    await call.message.answer(
-        "✔ Ваша заявка отправлена! Скоро с вами свяжутся.",
-        reply_markup=ReplyKeyboardRemove()
-    )
-
-    await call.message.answer(
+    created = (
         f"📄 <b>Ваша заявка создана (ID: {req_id})</b>\n\n"
         f"📞 Телефон: {data['phone']}\n"
         f"👤 Имя: {data['name']}\n"
         f"🏙 Город: {data['city']}\n"
         f"📝 Описание: {data['desc']}\n"
         f"📌 Категория: {data['category']}\n\n"
-        "Мы уже отправили её специалистам. Ожидайте ответа.",
-        parse_mode="HTML"
+        "Мы уже отправили её специалистам. Ожидайте ответа."
     )
+    if WIZARD_MODE == "inplace":
+        # карточка-анкета превращается в итоговую карточку заявки
+        await call.message.edit_text(created, parse_mode="HTML")
+    else:
+        await call.message.answer(created, parse_mode="HTML")
 
     await state.clear()
 
+    # сообщения мастера удаляем уже после подтверждения, не задерживая ответ
+    background.spawn(cleanup_chat(call.message.chat.id, data.get("msg_ids", [])))
+
+    return call.answer()
+
 
 @dp.callback_query(F.data == "confirm:edit")
-async def edit_request(call: CallbackQuery):
-    await call.message.answer("🔄 Что хотите изменить?", reply_markup=edit_field_kb())
+async def edit_request(call: CallbackQuery, state: FSMContext):
+    await ask(call.message, state, "🔄 Что хотите изменить?", edit_field_kb())
+    return call.answer()
 
 
 # ======================================================
@@ -256,69 +409,124 @@ async def edit_field(call: CallbackQuery, state: FSMContext):
         "cat": "📌 Выберите категорию:",
     }
 
-    if field == "cat":
-        q = await call.message.answer(questions[field], reply_markup=category_kb())
-    else:
-        q = await call.message.answer(questions[field])
-
     await remember_msg(state, call.message)
-    await remember_msg(state, q)
+    await ask(call.message, state, questions[field], category_kb() if field == "cat" else None)
+    return call.answer()
 
 
 # ======================================================
 # 4) CLAIM — взятие заявки в работу
 # ======================================================
 
-@dp.callback_query(F.data.startswith("claim:"))
+def claimed_card(req_id: int, username: str, data: dict) -> EditMessageText:
+    return EditMessageText(
+        text=f"📩 <b>Заявка (ID: {req_id})</b>\n\n"
+             f"👤 Имя: {data['name']}\n"
+             f"🏙 Город: {data['city']}\n"
+             f"📝 Описание: {data['description']}\n\n"
+             f"✔ Взял: @{username}",
+        chat_id=data["tg_chat_id"],
+        message_id=data["tg_message_id"],
+        parse_mode="HTML"
+    )
+
+
+def claimed_dm(req_id: int, tg_id: int, data: dict) -> SendMessage:
+    return SendMessage(
+        chat_id=tg_id,
+        text=f"🛠 <b>Вы приняли заявку (ID: {req_id})</b>\n\n"
+             f"📞 Телефон: {data['phone']}\n"
+             f"👤 Имя: {data['name']}\n"
+             f"🏙 Город: {data['city']}\n"
+             f"📝 {data['description']}\n"
+             f"📌 Категория: {data['specialization']}",
+        parse_mode="HTML"
+    )
+
+
+@dp.callback_query(F.data.startswith("claim:"), flags={"throttle": {"rate": 0.5, "burst": 3}})
 async def claim_request(call: CallbackQuery):
     req_id = int(call.data.split(":")[1])
     tg_id = call.from_user.id
     username = call.from_user.username or f"id{tg_id}"
 
-    if not await check_approved_specialist(tg_id):
-        return await call.answer("⛔ Вы не одобрены как специалист!", show_alert=True)
+    # неодобренных отсекаем по кэшу, не трогая базу
+    if not await specialists_cache.is_approved(tg_id):
+        return call.answer("⛔ Вы не одобрены как специалист!", show_alert=True)
 
-    if await request_already_claimed(req_id):
-        return await call.answer("❌ Заявку уже взял другой!", show_alert=True)
+    result, data = await try_claim_request(req_id, tg_id, username)
 
-    await set_claimed(req_id, tg_id, username)
-    data = await get_request_data(req_id)
+    if result == CLAIM_NOT_APPROVED:
+        specialists_cache.invalidate(tg_id)
+        return call.answer("⛔ Вы не одобрены как специалист!", show_alert=True)
 
-    new_text = (
-        f"📩 <b>Заявка (ID: {req_id})</b>\n\n"
-        f"👤 Имя: {data['name']}\n"
-        f"🏙 Город: {data['city']}\n"
-        f"📝 Описание: {data['description']}\n\n"
-        f"✔ Взял: @{username}"
-    )
-    await bot.edit_message_text(
-        new_text,
-        chat_id=data["tg_chat_id"],
-        message_id=data["tg_message_id"],
-        parse_mode="HTML"
-    )
+    if result == CLAIM_NOT_FOUND:
+        return call.answer("❌ Заявка не найдена!", show_alert=True)
 
-    await spec_bot.send_message(
-        tg_id,
-        f"🛠 <b>Вы приняли заявку (ID: {req_id})</b>\n\n"
-        f"📞 Телефон: {data['phone']}\n"
-        f"👤 Имя: {data['name']}\n"
-        f"🏙 Город: {data['city']}\n"
-        f"📝 {data['description']}\n"
-        f"📌 Категория: {data['specialization']}",
-        parse_mode="HTML"
-    )
+    if result == CLAIM_TAKEN:
+        return call.answer("❌ Заявку уже взял другой!", show_alert=True)
 
-    await call.answer("👌 Вы взяли заявку!")
+    # решение принято в базе — отвечаем сразу, сообщения уходят в фоне
+    background.spawn(
+        send_queue.send(bot, claimed_card(req_id, username, data), PRIORITY_CHANNEL),
+        f"claim:{req_id} card",
+    )
+    background.spawn(
+        send_queue.send(spec_bot, claimed_dm(req_id, tg_id, data), PRIORITY_USER),
+        f"claim:{req_id} dm",
+    )
+    return call.answer("👌 Вы взяли заявку!")
 
 
 # ======================================================
 # MAIN
 # ======================================================
 
+async def startup(pool: asyncpg.Pool | None = None):
+    """pool — общий пул combined-bot, иначе бот открывает свой."""
+    await init_pool(pool)
+    await migrate(get_pool())
+    specialists_cache.start_listener()
+    outbox_publisher.start()
+    sweeper.start()
+
+
+async def shutdown(shared: bool = False):
+    """shared — пул и сессию Bot делят боты combined-bot, их закрывает он после всех ботов."""
+    await sweeper.stop()
+    await outbox_publisher.stop()
+    await background.close()
+    await send_queue.close()
+    await specialists_cache.stop_listener()
+    if not shared:
+        await close_bots()
+        await close_pool()
+    if recorder is not None:
+        await recorder.close()
+
+
 async def main():
+    if BOT_MODE == "webhook":
+        require_webhook_secret()
+    if WORKERS > 1:
+        # этот процесс только принимает апдейты, хендлеры — в воркерах (shards.py)
+        print(f"Request Bot started with {WORKERS} workers...")
+        await run_sharded(dp, bot, BOT_MODE)
+        return
+
+    await startup()
+    metrics_runner = await start_metrics_server()
     print("Request Bot started...")
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        await shutdown()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -2,135 +2,357 @@ import asyncpg
 import os
 from dotenv import load_dotenv
 
+from metrics import db_timed
+
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Параметры пула соединений
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+_pool: asyncpg.Pool | None = None
+
 
 # ---------------------------
-#  Сохранение заявки + ID
+#  Пул соединений (один на процесс)
 # ---------------------------
-async def save_request(data: dict) -> int:
-    conn = await asyncpg.connect(DATABASE_URL)
-    row = await conn.fetchrow("""
-        INSERT INTO requests (phone, name, city, description, specialization, status)
-        VALUES ($1, $2, $3, $4, $5, 'PENDING')
-        RETURNING id
-    """, data["phone"], data["name"], data["city"], data["desc"], data["category"])
-    await conn.close()
-    return row["id"]
+async def init_pool(pool: asyncpg.Pool | None = None) -> asyncpg.Pool:
+    """pool — уже открытый пул другого бота того же процесса (combined-bot)."""
+    global _pool
+    if _pool is None:
+        _pool = pool or await asyncpg.create_pool(
+            DATABASE_URL,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        )
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
 
 
+def get_pool() -> asyncpg.Pool:
+    if _pool is None:
+        raise RuntimeError("DB pool is not initialized, call init_pool() first")
+    return _pool
+
+
+# SQL запросов горячего пути — константы: migrate.py --check EXPLAIN-ит
+# ровно тот текст, который выполняет бот.
+
 # ---------------------------
-#  Сохранить message_id + chat_id
+#  Сохранение заявки + ID
 # ---------------------------
-async def save_message_id(req_id: int, message_id: int, channel_id: str):
-    conn = await asyncpg.connect(DATABASE_URL)
+SAVE_REQUEST_SQL = """
+    WITH dup AS (
+        SELECT id FROM requests
+        WHERE $8 > 0
+          AND content_hash = request_content_hash($1, $4)
+          AND duplicate_of IS NULL
+          AND status IN ('PENDING', 'CLAIMED', 'RESEND')
+          AND created_at > NOW() - make_interval(secs => $8)
+        ORDER BY created_at DESC
+        LIMIT 1
+    ), req AS (
+        INSERT INTO requests (phone, name, city, description, specialization, status,
+                              idempotency_key, duplicate_of)
+        SELECT $1, $2, $3, $4, $5,
+               CASE WHEN dup.id IS NULL THEN 'PENDING' ELSE 'DUPLICATE' END,
+               $7, dup.id
+        FROM (SELECT 1) AS one
+        LEFT JOIN dup ON TRUE
+        ON CONFLICT (idempotency_key) DO NOTHING
+        RETURNING id, duplicate_of
+    ), outbox AS (
+        INSERT INTO channel_outbox (request_id, channel_id)
+        SELECT id, $6 FROM req
+        WHERE duplicate_of IS NULL
+    )
+    SELECT id, duplicate_of, TRUE AS created FROM req
+    UNION ALL
+    SELECT id, duplicate_of, FALSE FROM requests
+    WHERE idempotency_key = $7 AND NOT EXISTS (SELECT 1 FROM req)
+"""
 
-    await conn.execute("""
-        UPDATE requests
-        SET tg_message_id=$1,
-            tg_chat_id=$2,
-            sent_by_bot = 'request'
-        WHERE id=$3
-    """, str(message_id), str(channel_id), req_id)   # <-- FIX HERE!
 
-    await conn.close()
+REQUEST_BY_IDEMPOTENCY_KEY_SQL = """
+    SELECT id, duplicate_of, FALSE AS created FROM requests
+    WHERE idempotency_key = $1
+"""
+
+
+@db_timed
+async def save_request(data: dict, channel_id: str, idempotency_key: str, dedup_window: float) -> dict:
+    """
+    Заявка и задание на публикацию в канал пишутся одним запросом (атомарно):
+    публикует её OutboxPublisher, хендлеру ждать Telegram не нужно.
+
+    idempotency_key уникален: повтор той же отправки возвращает уже
+    сохранённую заявку (created = False). Если за dedup_window секунд
+    с того же телефона пришла заявка с тем же описанием и она ещё в работе,
+    новая сохраняется как DUPLICATE со ссылкой duplicate_of и в канал не идёт.
+    """
+    row = await get_pool().fetchrow(
+        SAVE_REQUEST_SQL,
+        data["phone"], data["name"], data["city"], data["desc"], data["category"], str(channel_id),
+        idempotency_key, float(dedup_window),
+    )
+
+    if row is None:
+        # та же отправка прямо сейчас сохраняется в другой транзакции —
+        # её строка не видна снимку запроса, перечитываем после коммита
+        row = await get_pool().fetchrow(REQUEST_BY_IDEMPOTENCY_KEY_SQL, idempotency_key)
+    return dict(row)
 
 
 # ---------------------------
-#  CLAIM — взято в работу
+#  Outbox публикаций в каналы
 # ---------------------------
-async def set_claimed(req_id: int, tg_id: int, username: str):
-    conn = await asyncpg.connect(DATABASE_URL)
-    await conn.execute("""
-        UPDATE requests
-        SET claimed_by_id=$1,
-            claimed_by_username=$2,
-            status='CLAIMED',
-            claimed_at=NOW()
-        WHERE id=$3
-    """, tg_id, username, req_id)
-    await conn.close()
+LEASE_OUTBOX_SQL = """
+    WITH picked AS (
+        SELECT id FROM channel_outbox
+        WHERE next_attempt_at <= NOW()
+          AND (locked_until IS NULL OR locked_until < NOW())
+        ORDER BY next_attempt_at, id
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    ), leased AS (
+        UPDATE channel_outbox o
+        SET locked_until = NOW() + make_interval(secs => $2),
+            attempts = o.attempts + 1
+        FROM picked
+        WHERE o.id = picked.id
+        RETURNING o.id, o.request_id, o.channel_id, o.attempts
+    )
+    SELECT l.id, l.request_id, l.channel_id, l.attempts,
+           r.name, r.city, r.description
+    FROM leased l
+    JOIN requests r ON r.id = l.request_id
+    ORDER BY l.id
+"""
+
+
+@db_timed
+async def lease_outbox(limit: int, lease_seconds: float) -> list[dict]:
+    """
+    Забирает до limit готовых к отправке заданий вместе с данными заявки.
+    SKIP LOCKED + locked_until: одно задание не достанется двум воркерам,
+    а задание упавшего воркера снова станет доступно после истечения аренды.
+    """
+    rows = await get_pool().fetch(LEASE_OUTBOX_SQL, limit, float(lease_seconds))
+    return [dict(r) for r in rows]
+
+
+@db_timed
+async def renew_outbox(jobs: list[dict], lease_seconds: float) -> int:
+    """
+    Продлевает аренду заданий, пока их посты ждут в SendQueue.
+    Продлеваются только задания, всё ещё числящиеся за нами: attempts
+    с момента lease_outbox не менялся. Возвращает число продлённых.
+    """
+    result = await get_pool().execute("""
+        UPDATE channel_outbox o
+        SET locked_until = NOW() + make_interval(secs => $3)
+        FROM unnest($1::bigint[], $2::int[]) AS j(id, attempts)
+        WHERE o.id = j.id AND o.attempts = j.attempts
+    """, [j["id"] for j in jobs], [j["attempts"] for j in jobs], float(lease_seconds))
+    return int(result.split()[-1])
+
+
+@db_timed
+async def complete_outbox(outbox_id: int, req_id: int, message_id: int, channel_id: str,
+                          fanout: bool = False) -> bool:
+    """
+    Удаление задания, message_id заявки и (fanout) задание рассылки специалистам —
+    одним запросом. Если задание уже завершено (его удалил другой воркер),
+    ничего не меняется и возвращается False.
+    """
+    row = await get_pool().fetchrow("""
+        WITH done AS (
+            DELETE FROM channel_outbox WHERE id=$1
+            RETURNING request_id
+        ), fanout AS (
+            INSERT INTO request_fanout (request_id)
+            SELECT request_id FROM done WHERE $5
+            ON CONFLICT DO NOTHING
+        ), updated AS (
+            UPDATE requests
+            SET tg_message_id=$2,
+                tg_chat_id=$3,
+                sent_by_bot = 'request'
+            WHERE id=$4 AND EXISTS (SELECT 1 FROM done)
+        )
+        SELECT EXISTS (SELECT 1 FROM done) AS completed
+    """, outbox_id, str(message_id), str(channel_id), req_id, fanout)
+    return row["completed"]
+
+
+@db_timed
+async def retry_outbox(outbox_id: int, delay: float, error: str):
+    await get_pool().execute("""
+        UPDATE channel_outbox
+        SET next_attempt_at = NOW() + make_interval(secs => $2),
+            locked_until = NULL,
+            last_error = $3
+        WHERE id=$1
+    """, outbox_id, float(delay), error)
 
 
 # ---------------------------
-#  Проверка — взяли ли уже
+#  Sweeper: зависшие claim и неопубликованные заявки
 # ---------------------------
-async def request_already_claimed(req_id: int) -> bool:
-    conn = await asyncpg.connect(DATABASE_URL)
-    row = await conn.fetchrow("SELECT status FROM requests WHERE id=$1", req_id)
-    await conn.close()
-    return row and row["status"] == "CLAIMED"
+RELEASE_STALE_CLAIMS_SQL = """
+    WITH stale AS (
+        SELECT id FROM requests
+        WHERE status = 'CLAIMED' AND claimed_at < NOW() - make_interval(secs => $1)
+        ORDER BY claimed_at
+        LIMIT $2
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE requests r SET
+        status='RESEND',
+        resend_at=NOW(),
+        claimed_by_id=NULL,
+        claimed_by_username=NULL,
+        claimed_at=NULL,
+        cancel_note=$3
+    FROM stale
+    WHERE r.id = stale.id
+    RETURNING r.id, r.name, r.city, r.description,
+              r.tg_chat_id, r.tg_message_id, r.sent_by_bot
+"""
+
+
+@db_timed
+async def release_stale_claims(older_than: float, limit: int, note: str) -> list[dict]:
+    """
+    Возвращает в RESEND (как отмена специалистом) до limit заявок, которые
+    CLAIMED дольше older_than секунд. SKIP LOCKED: на нескольких репликах
+    каждая заявка достаётся одному sweeper'у. Возвращает данные для карточки.
+    """
+    rows = await get_pool().fetch(RELEASE_STALE_CLAIMS_SQL, float(older_than), limit, note)
+    return [dict(r) for r in rows]
+
+
+REQUEUE_UNPUBLISHED_SQL = """
+    WITH orphaned AS (
+        SELECT r.id, r.specialization FROM requests r
+        WHERE r.status = 'PENDING' AND r.tg_message_id IS NULL
+          AND r.created_at < NOW() - make_interval(secs => $1)
+          AND r.specialization = ANY($3::text[])
+          AND NOT EXISTS (SELECT 1 FROM channel_outbox o WHERE o.request_id = r.id)
+        ORDER BY r.created_at
+        LIMIT $2
+        FOR UPDATE OF r SKIP LOCKED
+    )
+    INSERT INTO channel_outbox (request_id, channel_id)
+    SELECT o.id, c.channel_id
+    FROM orphaned o
+    JOIN unnest($3::text[], $4::text[]) AS c (specialization, channel_id)
+      ON c.specialization = o.specialization
+    ON CONFLICT (request_id) DO NOTHING
+    RETURNING request_id
+"""
+
+
+@db_timed
+async def requeue_unpublished(older_than: float, limit: int, channels: dict[str, str]) -> list[int]:
+    """
+    Ставит в channel_outbox заявки PENDING без поста в канале, созданные
+    раньше older_than секунд назад и без задания публикации.
+    Уникальный индекс по request_id не даёт двум репликам поставить пост дважды.
+    Возвращает id заявок, для которых задание создано.
+    """
+    rows = await get_pool().fetch(REQUEUE_UNPUBLISHED_SQL, float(older_than), limit,
+        list(channels), [str(channel_id) for channel_id in channels.values()])
+    return [r["request_id"] for r in rows]
 
 
 # ---------------------------
-#  Получить данные заявки
+#  CLAIM за один запрос: проверка специалиста + захват + данные карточки
 # ---------------------------
-async def get_request_data(req_id: int):
-    conn = await asyncpg.connect(DATABASE_URL)
-    row = await conn.fetchrow("""
-        SELECT id, phone, name, city, description, specialization,
-               tg_chat_id, tg_message_id, sent_by_bot
-        FROM requests
-        WHERE id=$1
-    """, req_id)
-    await conn.close()
-    return dict(row) if row else None
+CLAIM_OK = "ok"
+CLAIM_NOT_APPROVED = "not_approved"
+CLAIM_TAKEN = "taken"
+CLAIM_NOT_FOUND = "not_found"
 
 
-# ============================================================
-#   ДОПОЛНИТЕЛЬНЫЙ ФУНКЦИОНАЛ (для Spec-Bot)
-# ============================================================
-
-# Проверка — одобрен ли специалист
-async def check_approved_specialist(tg_id: int) -> bool:
-    conn = await asyncpg.connect(DATABASE_URL)
-    row = await conn.fetchrow("""
+TRY_CLAIM_SQL = """
+    WITH spec AS (
         SELECT is_approved FROM specialists
-        WHERE tg_id = $1
-    """, tg_id)
-    await conn.close()
-    return bool(row and row["is_approved"])
+        WHERE tg_id = $2
+    ), claimed AS (
+        UPDATE requests
+        SET claimed_by_id=$2,
+            claimed_by_username=$3,
+            status='CLAIMED',
+            claimed_at=NOW()
+        WHERE id=$1
+          AND claimed_by_id IS NULL
+          AND EXISTS (SELECT 1 FROM spec WHERE is_approved)
+        RETURNING id, phone, name, city, description, specialization,
+                  tg_chat_id, tg_message_id, sent_by_bot
+    )
+    SELECT COALESCE((SELECT bool_or(is_approved) FROM spec), FALSE) AS approved,
+           EXISTS (SELECT 1 FROM requests WHERE id=$1) AS found,
+           c.*
+    FROM (SELECT 1) AS one
+    LEFT JOIN claimed c ON TRUE
+"""
+
 
+@db_timed
+async def try_claim_request(req_id: int, tg_id: int, username: str) -> tuple[str, dict | None]:
+    """
+    Атомарно берёт заявку в работу.
+    UPDATE срабатывает только если специалист одобрен и заявка ещё свободна
+    (claimed_by_id IS NULL), поэтому из одновременных кликов побеждает ровно один.
+    Возвращает (статус, данные карточки) — данные есть только при CLAIM_OK.
+    """
+    row = await get_pool().fetchrow(TRY_CLAIM_SQL, req_id, tg_id, username)
 
-# Получить ID специалиста (для связки в других запросах)
-async def get_specialist_id(tg_id: int) -> int | None:
-    conn = await asyncpg.connect(DATABASE_URL)
-    row = await conn.fetchrow("""
-        SELECT id FROM specialists
-        WHERE tg_id = $1
-    """, tg_id)
-    await conn.close()
-    return row["id"] if row else None
+    if not row["approved"]:
+        return CLAIM_NOT_APPROVED, None
+    if not row["found"]:
+        return CLAIM_NOT_FOUND, None
+    if row["id"] is None:
+        return CLAIM_TAKEN, None
 
+    data = dict(row)
+    del data["approved"], data["found"]
+    return CLAIM_OK, data
 
-# Показать все заявки, которые специалист взял
-async def get_claimed_requests(tg_id: int, page: int, page_size: int):
-    conn = await asyncpg.connect(DATABASE_URL)
 
-    total = await conn.fetchval("""
-        SELECT COUNT(*) FROM requests
-        WHERE claimed_by_id = $1
-    """, tg_id)
+# ============================================================
+#   ДОПОЛНИТЕЛЬНЫЙ ФУНКЦИОНАЛ (для Spec-Bot)
+# ============================================================
 
-    total_pages = max(1, (total + page_size - 1) // page_size)
-    offset = (page - 1) * page_size
+SPECIALIST_STATUS_SQL = """
+    SELECT is_approved, specializations FROM specialists
+    WHERE tg_id = $1
+"""
 
-    rows = await conn.fetch("""
-        SELECT * FROM requests
-        WHERE claimed_by_id = $1
-        ORDER BY claimed_at DESC
-        LIMIT $2 OFFSET $3
-    """, tg_id, page_size, offset)
 
-    await conn.close()
-    return rows, total_pages
+# Статус специалиста для кэша: (is_approved, specializations) или None
+@db_timed
+async def get_specialist_status(tg_id: int) -> tuple[bool, list[str]] | None:
+    row = await get_pool().fetchrow(SPECIALIST_STATUS_SQL, tg_id)
+    if not row:
+        return None
+    return bool(row["is_approved"]), list(row["specializations"] or [])
 
 
 # Вернуть заявку в PENDING (отмена)
+@db_timed
 async def cancel_request(req_id: int, tg_id: int) -> bool:
-    conn = await asyncpg.connect(DATABASE_URL)
-    res = await conn.execute("""
+    res = await get_pool().execute("""
         UPDATE requests
         SET status = 'CANCELED',
             canceled_at = NOW(),
@@ -139,5 +361,4 @@ async def cancel_request(req_id: int, tg_id: int) -> bool:
             claimed_at = NULL
         WHERE id = $1 AND claimed_by_id = $2
     """, req_id, tg_id)
-    await conn.close()
     return res == "UPDATE 1"
@@ -0,0 +1,83 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import StateType
+from aiogram.types import TelegramObject
+
+
+class BufferedFSMContext(FSMContext):
+    """
+    FSMContext, который читает данные из хранилища один раз за апдейт,
+    все изменения держит у себя и пишет их одним set_state/set_data в flush().
+    """
+
+    def __init__(self, context: FSMContext, raw_state: Optional[str]):
+        super().__init__(storage=context.storage, key=context.key)
+        self._state = raw_state
+        self._data: Optional[Dict[str, Any]] = None
+        self._state_changed = False
+        self._data_changed = False
+
+    async def _load(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = await self.storage.get_data(key=self.key)
+        return self._data
+
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = state.state if isinstance(state, State) else state
+        self._state_changed = True
+
+    async def get_state(self) -> Optional[str]:
+        return self._state
+
+    async def set_data(self, data: Dict[str, Any]) -> None:
+        self._data = data.copy()
+        self._data_changed = True
+
+    async def get_data(self) -> Dict[str, Any]:
+        return (await self._load()).copy()
+
+    async def update_data(
+        self, data: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> Dict[str, Any]:
+        if data:
+            kwargs.update(data)
+        current = await self._load()
+        current.update(kwargs)
+        self._data_changed = True
+        return current.copy()
+
+    async def flush(self) -> None:
+        if self._state_changed:
+            await self.storage.set_state(key=self.key, state=self._state)
+            self._state_changed = False
+        if self._data_changed:
+            await self.storage.set_data(key=self.key, data=self._data)
+            self._data_changed = False
+
+
+class FSMBufferMiddleware(BaseMiddleware):
+    """
+    Подменяет state в хендлере на BufferedFSMContext и сбрасывает
+    накопленные изменения в хранилище, когда хендлер закончил работу.
+    Регистрируется как inner-middleware, т.е. после фильтров по состоянию.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        context = data.get("state")
+        if context is None:
+            return await handler(event, data)
+
+        buffered = BufferedFSMContext(context, data.get("raw_state"))
+        data["state"] = buffered
+        try:
+            return await handler(event, data)
+        finally:
+            await buffered.flush()
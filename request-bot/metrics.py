@@ -0,0 +1,181 @@
+import functools
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+from aiohttp import web
+from dotenv import load_dotenv
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+load_dotenv()
+
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+# 0 — не поднимать /metrics
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+UPDATE_SECONDS = Histogram(
+    "bot_update_seconds", "Полная обработка апдейта", ["update_type"]
+)
+UPDATE_ERRORS = Counter(
+    "bot_update_errors_total", "Апдейты, обработка которых упала", ["update_type"]
+)
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Время работы хендлера", ["handler"]
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в хендлерах", ["handler"]
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Запросы к Postgres", ["query"],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total", "Запросы к Postgres, завершившиеся ошибкой", ["query"]
+)
+API_SECONDS = Histogram(
+    "telegram_api_seconds", "Вызовы Bot API", ["method"]
+)
+API_ERRORS = Counter(
+    "telegram_api_errors_total", "Ошибки Bot API", ["method", "error"]
+)
+API_RETRY_AFTER = Counter(
+    "telegram_api_retry_after_total", "Ответы 429 от Bot API", ["method"]
+)
+SEND_QUEUE_DEPTH = Gauge(
+    "send_queue_depth", "Вызовы Bot API, ждущие отправки в SendQueue", ["bot"]
+)
+BACKGROUND_PENDING = Gauge(
+    "background_tasks_pending", "Незавершённые фоновые задачи хендлеров", ["bot"]
+)
+THROTTLED_UPDATES = Counter(
+    "bot_throttled_updates_total", "Апдейты, отброшенные защитой от флуда", ["handler", "reason"]
+)
+# WORKERS > 1: метрики приёмника по воркерам
+WORKER_BACKLOG = Gauge(
+    "worker_backlog", "Апдейты в очереди приёмника на воркер", ["worker"]
+)
+WORKER_IN_FLIGHT = Gauge(
+    "worker_in_flight", "Апдейты в обработке у воркера (по последнему отчёту)", ["worker"]
+)
+WORKER_PROCESSED = Counter(
+    "worker_processed_total", "Апдейты, обработанные воркером", ["worker"]
+)
+WORKER_RESTARTS = Counter(
+    "worker_restarts_total", "Перезапуски упавших воркеров", ["worker"]
+)
+
+
+def db_timed(fn: Callable[..., Awaitable[Any]]):
+    """Декоратор для функций db.py: время и ошибки запроса под именем функции."""
+    seconds = DB_QUERY_SECONDS.labels(fn.__name__)
+    errors = DB_QUERY_ERRORS.labels(fn.__name__)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer-middleware на dp.update: время апдейта целиком, по типу апдейта."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_type = event.event_type
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            UPDATE_ERRORS.labels(update_type).inc()
+            raise
+        finally:
+            UPDATE_SECONDS.labels(update_type).observe(time.perf_counter() - start)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner-middleware: вызывается уже для выбранного хендлера, метка — имя функции."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии: время каждого вызова Bot API, ошибки и 429 по методу."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = type(method).__name__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            API_RETRY_AFTER.labels(name).inc()
+            raise
+        except Exception as e:
+            API_ERRORS.labels(name, type(e).__name__).inc()
+            raise
+        finally:
+            API_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+def setup_metrics(dp: Dispatcher, session: BaseSession):
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    handler_metrics = HandlerMetricsMiddleware()
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(handler_metrics)
+    # в combined-bot сессия общая у двух диспетчеров — вызовы считаем один раз
+    if not any(isinstance(m, ApiMetricsMiddleware) for m in session.middleware):
+        session.middleware(ApiMetricsMiddleware())
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> web.AppRunner | None:
+    """Поднимает отдельный aiohttp-сервер с /metrics в формате Prometheus."""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,36 @@
+-- Базовые таблицы. В уже работающих базах таблицы есть —
+-- тогда только добиваем недостающие колонки.
+
+CREATE TABLE IF NOT EXISTS specialists (
+    id SERIAL PRIMARY KEY
+);
+ALTER TABLE specialists
+    ADD COLUMN IF NOT EXISTS tg_id           BIGINT,
+    ADD COLUMN IF NOT EXISTS username        TEXT,
+    ADD COLUMN IF NOT EXISTS name            TEXT,
+    ADD COLUMN IF NOT EXISTS phone           TEXT,
+    ADD COLUMN IF NOT EXISTS is_approved     BOOLEAN     NOT NULL DEFAULT FALSE,
+    ADD COLUMN IF NOT EXISTS specializations TEXT[]      NOT NULL DEFAULT '{}',
+    ADD COLUMN IF NOT EXISTS created_at      TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+CREATE TABLE IF NOT EXISTS requests (
+    id SERIAL PRIMARY KEY
+);
+ALTER TABLE requests
+    ADD COLUMN IF NOT EXISTS phone               TEXT,
+    ADD COLUMN IF NOT EXISTS name                TEXT,
+    ADD COLUMN IF NOT EXISTS city                TEXT,
+    ADD COLUMN IF NOT EXISTS description         TEXT,
+    ADD COLUMN IF NOT EXISTS specialization      TEXT,
+    ADD COLUMN IF NOT EXISTS status              TEXT        NOT NULL DEFAULT 'PENDING',
+    ADD COLUMN IF NOT EXISTS tg_chat_id          TEXT,
+    ADD COLUMN IF NOT EXISTS tg_message_id       TEXT,
+    ADD COLUMN IF NOT EXISTS sent_by_bot         TEXT,
+    ADD COLUMN IF NOT EXISTS claimed_by_id       BIGINT,
+    ADD COLUMN IF NOT EXISTS claimed_by_username TEXT,
+    ADD COLUMN IF NOT EXISTS claimed_at          TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS resend_at           TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS canceled_at         TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS finished_at         TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS cancel_note         TEXT,
+    ADD COLUMN IF NOT EXISTS created_at          TIMESTAMPTZ NOT NULL DEFAULT NOW();
@@ -0,0 +1,15 @@
+-- Фоновый sweeper request-bot (sweeper.py).
+
+-- зависшие claim: CLAIMED дольше SWEEP_CLAIM_TTL
+CREATE INDEX IF NOT EXISTS requests_stale_claimed_idx
+    ON requests (claimed_at)
+    WHERE status = 'CLAIMED';
+
+-- заявки, пост которых так и не появился в канале
+CREATE INDEX IF NOT EXISTS requests_unpublished_idx
+    ON requests (created_at)
+    WHERE status = 'PENDING' AND tg_message_id IS NULL;
+
+-- одно задание публикации на заявку: sweeper на нескольких репликах
+-- не поставит пост дважды (INSERT ... ON CONFLICT DO NOTHING)
+CREATE UNIQUE INDEX IF NOT EXISTS channel_outbox_request_key ON channel_outbox (request_id);
@@ -0,0 +1,18 @@
+-- Рассылка новых заявок подходящим специалистам в ЛС (spec-bot, fanout.py).
+-- Строку ставит тот, кто опубликовал заявку в канал (request-bot outbox или
+-- admin-server) при FANOUT_NEW_REQUESTS=1; обрабатывает spec-bot.
+
+CREATE TABLE IF NOT EXISTS request_fanout (
+    request_id   INTEGER     PRIMARY KEY REFERENCES requests (id) ON DELETE CASCADE,
+    -- keyset по specialists.tg_id: кому уже отправлено (после падения продолжаем отсюда)
+    last_tg_id   BIGINT      NOT NULL DEFAULT 0,
+    sent         INTEGER     NOT NULL DEFAULT 0,
+    locked_until TIMESTAMPTZ,
+    created_at   TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS request_fanout_created_at_idx ON request_fanout (created_at);
+
+-- WHERE is_approved AND specializations @> ARRAY[$1]
+CREATE INDEX IF NOT EXISTS specialists_specializations_gin
+    ON specialists USING gin (specializations)
+    WHERE is_approved;
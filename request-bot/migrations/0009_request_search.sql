@@ -0,0 +1,68 @@
+-- Поиск по заявкам: /search в spec-bot и ?q= в admin-server.
+-- Как и 0008, идёт на живой таблице: колонка без перезаписи таблицы,
+-- backfill пачками, GIN-индексы CONCURRENTLY.
+
+-- полнотекстовый вектор описания; считает триггер, старые заявки
+-- дозаполняются пачками в конце файла
+ALTER TABLE requests ADD COLUMN IF NOT EXISTS search_tsv tsvector;
+
+CREATE OR REPLACE FUNCTION requests_set_search_tsv() RETURNS trigger AS $$
+BEGIN
+    NEW.search_tsv := to_tsvector('russian', coalesce(NEW.description, ''));
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER requests_search_tsv
+BEFORE INSERT OR UPDATE OF description, search_tsv ON requests
+FOR EACH ROW EXECUTE FUNCTION requests_set_search_tsv();
+
+-- Город и имя ищутся через ILIKE '%...%', его ускоряют триграммные индексы.
+-- pg_trgm есть в contrib (в образе postgres:16 — есть); если расширения
+-- на сервере нет, поиск работает без индекса, а migrate.py --check это покажет.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    ELSE
+        RAISE WARNING 'pg_trgm недоступен: поиск по городу и имени пойдёт без индекса';
+    END IF;
+END
+$$;
+
+-- migrate: no-transaction
+
+-- заявки, созданные до триггера: пачками по id, каждая пачка — своя транзакция
+DO $$
+DECLARE
+    last_id INT := 0;
+    max_id  INT;
+BEGIN
+    SELECT max(id) INTO max_id FROM requests;
+    WHILE last_id < coalesce(max_id, 0) LOOP
+        UPDATE requests SET search_tsv = to_tsvector('russian', coalesce(description, ''))
+        WHERE id > last_id AND id <= last_id + 5000 AND search_tsv IS NULL;
+        last_id := last_id + 5000;
+        COMMIT;
+    END LOOP;
+END
+$$;
+
+DROP INDEX CONCURRENTLY IF EXISTS requests_search_tsv_idx;
+CREATE INDEX CONCURRENTLY requests_search_tsv_idx ON requests USING gin (search_tsv);
+
+-- /search в spec-bot ищет только среди открытых заявок — их немного,
+-- и индекс по ним не растёт вместе с архивом
+DROP INDEX CONCURRENTLY IF EXISTS requests_open_search_tsv_idx;
+CREATE INDEX CONCURRENTLY requests_open_search_tsv_idx ON requests USING gin (search_tsv)
+    WHERE status IN ('PENDING', 'RESEND') AND claimed_by_id IS NULL;
+
+-- migrate: requires pg_trgm
+DROP INDEX CONCURRENTLY IF EXISTS requests_city_trgm_idx;
+-- migrate: requires pg_trgm
+CREATE INDEX CONCURRENTLY requests_city_trgm_idx ON requests USING gin (city gin_trgm_ops);
+
+-- migrate: requires pg_trgm
+DROP INDEX CONCURRENTLY IF EXISTS requests_name_trgm_idx;
+-- migrate: requires pg_trgm
+CREATE INDEX CONCURRENTLY requests_name_trgm_idx ON requests USING gin (name gin_trgm_ops);
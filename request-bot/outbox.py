@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+from typing import Any, Callable
+
+from aiogram import Bot
+from aiogram.methods import SendMessage
+from dotenv import load_dotenv
+
+from db import complete_outbox, lease_outbox, renew_outbox, retry_outbox
+from send_queue import PRIORITY_CHANNEL, SendQueue
+
+load_dotenv()
+
+# сколько заданий забираем за раз
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+# как часто заглядываем в таблицу, если нас не будили
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+# сколько задание числится за воркером; после — его заберёт кто-то другой.
+# Пока пост ждёт в SendQueue, аренда продлевается каждые OUTBOX_LEASE / 3 с
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "120"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "600"))
+# после публикации ставить заявку в рассылку специалистам в ЛС (spec-bot, fanout.py)
+FANOUT_NEW_REQUESTS = os.getenv("FANOUT_NEW_REQUESTS", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxPublisher:
+    """
+    Фоновая публикация заявок в каналы из таблицы channel_outbox.
+
+    final_send только пишет заявку и задание (одной транзакцией) и будит
+    воркер через wake(). Воркер забирает задания пачками, отправляет посты
+    через SendQueue, сохраняет message_id и удаляет задание; при ошибке
+    задание откладывается с экспоненциальным backoff.
+    С fanout вместе с message_id ставится задание рассылки специалистам.
+    Посты одного канала ждут в SendQueue дольше аренды (20 постов/мин),
+    поэтому аренда ещё не отправленных заданий продлевается, пока воркер жив.
+    Доставка «хотя бы один раз»: если процесс упадёт между отправкой поста
+    и записью message_id, пост уйдёт повторно; повторное завершение
+    задания ничего не меняет.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        send_queue: SendQueue,
+        build_message: Callable[[dict], SendMessage],
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        lease: float = OUTBOX_LEASE,
+        max_backoff: float = OUTBOX_MAX_BACKOFF,
+        fanout: bool = FANOUT_NEW_REQUESTS,
+    ):
+        self._bot = bot
+        self._send_queue = send_queue
+        self._build_message = build_message
+        self._batch_size = batch_size
+        self._poll_interval = poll_interval
+        self._lease = lease
+        self._max_backoff = max_backoff
+        self._fanout = fanout
+
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+        self.published = 0
+        self.failed = 0
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _publish(self, job: dict, pending: dict[int, dict]):
+        try:
+            msg = await self._send_queue.send(
+                self._bot, self._build_message(job), PRIORITY_CHANNEL
+            )
+        except Exception as e:
+            self.failed += 1
+            delay = min(2 ** job["attempts"], self._max_backoff)
+            logger.warning(
+                "Outbox: request %s not published (attempt %s), retry in %ss: %s",
+                job["request_id"], job["attempts"], delay, e,
+            )
+            await retry_outbox(job["id"], delay, repr(e))
+            return
+        finally:
+            pending.pop(job["id"], None)
+
+        if await complete_outbox(job["id"], job["request_id"], msg.message_id, job["channel_id"], self._fanout):
+            self.published += 1
+        else:
+            logger.warning("Outbox: job %s of request %s was already completed", job["id"], job["request_id"])
+
+    async def _keep_leased(self, pending: dict[int, dict]):
+        while True:
+            await asyncio.sleep(self._lease / 3)
+            if not pending:
+                continue
+            try:
+                renewed = await renew_outbox(list(pending.values()), self._lease)
+            except Exception as e:
+                logger.warning("Outbox: lease not renewed: %s", e)
+                continue
+            if renewed < len(pending):
+                logger.warning("Outbox: %s jobs lost their lease while queued", len(pending) - renewed)
+
+    async def _drain(self) -> int:
+        jobs = await lease_outbox(self._batch_size, self._lease)
+        if not jobs:
+            return 0
+        # ещё не отправленные задания: их аренду продлевает _keep_leased
+        pending = {job["id"]: job for job in jobs}
+        keeper = asyncio.create_task(self._keep_leased(pending))
+        try:
+            # посты разных каналов идут параллельно, лимиты держит SendQueue
+            await asyncio.gather(*(self._publish(job, pending) for job in jobs))
+        finally:
+            keeper.cancel()
+            try:
+                await keeper
+            except asyncio.CancelledError:
+                pass
+        return len(jobs)
+
+    async def _run_forever(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                if await self._drain() == self._batch_size:
+                    continue  # забрали полную пачку — возможно, есть ещё
+            except Exception:
+                logger.exception("Outbox: drain failed")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict[str, Any]:
+        return {"published": self.published, "failed": self.failed}
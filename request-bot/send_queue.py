@@ -0,0 +1,340 @@
+import asyncio
+import bisect
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.methods import TelegramMethod
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Чем меньше число, тем раньше уходит запрос
+PRIORITY_USER = 0      # ответы и личные сообщения пользователям
+PRIORITY_CHANNEL = 10  # посты и правки карточек в каналах
+PRIORITY_BROADCAST = 20  # рассылка новых заявок специалистам
+
+# Лимиты Telegram: ~30 сообщений/с на бота, ~1/с в личный чат, ~20/мин в группу/канал
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHANNEL_RATE = float(os.getenv("SEND_CHANNEL_RATE", str(20 / 60)))
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "4"))
+SEND_MAX_ATTEMPTS = int(os.getenv("SEND_MAX_ATTEMPTS", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+class SendQueueClosed(Exception):
+    """Очередь закрыта раньше, чем запрос успели отправить."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self) -> float:
+        """Забирает токен и возвращает 0 либо сколько секунд ждать до следующего."""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> float:
+        """Забирает токен в долг и возвращает, сколько секунд подождать перед отправкой."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate) - 1
+        self.updated = now
+        delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(delay, self.blocked_until - now)
+
+    def wait(self) -> float:
+        """Сколько секунд до следующего токена — не забирая его."""
+        now = time.monotonic()
+        tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        delay = (1 - tokens) / self.rate if tokens < 1 else 0.0
+        return max(delay, self.blocked_until - now)
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def idle(self) -> bool:
+        now = time.monotonic()
+        return now >= self.blocked_until and (
+            self.tokens + (now - self.updated) * self.rate >= self.burst
+        )
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    bot: Bot = field(compare=False)
+    method: TelegramMethod = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False, default_factory=time.monotonic)
+    attempts: int = field(compare=False, default=0)
+    # очередь чата уже пропустила задание: ждать в ней второй раз не нужно
+    released: bool = field(compare=False, default=False)
+
+
+def _is_channel(chat_id: Any) -> bool:
+    if isinstance(chat_id, int):
+        return chat_id < 0
+    return isinstance(chat_id, str) and chat_id.startswith(("-", "@"))
+
+
+class SendQueue:
+    """
+    Общая очередь исходящих вызовов Bot API.
+
+    - глобальный лимит на бота и отдельный на каждый чат (для каналов строже);
+    - запросы с меньшим priority уходят раньше;
+    - чат, упёршийся в лимит, получает свою FIFO-очередь: задания ждут в ней
+      по порядку, и один таймер выпускает их по одному, когда есть токен;
+    - на 429 чат замораживается на retry_after, запрос повторяется;
+      сетевые ошибки и 5xx повторяются с backoff, остальные ошибки
+      сразу пробрасываются вызывающему;
+    - close() досылает очередь до таймаута, а всем, кто ещё ждёт send(),
+      отдаёт SendQueueClosed — никто не зависает на остановке.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = SEND_GLOBAL_RATE,
+        chat_rate: float = SEND_CHAT_RATE,
+        channel_rate: float = SEND_CHANNEL_RATE,
+        workers: int = SEND_WORKERS,
+        max_attempts: int = SEND_MAX_ATTEMPTS,
+    ):
+        self._global_rate = global_rate
+        self._chat_rate = chat_rate
+        self._channel_rate = channel_rate
+        self._workers_count = workers
+        self._max_attempts = max_attempts
+
+        self._queue: asyncio.PriorityQueue[_Job] | None = None
+        self._workers: list[asyncio.Task] = []
+        self._seq = itertools.count()
+        self._global: dict[int, TokenBucket] = {}
+        self._chats: dict[tuple[int, Any], TokenBucket] = {}
+        # отложенные до повтора (backoff): seq -> (таймер, задание)
+        self._delayed: dict[int, tuple[asyncio.TimerHandle, _Job]] = {}
+        # чаты, упёршиеся в лимит: задания в порядке seq и таймер, выпускающий голову
+        self._lines: dict[tuple[int, Any], deque[_Job]] = {}
+        self._line_timers: dict[tuple[int, Any], asyncio.TimerHandle] = {}
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    # ---------------------------
+    #  Публичное API
+    # ---------------------------
+    async def send(self, bot: Bot, method: TelegramMethod, priority: int = PRIORITY_USER) -> Any:
+        """Ставит вызов в очередь и ждёт его результат."""
+        self._ensure_started()
+        job = _Job(priority, next(self._seq), bot, method, asyncio.get_running_loop().create_future())
+        self._queue.put_nowait(job)
+        return await job.future
+
+    def stats(self) -> dict:
+        return {
+            "depth": (self._queue.qsize() if self._queue else 0) + len(self._delayed)
+            + sum(len(line) for line in self._lines.values()),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "avg_wait": self.total_wait / self.sent if self.sent else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    async def close(self, timeout: float = 10):
+        # даём очереди дослать то, что уже в ней
+        deadline = time.monotonic() + timeout
+        while self._queue is not None and (self._queue.qsize() or self._delayed or self._lines):
+            if time.monotonic() > deadline:
+                break
+            await asyncio.sleep(0.1)
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        # что не успели отправить — отказ, иначе send() ждал бы вечно
+        pending = []
+        for handle, job in self._delayed.values():
+            handle.cancel()
+            pending.append(job)
+        self._delayed.clear()
+        for handle in self._line_timers.values():
+            handle.cancel()
+        self._line_timers.clear()
+        for line in self._lines.values():
+            pending.extend(line)
+        self._lines.clear()
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for job in pending:
+            self._fail(job, SendQueueClosed(f"{type(job.method).__name__} not sent: send queue closed"))
+
+    # ---------------------------
+    #  Внутреннее
+    # ---------------------------
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker()) for _ in range(self._workers_count)
+            ]
+
+    def _chat_bucket(self, bot: Bot, chat_id: Any) -> TokenBucket:
+        key = (bot.id, chat_id)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if len(self._chats) > 10_000:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle()}
+            rate = self._channel_rate if _is_channel(chat_id) else self._chat_rate
+            bucket = self._chats[key] = TokenBucket(rate)
+        return bucket
+
+    def _global_bucket(self, bot: Bot) -> TokenBucket:
+        bucket = self._global.get(bot.id)
+        if bucket is None:
+            bucket = self._global[bot.id] = TokenBucket(self._global_rate, burst=self._global_rate)
+        return bucket
+
+    def _requeue_later(self, job: _Job, delay: float):
+        def put():
+            del self._delayed[job.seq]
+            self._queue.put_nowait(job)
+
+        self._delayed[job.seq] = (asyncio.get_running_loop().call_later(delay, put), job)
+
+    def _wait_in_line(self, key: tuple[int, Any], job: _Job, delay: float):
+        """Ставит задание в очередь чата на его место по seq и заводит таймер головы."""
+        job.released = False
+        bisect.insort(self._lines.setdefault(key, deque()), job, key=lambda j: j.seq)
+        if key not in self._line_timers:
+            self._line_timers[key] = asyncio.get_running_loop().call_later(delay, self._release, key)
+
+    def _release(self, key: tuple[int, Any]):
+        # голова уходит в общую очередь; следующий таймер заведёт _advance,
+        # когда она заберёт токен чата
+        del self._line_timers[key]
+        line = self._lines.get(key)
+        if line:
+            job = line.popleft()
+            job.released = True
+            self._queue.put_nowait(job)
+
+    def _advance(self, key: tuple[int, Any], bucket: TokenBucket):
+        """Голова очереди чата ушла — следующий выходит, когда у чата будет токен."""
+        line = self._lines.get(key)
+        if line is None or key in self._line_timers:
+            return
+        if not line:
+            del self._lines[key]
+            return
+        self._line_timers[key] = asyncio.get_running_loop().call_later(bucket.wait(), self._release, key)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+
+            chat_id = getattr(job.method, "chat_id", None)
+            key = (job.bot.id, chat_id)
+            chat_bucket = self._chat_bucket(job.bot, chat_id) if chat_id is not None else None
+
+            if job.future.done():  # вызывающий уже не ждёт
+                if chat_bucket is not None and job.released:
+                    self._advance(key, chat_bucket)
+                continue
+
+            if chat_bucket is not None:
+                # у чата уже есть очередь — встаём в неё, а не обгоняем
+                if key in self._lines and not job.released:
+                    self._wait_in_line(key, job, chat_bucket.wait())
+                    continue
+                delay = chat_bucket.reserve()
+                if delay > 0:
+                    self._wait_in_line(key, job, delay)
+                    continue
+                if job.released:
+                    job.released = False
+                    self._advance(key, chat_bucket)
+
+            try:
+                delay = self._global_bucket(job.bot).take()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                await self._execute(job, key, chat_bucket)
+            except asyncio.CancelledError:
+                # close() остановил воркер посреди запроса
+                self._fail(job, SendQueueClosed(f"{type(job.method).__name__} interrupted: send queue closed"))
+                raise
+
+    async def _execute(self, job: _Job, key: tuple[int, Any], chat_bucket: TokenBucket | None):
+        job.attempts += 1
+        try:
+            result = await job.bot(job.method)
+        except TelegramRetryAfter as e:
+            if chat_bucket is None:
+                return self._retry_or_fail(job, e, e.retry_after)
+            # чат заморожен: повтор ждёт в очереди чата на своём месте
+            chat_bucket.block(e.retry_after)
+            if self._retry_or_fail(job, e, e.retry_after, requeue=False):
+                self._wait_in_line(key, job, e.retry_after)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            # после backoff задание сразу пробует токен чата, без повторной очереди
+            job.released = chat_bucket is not None
+            self._retry_or_fail(job, e, min(2 ** job.attempts, 30))
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            waited = time.monotonic() - job.enqueued_at
+            self.sent += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def _retry_or_fail(self, job: _Job, error: Exception, delay: float, requeue: bool = True) -> bool:
+        """Повторяет задание через delay или отдаёт ошибку, если попытки кончились."""
+        if job.attempts >= self._max_attempts:
+            self._fail(job, error)
+            return False
+        self.retried += 1
+        logger.warning("%s failed (%s), retry in %.1fs", type(job.method).__name__, error, delay)
+        if requeue:
+            self._requeue_later(job, delay)
+        return True
+
+    def _fail(self, job: _Job, error: Exception):
+        self.failed += 1
+        if not job.future.done():
+            job.future.set_exception(error)
@@ -1,10 +1,81 @@
+import aiogram
 from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
 import os
+from typing import Any
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Настройки общего пула HTTP-соединений к api.telegram.org
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+# Свой адрес Bot API (local bot api server, фейковый API бенчмарка); пусто — api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+TOKEN_ENV = {
+    "request": "REQUEST_BOT_TOKEN",
+    "spec": "SPEC_BOT_TOKEN",
+}
+
+_session: AiohttpSession | None = None
+_bots: dict[str, Bot] = {}
+
+
+def _configure_connector(session: AiohttpSession, **options: Any):
+    """
+    Параметры TCPConnector, которых AiohttpSession в aiogram 3.4.1 не принимает:
+    сессия хранит аргументы коннектора в приватном _connector_init и передаёт
+    их TCPConnector при первом запросе. Если после обновления aiogram этого
+    атрибута нет, падаем при старте — иначе лимит пула молча пропал бы
+    (версия закреплена в requirements.txt).
+    """
+    connector_init = getattr(session, "_connector_init", None)
+    if not isinstance(connector_init, dict):
+        raise RuntimeError(
+            f"aiogram {aiogram.__version__}: у AiohttpSession нет _connector_init, "
+            "настройки пула HTTP_* не применить — проверьте sender.py"
+        )
+    connector_init.update(options)
+
+
+def get_session() -> AiohttpSession:
+    """
+    Одна aiohttp-сессия на процесс: все боты ходят через общий пул
+    keep-alive соединений с кэшем DNS.
+    """
+    global _session
+    if _session is None:
+        api = TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else PRODUCTION
+        _session = AiohttpSession(api=api)
+        _configure_connector(
+            _session,
+            limit=HTTP_POOL_LIMIT,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        )
+    return _session
+
 
 def get_bot_by_sender(sender: str) -> Bot:
     """
     sender = 'request' или 'spec'
+    Возвращает долгоживущий экземпляр Bot, созданный при первом обращении.
     """
-    if sender == 'spec':
-        return Bot(token=os.getenv("SPEC_BOT_TOKEN"))
-    return Bot(token=os.getenv("REQUEST_BOT_TOKEN"))  # default
+    if sender != 'spec':
+        sender = 'request'  # default
+
+    bot = _bots.get(sender)
+    if bot is None:
+        bot = _bots[sender] = Bot(token=os.getenv(TOKEN_ENV[sender]), session=get_session())
+    return bot
+
+
+async def close_bots():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+    _bots.clear()
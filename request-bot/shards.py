@@ -0,0 +1,459 @@
+"""
+Шардирование апдейтов по процессам: WORKERS=N (N > 1).
+
+Основной процесс — приёмник: забирает апдейты (getUpdates или webhook) и
+раскладывает их по N воркерам по user_id (если его нет — по chat_id).
+Апдейты одного пользователя всегда попадают в один воркер и обрабатываются
+там по порядку, так что FSM и кэши в памяти остаются корректными.
+
+Воркер — отдельный процесс (spawn), в котором заново импортируется bot.py:
+он берёт оттуда dp, bot, startup() и shutdown(). Связь — socketpair,
+по строке JSON на сообщение: приёмник → воркер — апдейт и флаг reply,
+воркер → приёмник — отчёт о нагрузке раз в WORKER_REPORT_INTERVAL
+и ответы хендлеров на апдейты с reply.
+Упавший воркер перезапускается, его очередь ждёт и уходит новому процессу.
+Апдейты, которые воркер уже взял в работу, при падении теряются — как и
+при падении однопроцессного бота.
+
+В режиме webhook приёмник, как LimitedRequestHandler, ждёт ответ хендлера
+до WEBHOOK_REPLY_TIMEOUT: воркер присылает метод Bot API, который вернул
+хендлер (`return call.answer(...)`), и приёмник отдаёт его в теле ответа
+на webhook. Если ответ пришёл позже, метод вызывает сам приёмник; метод
+с файлами воркер вызывает сам — в JSON файл не передать.
+
+Лимиты SendQueue делятся на N: каждый воркер шлёт сам. Это касается и лимита
+на чат: в личку специалиста пишет и воркер его апдейтов, и тот, что разослал
+заявку или отметил её взятой.
+Пачка outbox (OUTBOX_BATCH_SIZE) делится на N вместе с лимитом каналов:
+воркер отправляет свою пачку за то же время, что один процесс — целую,
+и посты не ждут в SendQueue дольше OUTBOX_LEASE.
+/metrics воркера i — на METRICS_PORT + 1 + i, приёмника — на METRICS_PORT.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+from contextlib import suppress
+from typing import Any
+
+import aiogram.methods
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import Default
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+from aiogram.methods import TelegramMethod
+from aiohttp import MultipartWriter, web
+from dotenv import load_dotenv
+from pydantic_core import to_jsonable_python
+
+from metrics import (
+    METRICS_PORT,
+    WORKER_BACKLOG,
+    WORKER_IN_FLIGHT,
+    WORKER_PROCESSED,
+    WORKER_RESTARTS,
+    start_metrics_server,
+)
+from recorder import RECORD_UPDATES
+from send_queue import SEND_CHANNEL_RATE, SEND_CHAT_RATE, SEND_GLOBAL_RATE
+from webhook import (
+    WEBHOOK_BASE_URL,
+    WEBHOOK_HOST,
+    WEBHOOK_MAX_TASKS,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_REPLY_TIMEOUT,
+    require_webhook_secret,
+    secret_matches,
+)
+
+load_dotenv()
+
+# 1 — всё в одном процессе, как раньше
+WORKERS = int(os.getenv("WORKERS", "1"))
+# сколько апдейтов воркер обрабатывает одновременно
+WORKER_MAX_TASKS = int(os.getenv("WORKER_MAX_TASKS", "100"))
+WORKER_REPORT_INTERVAL = float(os.getenv("WORKER_REPORT_INTERVAL", "5"))
+WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", "1"))
+# очередь приёмника на воркер; когда полна, приёмник перестаёт забирать апдейты
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "10"))
+# как в outbox.py (его нет в spec-bot, поэтому значение читается здесь)
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+
+# один апдейт — одна строка; с медиа и длинным текстом бывает больше 64 КБ
+_LINE_LIMIT = 4 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def shard_key(update: dict) -> int:
+    """user_id отправителя, иначе chat_id, иначе update_id."""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return update.get("update_id", 0)
+
+
+def _worker_env(index: int, workers: int) -> dict[str, str]:
+    env = {
+        "WORKERS": "1",
+        "SEND_GLOBAL_RATE": str(SEND_GLOBAL_RATE / workers),
+        "SEND_CHAT_RATE": str(SEND_CHAT_RATE / workers),
+        "SEND_CHANNEL_RATE": str(SEND_CHANNEL_RATE / workers),
+        "OUTBOX_BATCH_SIZE": str(max(1, OUTBOX_BATCH_SIZE // workers)),
+        "METRICS_PORT": str(METRICS_PORT + 1 + index) if METRICS_PORT else "0",
+    }
+    if RECORD_UPDATES:
+        # свой файл на воркер: bench/replay.py принимает несколько файлов
+        env["RECORD_UPDATES"] = f"{RECORD_UPDATES}.{index}"
+    return env
+
+
+def dump_method(bot: Bot, method: TelegramMethod) -> dict[str, Any] | None:
+    """
+    Метод Bot API → JSON для приёмника. Default-значения (parse_mode и т. п.)
+    подставляются из настроек bot. None, если метод шлёт файл.
+    """
+    def fallback(value: Any) -> Any:
+        if isinstance(value, Default):
+            return bot.default[value.name]
+        raise TypeError(f"{type(value).__name__} не сериализуется в JSON")
+
+    try:
+        params = to_jsonable_python(method.model_dump(warnings=False, exclude_none=True), fallback=fallback)
+    except TypeError:
+        return None
+    return {"type": type(method).__name__, "params": params}
+
+
+def load_method(dumped: dict[str, Any]) -> TelegramMethod:
+    return getattr(aiogram.methods, dumped["type"]).model_validate(dumped["params"])
+
+
+def reply_body(bot: Bot, method: TelegramMethod | None) -> MultipartWriter:
+    """Тело webhook-ответа, как у SimpleRequestHandler (метод без файлов)."""
+    writer = MultipartWriter("form-data")
+    if method is None:
+        return writer
+    payload = writer.append(method.__api_method__)
+    payload.set_content_disposition("form-data", name="method")
+    for key, value in method.model_dump(warnings=False).items():
+        value = bot.session.prepare_value(value, bot=bot, files={})
+        if not value:
+            continue
+        payload = writer.append(value)
+        payload.set_content_disposition("form-data", name=key)
+    return writer
+
+
+# ---------------------------
+#  Воркер
+# ---------------------------
+def _worker_entry(index: int, sock: socket.socket):
+    # Ctrl+C получает вся группа процессов; воркер останавливает приёмник, закрывая сокет
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker(index, sock))
+
+
+async def _worker(index: int, sock: socket.socket):
+    main = sys.modules["__main__"]
+    dp: Dispatcher = main.dp
+    bot: Bot = main.bot
+
+    await main.startup()
+    metrics_runner = await start_metrics_server()
+    reader, writer = await asyncio.open_connection(sock=sock, limit=_LINE_LIMIT)
+
+    slots = asyncio.Semaphore(WORKER_MAX_TASKS)
+    chains: dict[int, asyncio.Task] = {}
+    tasks: set[asyncio.Task] = set()
+    counters = {"processed": 0, "errors": 0}
+
+    async def process(update: dict, reply: bool, previous: asyncio.Task | None):
+        method = None
+        try:
+            if previous is not None:
+                await asyncio.wait({previous})
+            result = await dp.feed_raw_update(bot, update)
+            if isinstance(result, TelegramMethod):
+                method = dump_method(bot, result) if reply else None
+                if method is None:
+                    await dp.silent_call_request(bot, result)
+        except Exception:
+            counters["errors"] += 1
+            logger.exception("Worker %s failed to process update %s", index, update.get("update_id"))
+        finally:
+            if reply:
+                # приёмник ждёт ответа на этот апдейт, даже если метода нет
+                message = {"reply": update.get("update_id"), "method": method}
+                with suppress(ConnectionError):
+                    writer.write(json.dumps(message, ensure_ascii=False).encode() + b"\n")
+            counters["processed"] += 1
+            slots.release()
+
+    def forget(key: int, task: asyncio.Task):
+        tasks.discard(task)
+        if chains.get(key) is task:
+            del chains[key]
+
+    async def report():
+        while True:
+            writer.write(json.dumps({"in_flight": len(tasks), **counters}).encode() + b"\n")
+            await writer.drain()
+            await asyncio.sleep(WORKER_REPORT_INTERVAL)
+
+    reporter = asyncio.create_task(report())
+    try:
+        while line := await reader.readline():
+            message = json.loads(line)
+            update = message["update"]
+            key = shard_key(update)
+            await slots.acquire()
+            task = asyncio.create_task(process(update, message["reply"], chains.get(key)))
+            chains[key] = task
+            tasks.add(task)
+            task.add_done_callback(lambda t, k=key: forget(k, t))
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        reporter.cancel()
+        with suppress(asyncio.CancelledError, ConnectionError):
+            await reporter
+        writer.close()
+        await main.shutdown()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
+# ---------------------------
+#  Приёмник
+# ---------------------------
+class ShardedRunner:
+    """Приёмник апдейтов и супервизор воркеров."""
+
+    def __init__(self, dp: Dispatcher, bot: Bot, workers: int = WORKERS):
+        self.dp = dp
+        self.bot = bot
+        self.workers = workers
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [asyncio.Queue(WORKER_QUEUE_SIZE) for _ in range(workers)]
+        self._writers: list[asyncio.StreamWriter | None] = [None] * workers
+        self._ready = [asyncio.Event() for _ in range(workers)]
+        # первый отчёт воркер шлёт после startup() — тогда он готов к апдейтам
+        self._started = [asyncio.Event() for _ in range(workers)]
+        self._processes: list[multiprocessing.Process | None] = [None] * workers
+        self._load: list[dict[str, Any]] = [{} for _ in range(workers)]
+        # update_id → ответ хендлера, который ждёт _handle_webhook
+        self._replies: dict[int, asyncio.Future] = {}
+        # методы, чей ответ пришёл после WEBHOOK_REPLY_TIMEOUT
+        self._calls: set[asyncio.Task] = set()
+        self._stopping = False
+        self._secret = ""
+        for index, queue in enumerate(self._queues):
+            WORKER_BACKLOG.labels(str(index)).set_function(queue.qsize)
+
+    async def route(self, update: dict, reply: bool = False):
+        await self._queues[shard_key(update) % self.workers].put((update, reply))
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [
+            {"worker": i, "backlog": q.qsize(), "alive": bool(p and p.is_alive()), **load}
+            for i, (q, p, load) in enumerate(zip(self._queues, self._processes, self._load))
+        ]
+
+    # --- воркеры ---
+    def _spawn(self, index: int) -> tuple[multiprocessing.Process, socket.socket]:
+        parent_sock, child_sock = socket.socketpair()
+        saved = dict(os.environ)
+        # окружение процесс получает в момент запуска: bot.py читает его при импорте
+        os.environ.update(_worker_env(index, self.workers))
+        try:
+            process = self._context.Process(
+                target=_worker_entry, args=(index, child_sock), name=f"worker-{index}"
+            )
+            process.start()
+        finally:
+            os.environ.clear()
+            os.environ.update(saved)
+            child_sock.close()
+        return process, parent_sock
+
+    async def _supervise(self, index: int):
+        while not self._stopping:
+            process, sock = self._spawn(index)
+            self._processes[index] = process
+            reader, writer = await asyncio.open_connection(sock=sock, limit=_LINE_LIMIT)
+            self._writers[index] = writer
+            self._ready[index].set()
+            processed = 0
+            try:
+                # отчёты идут до тех пор, пока воркер жив; EOF или RST — воркер завершился
+                while line := await reader.readline():
+                    load = json.loads(line)
+                    if "reply" in load:  # не отчёт, а ответ хендлера
+                        self._on_reply(load["reply"], load["method"])
+                        continue
+                    WORKER_PROCESSED.labels(str(index)).inc(max(0, load["processed"] - processed))
+                    WORKER_IN_FLIGHT.labels(str(index)).set(load["in_flight"])
+                    processed = load["processed"]
+                    self._load[index] = load
+                    self._started[index].set()
+            except (ConnectionError, ValueError):
+                pass
+            finally:
+                self._ready[index].clear()
+                self._started[index].clear()
+                self._writers[index] = None
+                writer.close()
+                await asyncio.to_thread(process.join)
+            if not self._stopping:
+                WORKER_RESTARTS.labels(str(index)).inc()
+                logger.error("Worker %s exited with code %s, restarting", index, process.exitcode)
+                await asyncio.sleep(WORKER_RESTART_DELAY)
+
+    def _on_reply(self, update_id: int, dumped: dict[str, Any] | None):
+        method = load_method(dumped) if dumped is not None else None
+        reply = self._replies.pop(update_id, None)
+        if reply is not None and not reply.done():
+            reply.set_result(method)
+        elif method is not None:
+            # _handle_webhook уже ответил Telegram пустым телом
+            call = asyncio.create_task(self.dp.silent_call_request(bot=self.bot, result=method))
+            self._calls.add(call)
+            call.add_done_callback(self._calls.discard)
+
+    async def _feed(self, index: int):
+        queue = self._queues[index]
+        while True:
+            update, reply = await queue.get()
+            message = {"update": update, "reply": reply}
+            line = json.dumps(message, ensure_ascii=False).encode() + b"\n"
+            while True:
+                await self._ready[index].wait()
+                writer = self._writers[index]
+                try:
+                    writer.write(line)
+                    await writer.drain()
+                    break
+                except (ConnectionError, AttributeError):
+                    # воркер упал — ждём перезапуска и отдаём апдейт новому
+                    await asyncio.sleep(WORKER_RESTART_DELAY)
+            queue.task_done()
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(max(WORKER_REPORT_INTERVAL, 60))
+            logger.info("Workers: %s", self.stats())
+
+    # --- приём апдейтов ---
+    async def _poll(self):
+        await self.bot.delete_webhook()
+        allowed = self.dp.resolve_used_update_types()
+        offset = None
+        while True:
+            try:
+                updates = await self.bot.get_updates(
+                    offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed
+                )
+            except (TelegramNetworkError, TelegramServerError):
+                logger.exception("getUpdates failed")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                await self.route(update.model_dump(mode="json", exclude_none=True, by_alias=True))
+
+    async def _handle_webhook(self, request: web.Request) -> web.Response:
+        if not secret_matches(request, self._secret):
+            return web.Response(status=401)
+        update = await request.json()
+        update_id = update.get("update_id")
+        reply = self._replies[update_id] = asyncio.get_running_loop().create_future()
+        method = None
+        try:
+            await self.route(update, reply=True)
+            method = await asyncio.wait_for(reply, WEBHOOK_REPLY_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # опоздавший ответ _on_reply отправит сам
+            self._replies.pop(update_id, None)
+        return web.Response(body=reply_body(self.bot, method))
+
+    async def _serve_webhook(self) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, self._handle_webhook)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        await self.bot.set_webhook(
+            url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=self._secret,
+            allowed_updates=self.dp.resolve_used_update_types(),
+            max_connections=min(WEBHOOK_MAX_TASKS, 100),
+        )
+        return runner
+
+    async def run(self, mode: str):
+        """Работает до SIGINT/SIGTERM, затем даёт воркерам доделать начатое."""
+        if mode == "webhook":
+            self._secret = require_webhook_secret()  # до запуска воркеров
+        supervisors = [asyncio.create_task(self._supervise(i)) for i in range(self.workers)]
+        feeders = [asyncio.create_task(self._feed(i)) for i in range(self.workers)]
+        reporter = asyncio.create_task(self._report())
+        metrics_runner = await start_metrics_server()
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(sig, stop.set)
+
+        webhook_runner = None
+        poller = None
+        try:
+            await asyncio.gather(*(started.wait() for started in self._started))
+            if mode == "webhook":
+                webhook_runner = await self._serve_webhook()
+            else:
+                poller = asyncio.create_task(self._poll())
+            await stop.wait()
+        finally:
+            if poller is not None:
+                poller.cancel()
+                with suppress(asyncio.CancelledError):
+                    await poller
+            if webhook_runner is not None:
+                await webhook_runner.cleanup()
+            # то, что уже принято, отдаём воркерам и только потом закрываем сокеты
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    asyncio.gather(*(q.join() for q in self._queues)), WORKER_RESTART_DELAY * 10
+                )
+            self._stopping = True
+            for task in feeders + [reporter]:
+                task.cancel()
+            for writer in self._writers:
+                if writer is not None and writer.can_write_eof():
+                    writer.write_eof()
+            await asyncio.gather(*supervisors, return_exceptions=True)
+            if self._calls:
+                await asyncio.gather(*self._calls, return_exceptions=True)
+            await self.bot.session.close()
+            if metrics_runner is not None:
+                await metrics_runner.cleanup()
+
+
+async def run_sharded(dp: Dispatcher, bot: Bot, mode: str, workers: int = WORKERS):
+    logger.info("Starting %s workers", workers)
+    await ShardedRunner(dp, bot, workers).run(mode)
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+SPEC_CACHE_MAX_SIZE = int(os.getenv("SPEC_CACHE_MAX_SIZE", "10000"))
+SPEC_CACHE_TTL = float(os.getenv("SPEC_CACHE_TTL", "300"))
+# пауза перед переподключением LISTEN удваивается до этого значения
+SPEC_CACHE_LISTEN_RETRY_MAX = float(os.getenv("SPEC_CACHE_LISTEN_RETRY_MAX", "30"))
+
+# Канал, в который триггер на таблице specialists шлёт tg_id изменённой записи
+NOTIFY_CHANNEL = "specialists_changed"
+
+# (is_approved, specializations) или None, если специалиста нет в базе
+SpecialistInfo = tuple[bool, list[str]] | None
+
+logger = logging.getLogger(__name__)
+
+
+class SpecialistsCache:
+    """
+    In-process кэш tg_id -> (одобрен ли, специализации).
+
+    Размер ограничен (LRU-вытеснение), каждая запись живёт не дольше ttl.
+    Основная инвалидация — через LISTEN/NOTIFY: триггер на specialists
+    присылает tg_id, и запись сразу выбрасывается из кэша.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[int], Awaitable[SpecialistInfo]],
+        max_size: int = SPEC_CACHE_MAX_SIZE,
+        ttl: float = SPEC_CACHE_TTL,
+    ):
+        self._loader = loader
+        self._max_size = max_size
+        self._ttl = ttl
+        self._items: OrderedDict[int, tuple[float, SpecialistInfo]] = OrderedDict()
+        # растёт при каждой инвалидации — чтобы не сохранить ответ загрузки,
+        # начатой до пришедшего NOTIFY
+        self._generation = 0
+        self._listener_task: asyncio.Task | None = None
+
+    async def get(self, tg_id: int) -> SpecialistInfo:
+        item = self._items.get(tg_id)
+        if item is not None:
+            expires_at, info = item
+            if expires_at > time.monotonic():
+                self._items.move_to_end(tg_id)
+                return info
+            del self._items[tg_id]
+
+        generation = self._generation
+        info = await self._loader(tg_id)
+        if generation == self._generation:
+            self._put(tg_id, info)
+        return info
+
+    async def is_approved(self, tg_id: int) -> bool:
+        info = await self.get(tg_id)
+        return bool(info and info[0])
+
+    async def exists(self, tg_id: int) -> bool:
+        return await self.get(tg_id) is not None
+
+    def invalidate(self, tg_id: int | None = None):
+        self._generation += 1
+        if tg_id is None:
+            self._items.clear()
+        else:
+            self._items.pop(tg_id, None)
+
+    def _put(self, tg_id: int, info: SpecialistInfo):
+        self._items[tg_id] = (time.monotonic() + self._ttl, info)
+        self._items.move_to_end(tg_id)
+        while len(self._items) > self._max_size:
+            self._items.popitem(last=False)
+
+    # ---------------------------
+    #  LISTEN / NOTIFY
+    # ---------------------------
+    def _on_notify(self, conn, pid, channel, payload: str):
+        try:
+            self.invalidate(int(payload))
+        except ValueError:
+            self.invalidate()
+
+    async def _listen_once(self):
+        """Одно соединение с LISTEN; возвращается, когда соединение закрылось."""
+        conn = await asyncpg.connect(DATABASE_URL)
+        closed = asyncio.Event()
+        conn.add_termination_listener(lambda _: closed.set())
+        try:
+            await conn.add_listener(NOTIFY_CHANNEL, self._on_notify)
+            # пока не слушали, могли пропустить уведомления
+            self.invalidate()
+            await closed.wait()
+        finally:
+            try:
+                await conn.close(timeout=5)
+            except Exception:
+                conn.terminate()
+
+    async def _listen_forever(self):
+        delay = 1.0
+        while True:
+            try:
+                await self._listen_once()
+                delay = 1.0
+                logger.warning("Specialists cache: LISTEN connection closed, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Specialists cache: LISTEN failed, retry in %ss: %r", delay, e)
+                delay = min(delay * 2, SPEC_CACHE_LISTEN_RETRY_MAX)
+            # без LISTEN уведомления теряются — всё, что закэшировано, под подозрением
+            self.invalidate()
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _on_listener_done(task: asyncio.Task):
+        if task.cancelled():
+            return
+        logger.error(
+            "Specialists cache: listener stopped, invalidation falls back to TTL only",
+            exc_info=task.exception(),
+        )
+
+    def start_listener(self):
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen_forever())
+            self._listener_task.add_done_callback(self._on_listener_done)
+
+    async def stop_listener(self):
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
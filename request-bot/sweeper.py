@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+from typing import Any, Callable
+
+from aiogram.methods import EditMessageText
+from dotenv import load_dotenv
+
+from db import release_stale_claims, requeue_unpublished
+from outbox import OutboxPublisher
+from send_queue import PRIORITY_CHANNEL, SendQueue
+from sender import get_bot_by_sender
+
+load_dotenv()
+
+# как часто проходимся по таблице; 0 — sweeper выключен
+SWEEP_INTERVAL = float(os.getenv("SWEEP_INTERVAL", "60"))
+# сколько заявка может висеть в CLAIMED, прежде чем вернётся в канал
+SWEEP_CLAIM_TTL = float(os.getenv("SWEEP_CLAIM_TTL", str(3 * 24 * 60 * 60)))
+# через сколько PENDING-заявка без поста в канале публикуется заново
+SWEEP_PENDING_AFTER = float(os.getenv("SWEEP_PENDING_AFTER", "600"))
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "50"))
+
+# cancel_note заявки, возвращённой sweeper'ом
+SWEEP_NOTE = "Автовозврат: заявка не выполнена вовремя"
+
+logger = logging.getLogger(__name__)
+
+
+class Sweeper:
+    """
+    Периодическая уборка заявок, застрявших без участия пользователей.
+
+    - CLAIMED дольше claim_ttl: заявка возвращается в RESEND (как при отмене
+      специалистом), карточка в канале перерисовывается с кнопкой claim;
+    - PENDING без tg_message_id дольше pending_after: заявка заново ставится
+      в channel_outbox, пост публикует OutboxPublisher.
+
+    Выборка — пачками через FOR UPDATE SKIP LOCKED, так что sweeper можно
+    запускать на нескольких репликах (и во всех воркерах WORKERS > 1) сразу.
+    Правки каналов идут через SendQueue с приоритетом канала.
+    """
+
+    def __init__(
+        self,
+        send_queue: SendQueue,
+        outbox: OutboxPublisher,
+        channels: dict[str, str | None],
+        build_card: Callable[[dict], EditMessageText],
+        interval: float = SWEEP_INTERVAL,
+        claim_ttl: float = SWEEP_CLAIM_TTL,
+        pending_after: float = SWEEP_PENDING_AFTER,
+        batch_size: int = SWEEP_BATCH_SIZE,
+    ):
+        self._send_queue = send_queue
+        self._outbox = outbox
+        self._channels = {k: v for k, v in channels.items() if v}
+        self._build_card = build_card
+        self._interval = interval
+        self._claim_ttl = claim_ttl
+        self._pending_after = pending_after
+        self._batch_size = batch_size
+        self._task: asyncio.Task | None = None
+
+        self.released = 0
+        self.republished = 0
+
+    def start(self):
+        if self._task is None and self._interval > 0:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _rerender(self, row: dict):
+        if not row["tg_chat_id"] or not row["tg_message_id"]:
+            return  # поста в канале нет — перерисовывать нечего
+        try:
+            await self._send_queue.send(
+                get_bot_by_sender(row["sent_by_bot"]), self._build_card(row), PRIORITY_CHANNEL
+            )
+        except Exception as e:
+            logger.warning("Sweeper: card of request %s not updated: %s", row["id"], e)
+
+    async def release_stale_claims(self) -> int:
+        total = 0
+        while True:
+            rows = await release_stale_claims(self._claim_ttl, self._batch_size, SWEEP_NOTE)
+            total += len(rows)
+            await asyncio.gather(*(self._rerender(row) for row in rows))
+            if len(rows) < self._batch_size:
+                break
+        if total:
+            logger.info("Sweeper: %s stale claims returned to channels", total)
+        self.released += total
+        return total
+
+    async def requeue_unpublished(self) -> int:
+        total = 0
+        while True:
+            ids = await requeue_unpublished(self._pending_after, self._batch_size, self._channels)
+            total += len(ids)
+            if ids:
+                self._outbox.wake()
+            if len(ids) < self._batch_size:
+                break
+        if total:
+            logger.info("Sweeper: %s unpublished requests queued for publishing", total)
+        self.republished += total
+        return total
+
+    async def sweep(self):
+        await self.release_stale_claims()
+        await self.requeue_unpublished()
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Sweeper: sweep failed")
+            await asyncio.sleep(self._interval)
+
+    def stats(self) -> dict[str, Any]:
+        return {"released": self.released, "republished": self.republished}
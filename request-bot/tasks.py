@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Coroutine
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# сколько побочных действий (правки каналов, ЛС, очистка чатов) выполняется одновременно
+BG_MAX_CONCURRENCY = int(os.getenv("BG_MAX_CONCURRENCY", "50"))
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTasks:
+    """
+    Группа фоновых задач для побочных эффектов хендлеров.
+
+    Хендлер принимает решение (запись в БД), сразу отвечает на callback,
+    а вызовы Bot API отдаёт сюда через spawn(). Группа:
+    - держит ссылки на задачи, чтобы их не собрал GC;
+    - ограничивает число одновременно выполняемых задач (остальные ждут слот);
+    - логирует исключения с именем задачи и считает ошибки;
+    - при остановке дожидается незавершённых задач.
+    """
+
+    def __init__(self, max_concurrency: int = BG_MAX_CONCURRENCY):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: set[asyncio.Task] = set()
+
+        self.started = 0
+        self.failed = 0
+        self.max_lag = 0.0
+
+    def spawn(self, coro: Coroutine[Any, Any, Any], name: str | None = None) -> asyncio.Task:
+        task = asyncio.create_task(self._run(coro, name or coro.__qualname__, time.monotonic()))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, coro: Coroutine[Any, Any, Any], name: str, spawned_at: float):
+        try:
+            async with self._semaphore:
+                self.started += 1
+                self.max_lag = max(self.max_lag, time.monotonic() - spawned_at)
+                return await coro
+        except asyncio.CancelledError:
+            coro.close()  # отменили, пока ждали слот — корутина так и не запускалась
+            raise
+        except Exception:
+            self.failed += 1
+            logger.exception("Background task %s failed", name)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._tasks),
+            "started": self.started,
+            "failed": self.failed,
+            "max_lag": self.max_lag,
+        }
+
+    async def close(self, timeout: float = 10):
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,170 @@
+import asyncio
+import hmac
+import logging
+import os
+import re
+import signal
+from contextlib import suppress
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# polling | webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Публичный https-адрес, на который Telegram шлёт апдейты (без пути)
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Обязателен в режиме webhook: Telegram шлёт его в X-Telegram-Bot-Api-Secret-Token,
+# апдейты без него отвергаются. 1–256 символов: A-Z, a-z, 0-9, _ и -
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# сколько апдейтов обрабатывается одновременно
+WEBHOOK_MAX_TASKS = int(os.getenv("WEBHOOK_MAX_TASKS", "100"))
+# сколько ждём хендлер, чтобы вернуть его ответ прямо в теле webhook-ответа
+WEBHOOK_REPLY_TIMEOUT = float(os.getenv("WEBHOOK_REPLY_TIMEOUT", "1.5"))
+
+logger = logging.getLogger(__name__)
+
+_SECRET_RE = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+
+def require_webhook_secret(secret: str = WEBHOOK_SECRET) -> str:
+    """
+    Проверка перед запуском webhook: без секрета endpoint принял бы
+    поддельные апдейты от кого угодно, поэтому пустой секрет — ошибка запуска.
+    """
+    if not secret:
+        raise RuntimeError("BOT_MODE=webhook: задайте WEBHOOK_SECRET, без него webhook не защищён")
+    if not _SECRET_RE.fullmatch(secret):
+        raise RuntimeError("WEBHOOK_SECRET: 1–256 символов из A-Z, a-z, 0-9, _ и -")
+    return secret
+
+
+def secret_matches(request: web.Request, secret: str) -> bool:
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    return bool(secret) and hmac.compare_digest(token.encode(), secret.encode())
+
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    """
+    Webhook-хендлер с ограничением числа одновременных апдейтов.
+
+    Если хендлер успел за reply_timeout и вернул метод Bot API
+    (например, `return call.answer(...)`), метод уходит прямо в ответе
+    на webhook — без отдельного запроса к api.telegram.org.
+    Иначе Telegram получает пустой ответ, а хендлер дорабатывает в фоне.
+    Слот семафора держится до конца хендлера: когда все слоты заняты,
+    новые запросы ждут, и Telegram сам притормаживает доставку.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret_token: str = WEBHOOK_SECRET,
+        max_tasks: int = WEBHOOK_MAX_TASKS,
+        reply_timeout: float = WEBHOOK_REPLY_TIMEOUT,
+        **data: Any,
+    ):
+        super().__init__(
+            dispatcher=dispatcher,
+            bot=bot,
+            handle_in_background=False,
+            secret_token=require_webhook_secret(secret_token),
+            **data,
+        )
+        self._semaphore = asyncio.Semaphore(max_tasks)
+        self._reply_timeout = reply_timeout
+        self._tasks: set[asyncio.Task] = set()
+
+    async def _feed(self, bot: Bot, update: Dict[str, Any]) -> Any:
+        try:
+            return await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+        except Exception:
+            logger.exception("Failed to process webhook update")
+        finally:
+            self._semaphore.release()
+
+    def _finish_in_background(self, bot: Bot, task: asyncio.Task):
+        if task.cancelled():
+            return
+        result = task.result()
+        if isinstance(result, TelegramMethod):
+            call = asyncio.create_task(self.dispatcher.silent_call_request(bot=bot, result=result))
+            self._tasks.add(call)
+            call.add_done_callback(self._tasks.discard)
+
+    async def _handle_request(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._feed(bot, update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        done, _ = await asyncio.wait({task}, timeout=self._reply_timeout)
+        result = None
+        if done:
+            result = task.result()
+        else:
+            task.add_done_callback(lambda t: self._finish_in_background(bot, t))
+
+        if not isinstance(result, TelegramMethod):
+            result = None
+        return web.Response(body=self._build_response_writer(bot=bot, result=result))
+
+    async def close(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await super().close()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, **data: Any):
+    """
+    Поднимает aiohttp-сервер с webhook-хендлером, регистрирует webhook
+    в Telegram и работает до SIGINT/SIGTERM.
+    """
+    await run_webhooks([(dp, bot, WEBHOOK_PATH)], **data)
+
+
+async def run_webhooks(targets: list[tuple[Dispatcher, Bot, str]], **data: Any):
+    """
+    То же для нескольких ботов на одном сервере (combined-bot):
+    у каждой пары (dp, bot) свой путь.
+    """
+    secret = require_webhook_secret()
+    app = web.Application()
+    for dp, bot, path in targets:
+        LimitedRequestHandler(dispatcher=dp, bot=bot, secret_token=secret, **data).register(app, path=path)
+        setup_application(app, dp, bot=bot, **data)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+
+    for dp, bot, path in targets:
+        await bot.set_webhook(
+            url=WEBHOOK_BASE_URL.rstrip("/") + path,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(WEBHOOK_MAX_TASKS, 100),
+        )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
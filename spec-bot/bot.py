@@ -1,49 +1,115 @@
 import asyncio
+import asyncpg
+import html
 import os
-from aiogram import Bot, Dispatcher, F
-from aiogram.filters import CommandStart, Command
-from aiogram.fsm.storage.memory import MemoryStorage
+from datetime import datetime
+from aiogram import Dispatcher, F
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.fsm.context import FSMContext
+from aiogram.methods import EditMessageText, SendMessage
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
 from dotenv import load_dotenv
-from sender import get_bot_by_sender
+from sender import get_bot_by_sender, get_session, close_bots
+from webhook import BOT_MODE, require_webhook_secret, run_webhook
 
 from states import SpecReg, CancelNote
 from keyboards import (
     phone_kb,
     spec_multi_kb,
-    request_action_kb
+    my_requests_kb,
+    fanout_claim_kb,
+    search_results_kb,
+)
+from specialists_cache import SpecialistsCache
+from fsm_storage import create_storage
+from migrate import migrate
+from send_queue import SendQueue, PRIORITY_CHANNEL, PRIORITY_USER
+from fanout import FanoutBroadcaster
+from tasks import BackgroundTasks
+from recorder import setup_recorder
+from throttle import setup_throttling
+from shards import WORKERS, run_sharded
+from metrics import (
+    setup_metrics,
+    start_metrics_server,
+    SEND_QUEUE_DEPTH,
+    BACKGROUND_PENDING,
 )
 from db import (
-    specialist_exists,
     save_specialist,
-    is_approved_specialist,
-    get_claimed_requests,
+    get_specialist_status,
+    get_claimed_page,
+    count_claimed_requests,
     cancel_request,
     complete_request,
     get_request_data,
-    save_cancel_note
+    save_cancel_note,
+    try_claim_request,
+    search_requests,
+    CLAIM_NOT_APPROVED,
+    CLAIM_TAKEN,
+    CLAIM_NOT_FOUND,
+    init_pool,
+    get_pool,
+    close_pool,
 )
 
 load_dotenv()
-bot = Bot(os.getenv("SPEC_BOT_TOKEN"))
-request_bot = Bot(os.getenv("REQUEST_BOT_TOKEN"))   # ДЛЯ ОБНОВЛЕНИЯ КАНАЛА!
+bot = get_bot_by_sender("spec")
+request_bot = get_bot_by_sender("request")   # ДЛЯ ОБНОВЛЕНИЯ КАНАЛА!
+
+dp = Dispatcher(storage=create_storage(get_pool))
+specialists_cache = SpecialistsCache(get_specialist_status)
+send_queue = SendQueue()
+# побочные эффекты хендлеров (правки сообщений, ЛС)
+background = BackgroundTasks()
+
+# флуд: лимиты на пользователя и хендлер, двойные тапы по кнопкам (throttle.py)
+throttling = setup_throttling(dp)
+
+# /metrics: время апдейтов и хендлеров, запросы к БД, вызовы Bot API
+setup_metrics(dp, get_session())
+SEND_QUEUE_DEPTH.labels("spec").set_function(lambda: send_queue.stats()["depth"])
+BACKGROUND_PENDING.labels("spec").set_function(lambda: background.stats()["pending"])
+
+# RECORD_UPDATES=path.jsonl.gz — запись входящих апдейтов для bench/replay.py
+recorder = setup_recorder(dp, "spec")
 
-dp = Dispatcher(storage=MemoryStorage())
 PAGE_SIZE = 5
+# длиннее обрезаем: поиск всё равно идёт по словам
+SEARCH_MAX_LENGTH = 200
 CHANNELS = {
     "ACCOUNTING": os.getenv("CHANNEL_ACCOUNTING"),
     "LAW": os.getenv("CHANNEL_LAW"),
     "EGOV": os.getenv("CHANNEL_EGOV"),
 }
 
+
+def fanout_message(job: dict, tg_id: int) -> SendMessage:
+    # без телефона: контакты клиента — только тому, кто взял заявку
+    req_id = job["request_id"]
+    return SendMessage(
+        chat_id=tg_id,
+        text=f"📩 <b>Новая заявка (ID: {req_id})</b>\n\n"
+             f"👤 Имя: {job['name']}\n"
+             f"🏙 Город: {job['city']}\n"
+             f"📝 Описание: {job['description']}\n"
+             f"📌 Категория: {job['specialization']}",
+        parse_mode="HTML",
+        reply_markup=fanout_claim_kb(req_id)
+    )
+
+
+# рассылка новых заявок в ЛС специалистам нужной специализации (fanout.py)
+fanout = FanoutBroadcaster(bot, send_queue, fanout_message)
+
 # ====================== РЕГИСТРАЦИЯ ======================
-@dp.message(CommandStart())
+@dp.message(CommandStart(), flags={"throttle": {"rate": 0.2, "burst": 3}})
 async def start(message: Message, state: FSMContext):
     tg_id = message.from_user.id
 
-    if await specialist_exists(tg_id):
+    if await specialists_cache.exists(tg_id):
         return await message.answer(
             "⚠️ Вы уже отправили заявку.\n⏳ Ожидайте подтверждения."
         )
@@ -82,13 +148,14 @@ async def toggle_spec(call: CallbackQuery, state: FSMContext):
 
     await state.update_data(specialization=selected)
     await call.message.edit_reply_markup(reply_markup=spec_multi_kb(selected))
+    return call.answer()
 
 
-@dp.callback_query(F.data == "done_specs")
+@dp.callback_query(F.data == "done_specs", flags={"throttle": {"rate": 0.2, "burst": 1}})
 async def finalize(call: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     if not data.get("specialization"):
-        return await call.answer("❗ Выберите хотя бы одну", show_alert=True)
+        return call.answer("❗ Выберите хотя бы одну", show_alert=True)
 
     tg_user = call.from_user
     username = tg_user.username or f"id{tg_user.id}"
@@ -98,21 +165,27 @@ async def finalize(call: CallbackQuery, state: FSMContext):
 
     await bot.send_message(tg_user.id, "📝 Заявка отправлена, ждите подтверждения!")
     await call.message.delete()
+    return call.answer()
 
 
 # ====================== ПАГИНАЦИЯ ЗАЯВОК ======================
-@dp.message(Command("my_requests"))
-async def my_requests(message: Message):
-    tg_id = message.from_user.id
-    if not await is_approved_specialist(tg_id):
-        return await message.answer("⛔ Вы не одобрены администратором.")
-
-    requests, total_pages = await get_claimed_requests(tg_id, 1, PAGE_SIZE)
-
-    if not requests:
-        return await message.answer("📭 Заявок пока нет.")
-
-    for r in requests:
+async def render_my_requests(tg_id: int, page: int = 1, cursor=None, backward: bool = False):
+    """Текст и клавиатура страницы заявок; (None, None), если заявок нет."""
+    rows, has_prev, has_next = await get_claimed_page(tg_id, PAGE_SIZE, cursor, backward)
+    if not rows and cursor is not None:
+        # граничную заявку закрыли или отменили — начинаем сначала
+        page = 1
+        rows, has_prev, has_next = await get_claimed_page(tg_id, PAGE_SIZE)
+    if not rows:
+        return None, None
+    if not has_prev:
+        page = 1
+
+    total = await count_claimed_requests(tg_id)
+    total_pages = max(page, (total + PAGE_SIZE - 1) // PAGE_SIZE)
+
+    parts = [f"📋 <b>Ваши заявки</b> (стр. {page} из {total_pages})"]
+    for r in rows:
         text = (
             f"🆔 <b>ID:</b> {r['id']}\n"
             f"📞 <b>Телефон:</b> {r['phone']}\n"
@@ -122,9 +195,85 @@ async def my_requests(message: Message):
         )
         if r.get("cancel_note"):
             text += f"\n❗ <b>Причина отмены:</b> {r['cancel_note']}"
+        parts.append(text)
+
+    return "\n\n".join(parts), my_requests_kb(rows, page, has_prev, has_next)
+
+
+@dp.message(Command("my_requests"), flags={"throttle": {"rate": 0.5, "burst": 3}})
+async def my_requests(message: Message):
+    tg_id = message.from_user.id
+    if not await specialists_cache.is_approved(tg_id):
+        return await message.answer("⛔ Вы не одобрены администратором.")
+
+    text, kb = await render_my_requests(tg_id)
+    if text is None:
+        return await message.answer("📭 Заявок пока нет.")
+
+    await message.answer(text, parse_mode="HTML", reply_markup=kb)
+
+
+@dp.callback_query(F.data.startswith("myreq:"))
+async def my_requests_page(call: CallbackQuery):
+    _, direction, page, req_id, claimed_at = call.data.split(":", 4)
+    cursor = (datetime.fromisoformat(claimed_at), int(req_id))
+
+    text, kb = await render_my_requests(
+        call.from_user.id, int(page), cursor, backward=direction == "prev"
+    )
+    if text is None:
+        await call.message.edit_text("📭 Заявок пока нет.")
+    else:
+        await call.message.edit_text(text, parse_mode="HTML", reply_markup=kb)
+    return call.answer()
+
+
+# ====================== ПОИСК ЗАЯВОК ======================
+async def render_search(query: str, specializations: list[str], page: int):
+    """Текст и клавиатура страницы результатов /search."""
+    rows = await search_requests(query, specializations, PAGE_SIZE + 1, (page - 1) * PAGE_SIZE)
+    has_next = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    if not rows:
+        return f"🔎 По запросу «{html.escape(query)}» открытых заявок нет.", None
+
+    parts = [f"🔎 <b>Поиск:</b> {html.escape(query)} (стр. {page})"]
+    for r in rows:
+        parts.append(
+            f"🆔 <b>ID:</b> {r['id']} · 📌 {r['specialization']}\n"
+            f"👤 {html.escape(r['name'] or '—')}, 🏙 {html.escape(r['city'] or '—')}\n"
+            f"📝 {html.escape((r['description'] or '')[:300])}"
+        )
+    return "\n\n".join(parts), search_results_kb(rows, page, page > 1, has_next)
+
+
+@dp.message(Command("search"), flags={"throttle": {"rate": 0.5, "burst": 3}})
+async def search(message: Message, command: CommandObject, state: FSMContext):
+    info = await specialists_cache.get(message.from_user.id)
+    if not info or not info[0]:
+        return await message.answer("⛔ Вы не одобрены администратором.")
 
-        await message.answer(text, parse_mode="HTML",
-                             reply_markup=request_action_kb(r["id"]))
+    query = (command.args or "").strip()[:SEARCH_MAX_LENGTH]
+    if not query:
+        return await message.answer("🔎 Что ищем? Например: /search договор аренды")
+
+    # в callback_data запрос не помещается (64 байта) — листание берёт его из FSM
+    await state.update_data(search_query=query)
+    text, kb = await render_search(query, info[1], 1)
+    await message.answer(text, parse_mode="HTML", reply_markup=kb)
+
+
+@dp.callback_query(F.data.startswith("srch:"))
+async def search_page(call: CallbackQuery, state: FSMContext):
+    page = int(call.data.split(":")[1])
+    query = (await state.get_data()).get("search_query")
+    info = await specialists_cache.get(call.from_user.id)
+    if not query or not info or not info[0]:
+        return call.answer("🔎 Поиск устарел, повторите /search", show_alert=True)
+
+    text, kb = await render_search(query, info[1], page)
+    await call.message.edit_text(text, parse_mode="HTML", reply_markup=kb)
+    return call.answer()
 
 
 # ====================== ОТМЕНА ЗАЯВКИ ======================
@@ -133,53 +282,77 @@ async def cancel_request_cb(call: CallbackQuery, state: FSMContext):
     req_id = int(call.data.split(":")[1])
     await state.update_data(req_id=req_id)
     await state.set_state(CancelNote.note)
-    await call.message.answer("📝 Укажите причину отмены (или '-' если без причины):")
+    # спиннер снимаем сразу, а вопрос о причине — это и есть ответ пользователю
+    await call.answer()
+    await send_queue.send(bot, SendMessage(
+        chat_id=call.message.chat.id,
+        text="📝 Укажите причину отмены (или '-' если без причины):"
+    ), PRIORITY_USER)
+
+
+async def return_to_channel(req_id: int, note: str):
+    req = await get_request_data(req_id)
+    # карточку ещё не опубликовали (или её удалили) — править в канале нечего
+    if not req or req["tg_message_id"] is None:
+        return
+
+    # 👇 ВАЖНО: теперь берем БОТА из БД
+    channel_bot = get_bot_by_sender(req["sent_by_bot"])
+
+    text = (
+        f"📩 <b>Заявка (ID: {req_id})</b>\n\n"
+        f"👤 Имя: {html.escape(req['name'] or '—')}\n"
+        f"🏙 {html.escape(req['city'] or '—')}\n"
+        f"📝 {html.escape(req['description'] or '')}\n"
+        f"❌ <b>Отменено специалистом</b>\n"
+    )
+    if note != "-":
+        text += f"\n⚠️ Причина: <i>{html.escape(note)}</i>\n\n"
+
+    await send_queue.send(channel_bot, EditMessageText(
+        chat_id=req["tg_chat_id"],
+        message_id=req["tg_message_id"],
+        text=text,
+        parse_mode="HTML",
+        reply_markup=InlineKeyboardMarkup(
+            inline_keyboard=[
+                [InlineKeyboardButton(text="⚒ Взять в работу", callback_data=f"claim:{req_id}")]
+            ]
+        )
+    ), PRIORITY_CHANNEL)
 
 
 @dp.message(CancelNote.note)
 async def save_cancel_note_cb(message: Message, state: FSMContext):
     data = await state.get_data()
     req_id = data["req_id"]
-    note = message.text
+    note = message.text or "-"
 
     ok = await save_cancel_note(req_id, message.from_user.id, note)
 
     if ok:
-        req = await get_request_data(req_id)
-        channel_id = req["tg_chat_id"]
-
-        # 👇 ВАЖНО: теперь берем БОТА из БД
-        bot = get_bot_by_sender(req["sent_by_bot"])
-
-        text = (
-            f"📩 <b>Заявка (ID: {req_id})</b>\n\n"
-            f"👤 Имя: {req['name']}\n"
-            f"🏙 {req['city']}\n"
-            f"📝 {req['description']}\n"
-            f"❌ <b>Отменено специалистом</b>\n"
-        )
-        if note != "-":
-            text += f"\n⚠️ Причина: <i>{note}</i>\n\n"
-
-        await bot.edit_message_text(
-            chat_id=channel_id,
-            message_id=req["tg_message_id"],
-            text=text,
-            parse_mode="HTML",
-            reply_markup=InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="⚒ Взять в работу", callback_data=f"claim:{req_id}")]
-                ]
-            )
-        )
-
-        await message.answer("🔄 Заявка отменена и возвращена в канал!")
+        # отмена уже в базе: сначала отвечаем специалисту, карточку в канале правим следом
         await state.clear()
+        await message.answer("🔄 Заявка отменена и возвращена в канал!")
+        background.spawn(return_to_channel(req_id, note), f"cancel:{req_id} channel")
     else:
         await message.answer("❌ Ошибка")
 
 
 # ====================== DONE ======================
+async def refresh_after_done(message: Message, req_id: int, tg_id: int):
+    # список заявок — одно сообщение, поэтому перерисовываем его с первой страницы
+    text, kb = await render_my_requests(tg_id)
+    done_text = f"🎉 Заявка #{req_id} отмечена как DONE"
+    await send_queue.send(bot, EditMessageText(
+        chat_id=message.chat.id,
+        message_id=message.message_id,
+        text=f"{done_text}\n\n{text}" if text else done_text,
+        parse_mode="HTML",
+        reply_markup=kb,
+    ), PRIORITY_USER)
+
+
 @dp.callback_query(F.data.startswith("done:"))
 async def done_request_cb(call: CallbackQuery):
     req_id = int(call.data.split(":")[1])
@@ -188,15 +361,117 @@ async def done_request_cb(call: CallbackQuery):
     ok = await complete_request(req_id, tg_id)
 
     if ok:
-        await call.answer("✔ Заявка выполнена!")
-        await call.message.edit_text("🎉 Заявка отмечена как DONE")
+        background.spawn(refresh_after_done(call.message, req_id, tg_id), f"done:{req_id} refresh")
+        return call.answer("✔ Заявка выполнена!")
     else:
-        await call.answer("❌ Ошибка", show_alert=True)
+        return call.answer("❌ Ошибка", show_alert=True)
+
+
+# ====================== CLAIM ИЗ ЛС ======================
+def claimed_card(req_id: int, username: str, data: dict) -> EditMessageText:
+    # та же карточка в канале, что после claim в request-bot
+    return EditMessageText(
+        text=f"📩 <b>Заявка (ID: {req_id})</b>\n\n"
+             f"👤 Имя: {data['name']}\n"
+             f"🏙 Город: {data['city']}\n"
+             f"📝 Описание: {data['description']}\n\n"
+             f"✔ Взял: @{username}",
+        chat_id=data["tg_chat_id"],
+        message_id=data["tg_message_id"],
+        parse_mode="HTML"
+    )
+
+
+def claimed_dm(req_id: int, message: Message, data: dict) -> EditMessageText:
+    return EditMessageText(
+        chat_id=message.chat.id,
+        message_id=message.message_id,
+        text=f"🛠 <b>Вы приняли заявку (ID: {req_id})</b>\n\n"
+             f"📞 Телефон: {data['phone']}\n"
+             f"👤 Имя: {data['name']}\n"
+             f"🏙 Город: {data['city']}\n"
+             f"📝 {data['description']}\n"
+             f"📌 Категория: {data['specialization']}",
+        parse_mode="HTML"
+    )
+
+
+@dp.callback_query(F.data.startswith("claim:"), flags={"throttle": {"rate": 0.5, "burst": 3}})
+async def claim_request(call: CallbackQuery):
+    req_id = int(call.data.split(":")[1])
+    tg_id = call.from_user.id
+    username = call.from_user.username or f"id{tg_id}"
+
+    if not await specialists_cache.is_approved(tg_id):
+        return call.answer("⛔ Вы не одобрены как специалист!", show_alert=True)
+
+    result, data = await try_claim_request(req_id, tg_id, username)
+
+    if result == CLAIM_NOT_APPROVED:
+        specialists_cache.invalidate(tg_id)
+        return call.answer("⛔ Вы не одобрены как специалист!", show_alert=True)
+
+    if result == CLAIM_NOT_FOUND:
+        return call.answer("❌ Заявка не найдена!", show_alert=True)
+
+    if result == CLAIM_TAKEN:
+        return call.answer("❌ Заявку уже взял другой!", show_alert=True)
+
+    if data["tg_message_id"]:
+        # пост в канале принадлежит боту, который его опубликовал
+        background.spawn(send_queue.send(
+            get_bot_by_sender(data["sent_by_bot"]), claimed_card(req_id, username, data), PRIORITY_CHANNEL
+        ), f"claim:{req_id} card")
+    background.spawn(
+        send_queue.send(bot, claimed_dm(req_id, call.message, data), PRIORITY_USER),
+        f"claim:{req_id} dm",
+    )
+    return call.answer("👌 Вы взяли заявку!")
+
+
+async def startup(pool: asyncpg.Pool | None = None):
+    """pool — общий пул combined-bot, иначе бот открывает свой."""
+    await init_pool(pool)
+    await migrate(get_pool())
+    specialists_cache.start_listener()
+    fanout.start()
+
+
+async def shutdown(shared: bool = False):
+    """shared — пул и сессию Bot делят боты combined-bot, их закрывает он после всех ботов."""
+    await fanout.stop()
+    await background.close()
+    await send_queue.close()
+    await specialists_cache.stop_listener()
+    if not shared:
+        await close_bots()
+        await close_pool()
+    if recorder is not None:
+        await recorder.close()
 
 
 async def main():
+    if BOT_MODE == "webhook":
+        require_webhook_secret()
+    if WORKERS > 1:
+        # этот процесс только принимает апдейты, хендлеры — в воркерах (shards.py)
+        print(f"SPEC-BOT started with {WORKERS} workers...")
+        await run_sharded(dp, bot, BOT_MODE)
+        return
+
+    await startup()
+    metrics_runner = await start_metrics_server()
     print("SPEC-BOT started...")
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        await shutdown()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 if __name__ == "__main__":
     asyncio.run(main())
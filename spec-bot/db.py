@@ -1,64 +1,168 @@
 import asyncpg
 import os
+import time
+from datetime import datetime
 from dotenv import load_dotenv
 
+from metrics import db_timed
+
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Параметры пула соединений
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+_pool: asyncpg.Pool | None = None
+
+
+async def init_pool(pool: asyncpg.Pool | None = None) -> asyncpg.Pool:
+    """pool — уже открытый пул другого бота того же процесса (combined-bot)."""
+    global _pool
+    if _pool is None:
+        _pool = pool or await asyncpg.create_pool(
+            DATABASE_URL,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        )
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_pool() -> asyncpg.Pool:
+    if _pool is None:
+        raise RuntimeError("DB pool is not initialized, call init_pool() first")
+    return _pool
+
+
+# SQL запросов горячего пути — константы: migrate.py --check EXPLAIN-ит
+# ровно тот текст, который выполняет бот.
+
+@db_timed
 async def specialist_exists(tg_id: int):
-    conn = await asyncpg.connect(DATABASE_URL)
-    row = await conn.fetchrow("SELECT 1 FROM specialists WHERE tg_id=$1", tg_id)
-    await conn.close()
+    row = await get_pool().fetchrow("SELECT 1 FROM specialists WHERE tg_id=$1", tg_id)
     return bool(row)
 
+@db_timed
 async def save_specialist(tg_id: int, username: str, data: dict):
-    conn = await asyncpg.connect(DATABASE_URL)
-    await conn.execute("""
+    await get_pool().execute("""
         INSERT INTO specialists (tg_id, username, name, phone, specializations)
         VALUES ($1, $2, $3, $4, $5)
     """, tg_id, username, data["name"], data["phone"], data["specialization"])
-    await conn.close()
 
-async def is_approved_specialist(tg_id: int) -> bool:
-    conn = await asyncpg.connect(DATABASE_URL)
-    row = await conn.fetchrow("SELECT is_approved FROM specialists WHERE tg_id=$1", tg_id)
-    await conn.close()
-    return bool(row and row["is_approved"])
 
+SPECIALIST_STATUS_SQL = "SELECT is_approved, specializations FROM specialists WHERE tg_id=$1"
+
+
+# Статус специалиста для кэша: (is_approved, specializations) или None
+@db_timed
+async def get_specialist_status(tg_id: int) -> tuple[bool, list[str]] | None:
+    row = await get_pool().fetchrow(SPECIALIST_STATUS_SQL, tg_id)
+    if not row:
+        return None
+    return bool(row["is_approved"]), list(row["specializations"] or [])
 
-async def get_specialist_id(tg_id: int) -> int | None:
-    conn = await asyncpg.connect(DATABASE_URL)
-    row = await conn.fetchrow("SELECT id FROM specialists WHERE tg_id=$1", tg_id)
-    await conn.close()
-    return row["id"] if row else None
 
 ACTIVE_STATUSES = ('CLAIMED', 'RESEND')
+# условие подставляется в SQL литералом — только так планировщик
+# может использовать частичный индекс requests_claimed_active_idx
+# (migrations/0004_hot_path_indexes.sql)
+ACTIVE_STATUSES_SQL = "status IN ('CLAIMED', 'RESEND')"
+
+# сколько секунд держим посчитанное число активных заявок специалиста
+CLAIMED_COUNT_TTL = float(os.getenv("CLAIMED_COUNT_TTL", "60"))
+_claimed_counts: dict[int, tuple[int, float]] = {}
+
+
+CLAIMED_COUNT_SQL = f"""
+    SELECT COUNT(*) FROM requests
+    WHERE claimed_by_id = $1 AND {ACTIVE_STATUSES_SQL}
+"""
+
 
-async def get_claimed_requests(tg_id: int, page: int, page_size: int):
-    conn = await asyncpg.connect(DATABASE_URL)
+@db_timed
+async def count_claimed_requests(tg_id: int) -> int:
+    """Число активных заявок специалиста; кэшируется на CLAIMED_COUNT_TTL секунд."""
+    now = time.monotonic()
+    cached = _claimed_counts.get(tg_id)
+    if cached and cached[1] > now:
+        return cached[0]
 
-    # считаем только активные заявки
-    total = await conn.fetchval("""
-        SELECT COUNT(*) FROM requests 
-        WHERE claimed_by_id = $1 AND status = ANY($2::text[])
-    """, tg_id, ACTIVE_STATUSES)
+    # index-only scan по requests_claimed_active_idx
+    total = await get_pool().fetchval(CLAIMED_COUNT_SQL, tg_id)
 
-    total_pages = max(1, (total + page_size - 1) // page_size)
-    offset = (page - 1) * page_size
+    if len(_claimed_counts) > 10_000:
+        _claimed_counts.clear()
+    _claimed_counts[tg_id] = (total, now + CLAIMED_COUNT_TTL)
+    return total
 
-    rows = await conn.fetch("""
-        SELECT * FROM requests
-        WHERE claimed_by_id = $1 AND status = ANY($2::text[])
-        ORDER BY claimed_at DESC
-        LIMIT $3 OFFSET $4
-    """, tg_id, ACTIVE_STATUSES, page_size, offset)
 
-    await conn.close()
-    return rows, total_pages
+def forget_claimed_count(tg_id: int):
+    _claimed_counts.pop(tg_id, None)
 
+
+CLAIMED_PAGE_FIRST_SQL = f"""
+    SELECT * FROM requests
+    WHERE claimed_by_id = $1 AND {ACTIVE_STATUSES_SQL}
+    ORDER BY claimed_at DESC, id DESC
+    LIMIT $2
+"""
+
+
+CLAIMED_PAGE_NEXT_SQL = f"""
+    SELECT * FROM requests
+    WHERE claimed_by_id = $1 AND {ACTIVE_STATUSES_SQL}
+      AND (claimed_at, id) < ($2, $3)
+    ORDER BY claimed_at DESC, id DESC
+    LIMIT $4
+"""
+
+
+CLAIMED_PAGE_PREV_SQL = f"""
+    SELECT * FROM requests
+    WHERE claimed_by_id = $1 AND {ACTIVE_STATUSES_SQL}
+      AND (claimed_at, id) > ($2, $3)
+    ORDER BY claimed_at ASC, id ASC
+    LIMIT $4
+"""
+
+
+@db_timed
+async def get_claimed_page(
+    tg_id: int,
+    page_size: int,
+    cursor: tuple[datetime, int] | None = None,
+    backward: bool = False,
+):
+    """
+    Страница активных заявок, новые сверху. Keyset-пагинация по (claimed_at, id):
+    cursor — ключ последней заявки текущей страницы (вперёд)
+    или первой (backward=True, назад).
+    Возвращает (rows, has_prev, has_next).
+    """
+    if cursor is None:
+        rows = await get_pool().fetch(CLAIMED_PAGE_FIRST_SQL, tg_id, page_size + 1)
+        return rows[:page_size], False, len(rows) > page_size
+
+    if not backward:
+        rows = await get_pool().fetch(CLAIMED_PAGE_NEXT_SQL, tg_id, cursor[0], cursor[1], page_size + 1)
+        return rows[:page_size], True, len(rows) > page_size
+
+    rows = await get_pool().fetch(CLAIMED_PAGE_PREV_SQL, tg_id, cursor[0], cursor[1], page_size + 1)
+    has_prev = len(rows) > page_size
+    return list(reversed(rows[:page_size])), has_prev, True
+
+@db_timed
 async def cancel_request(req_id: int, tg_id: int, note: str | None) -> bool:
-    conn = await asyncpg.connect(DATABASE_URL)
-    res = await conn.execute("""
+    res = await get_pool().execute("""
         UPDATE requests SET
             status='CANCELED',
             claimed_by_id=NULL,
@@ -68,38 +172,40 @@ async def cancel_request(req_id: int, tg_id: int, note: str | None) -> bool:
             canceled_at=NOW()
         WHERE id=$1 AND claimed_by_id=$2
     """, req_id, tg_id, note)
-    await conn.close()
+    forget_claimed_count(tg_id)
     return res == "UPDATE 1"
 
+@db_timed
 async def complete_request(req_id: int, tg_id: int) -> bool:
-    conn = await asyncpg.connect(DATABASE_URL)
-    res = await conn.execute("""
+    res = await get_pool().execute("""
         UPDATE requests SET
             status='DONE',
             finished_at=NOW()
         WHERE id=$1 AND claimed_by_id=$2
     """, req_id, tg_id)
-    await conn.close()
+    forget_claimed_count(tg_id)
     return res == "UPDATE 1"
 
+REQUEST_DATA_SQL = """
+    SELECT id, phone, name, city, description, specialization,
+           tg_chat_id, tg_message_id, sent_by_bot, status,
+           claimed_by_id, claimed_at, resend_at, canceled_at
+    FROM requests
+    WHERE id=$1
+"""
+
+
+@db_timed
 async def get_request_data(req_id: int) -> dict | None:
-    conn = await asyncpg.connect(DATABASE_URL)
-    row = await conn.fetchrow("""
-        SELECT id, phone, name, city, description, specialization,
-               tg_chat_id, tg_message_id, sent_by_bot, status,
-               claimed_by_id, claimed_at, resend_at, canceled_at
-        FROM requests
-        WHERE id=$1
-    """, req_id)
-    await conn.close()
+    row = await get_pool().fetchrow(REQUEST_DATA_SQL, req_id)
     return dict(row) if row else None
 
+@db_timed
 async def save_cancel_note(req_id: int, tg_id: int, note: str | None) -> bool:
     """
     Отмена заявки: сохраняем cancel_note + возвращаем в PENDING.
     """
-    conn = await asyncpg.connect(DATABASE_URL)
-    res = await conn.execute("""
+    res = await get_pool().execute("""
         UPDATE requests SET
             status='RESEND',
             resend_at=NOW(),
@@ -109,5 +215,163 @@ async def save_cancel_note(req_id: int, tg_id: int, note: str | None) -> bool:
             cancel_note=$3
         WHERE id=$1 AND claimed_by_id=$2
     """, req_id, tg_id, note)
-    await conn.close()
-    return res == "UPDATE 1"
\ No newline at end of file
+    forget_claimed_count(tg_id)
+    return res == "UPDATE 1"
+
+# ---------------------------
+#  Поиск открытых заявок (/search)
+# ---------------------------
+def _contains_pattern(text: str) -> str:
+    # подстрока для ILIKE: % и _ из запроса пользователя — обычные символы
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+SEARCH_REQUESTS_SQL = """
+    SELECT id, name, city, description, specialization, status, created_at,
+           ts_rank_cd(search_tsv, q)
+           + CASE WHEN city ILIKE $2 THEN 0.5 ELSE 0 END
+           + CASE WHEN name ILIKE $2 THEN 0.3 ELSE 0 END AS rank
+    FROM requests, websearch_to_tsquery('russian', $1) AS q
+    WHERE (search_tsv @@ q OR city ILIKE $2 OR name ILIKE $2)
+      AND status IN ('PENDING', 'RESEND')
+      AND claimed_by_id IS NULL
+      AND specialization = ANY($3::text[])
+    ORDER BY rank DESC, id DESC
+    LIMIT $4 OFFSET $5
+"""
+
+
+@db_timed
+async def search_requests(query: str, specializations: list[str], limit: int, offset: int = 0):
+    """
+    Ещё не взятые заявки специализаций specializations, подходящие под query:
+    полнотекстово по описанию (search_tsv, russian) или подстрокой в городе/имени
+    (триграммные индексы). Сначала самые релевантные, затем новые.
+    """
+    return await get_pool().fetch(
+        SEARCH_REQUESTS_SQL, query, _contains_pattern(query), specializations, limit, offset
+    )
+
+
+# ---------------------------
+#  CLAIM из ЛС (рассылка fanout.py) — тот же запрос, что в request-bot
+# ---------------------------
+CLAIM_OK = "ok"
+CLAIM_NOT_APPROVED = "not_approved"
+CLAIM_TAKEN = "taken"
+CLAIM_NOT_FOUND = "not_found"
+
+
+TRY_CLAIM_SQL = """
+    WITH spec AS (
+        SELECT is_approved FROM specialists
+        WHERE tg_id = $2
+    ), claimed AS (
+        UPDATE requests
+        SET claimed_by_id=$2,
+            claimed_by_username=$3,
+            status='CLAIMED',
+            claimed_at=NOW()
+        WHERE id=$1
+          AND claimed_by_id IS NULL
+          AND EXISTS (SELECT 1 FROM spec WHERE is_approved)
+        RETURNING id, phone, name, city, description, specialization,
+                  tg_chat_id, tg_message_id, sent_by_bot
+    )
+    SELECT COALESCE((SELECT bool_or(is_approved) FROM spec), FALSE) AS approved,
+           EXISTS (SELECT 1 FROM requests WHERE id=$1) AS found,
+           c.*
+    FROM (SELECT 1) AS one
+    LEFT JOIN claimed c ON TRUE
+"""
+
+
+@db_timed
+async def try_claim_request(req_id: int, tg_id: int, username: str) -> tuple[str, dict | None]:
+    """
+    Атомарно берёт заявку в работу: из одновременных кликов (в канале
+    и в ЛС) побеждает ровно один. Данные карточки — только при CLAIM_OK.
+    """
+    row = await get_pool().fetchrow(TRY_CLAIM_SQL, req_id, tg_id, username)
+
+    if not row["approved"]:
+        return CLAIM_NOT_APPROVED, None
+    if not row["found"]:
+        return CLAIM_NOT_FOUND, None
+    if row["id"] is None:
+        return CLAIM_TAKEN, None
+
+    forget_claimed_count(tg_id)
+    data = dict(row)
+    del data["approved"], data["found"]
+    return CLAIM_OK, data
+
+
+# ---------------------------
+#  Рассылка новых заявок специалистам (fanout.py)
+# ---------------------------
+LEASE_FANOUT_SQL = """
+    WITH picked AS (
+        SELECT request_id FROM request_fanout
+        WHERE locked_until IS NULL OR locked_until < NOW()
+        ORDER BY created_at
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    ), leased AS (
+        UPDATE request_fanout f
+        SET locked_until = NOW() + make_interval(secs => $2)
+        FROM picked
+        WHERE f.request_id = picked.request_id
+        RETURNING f.request_id, f.last_tg_id, f.sent
+    )
+    SELECT l.request_id, l.last_tg_id, l.sent,
+           r.name, r.city, r.description, r.specialization
+    FROM leased l
+    JOIN requests r ON r.id = l.request_id
+    ORDER BY l.request_id
+"""
+
+
+@db_timed
+async def lease_fanout(limit: int, lease_seconds: float) -> list[dict]:
+    """Забирает до limit заданий рассылки (SKIP LOCKED) вместе с данными заявки."""
+    rows = await get_pool().fetch(LEASE_FANOUT_SQL, limit, float(lease_seconds))
+    return [dict(r) for r in rows]
+
+
+FANOUT_RECIPIENTS_SQL = """
+    SELECT tg_id FROM specialists
+    WHERE is_approved AND specializations @> ARRAY[$2]::text[] AND tg_id > $3
+      AND EXISTS (SELECT 1 FROM requests WHERE id = $1 AND claimed_by_id IS NULL)
+    ORDER BY tg_id
+    LIMIT $4
+"""
+
+
+@db_timed
+async def get_fanout_recipients(req_id: int, specialization: str, after_tg_id: int, limit: int) -> list[int]:
+    """
+    Следующая страница одобренных специалистов с этой специализацией
+    (GIN specialists_specializations_gin), keyset по tg_id.
+    Пусто, если заявку уже взяли — рассылать дальше незачем.
+    """
+    rows = await get_pool().fetch(FANOUT_RECIPIENTS_SQL, req_id, specialization, after_tg_id, limit)
+    return [r["tg_id"] for r in rows]
+
+
+@db_timed
+async def advance_fanout(req_id: int, last_tg_id: int, sent: int, lease_seconds: float):
+    # курсор после каждой страницы + продление аренды
+    await get_pool().execute("""
+        UPDATE request_fanout
+        SET last_tg_id = $2,
+            sent = sent + $3,
+            locked_until = NOW() + make_interval(secs => $4)
+        WHERE request_id = $1
+    """, req_id, last_tg_id, sent, float(lease_seconds))
+
+
+@db_timed
+async def finish_fanout(req_id: int):
+    await get_pool().execute("DELETE FROM request_fanout WHERE request_id = $1", req_id)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+from typing import Any, Callable
+
+from aiogram import Bot
+from aiogram.methods import SendMessage
+from dotenv import load_dotenv
+
+from db import advance_fanout, finish_fanout, get_fanout_recipients, lease_fanout
+from send_queue import PRIORITY_BROADCAST, SendQueue
+
+load_dotenv()
+
+# как часто заглядываем в request_fanout; 0 — рассылка выключена
+FANOUT_POLL_INTERVAL = float(os.getenv("FANOUT_POLL_INTERVAL", "2"))
+# сколько заявок рассылаем одновременно
+FANOUT_BATCH_SIZE = int(os.getenv("FANOUT_BATCH_SIZE", "5"))
+# сколько получателей читаем из базы за раз (keyset по tg_id)
+FANOUT_PAGE_SIZE = int(os.getenv("FANOUT_PAGE_SIZE", "200"))
+# сколько сообщений одновременно ждут в SendQueue от всей рассылки
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "50"))
+# сколько задание числится за процессом; продлевается после каждой страницы
+FANOUT_LEASE = float(os.getenv("FANOUT_LEASE", "300"))
+
+logger = logging.getLogger(__name__)
+
+
+class FanoutBroadcaster:
+    """
+    Рассылка новых заявок в ЛС одобренным специалистам нужной специализации.
+
+    Задания ставит request-bot (OutboxPublisher с FANOUT_NEW_REQUESTS=1) или
+    admin-server в таблицу request_fanout вместе с публикацией в канал — ответ
+    клиенту рассылки не ждёт. Получатели читаются страницами по GIN-индексу
+    specializations, курсор (последний tg_id) сохраняется после каждой страницы,
+    так что после падения рассылка продолжается с места остановки.
+    Когда заявку берут в работу, следующая страница приходит пустой и рассылка
+    заканчивается. Сообщения идут через SendQueue с самым низким приоритетом:
+    ответы пользователям и правки каналов их обгоняют, лимиты Telegram
+    соблюдаются, а семафор ограничивает число ожидающих отправок.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        send_queue: SendQueue,
+        build_message: Callable[[dict, int], SendMessage],
+        poll_interval: float = FANOUT_POLL_INTERVAL,
+        batch_size: int = FANOUT_BATCH_SIZE,
+        page_size: int = FANOUT_PAGE_SIZE,
+        concurrency: int = FANOUT_CONCURRENCY,
+        lease: float = FANOUT_LEASE,
+    ):
+        self._bot = bot
+        self._send_queue = send_queue
+        self._build_message = build_message
+        self._poll_interval = poll_interval
+        self._batch_size = batch_size
+        self._page_size = page_size
+        self._lease = lease
+        self._slots = asyncio.Semaphore(concurrency)
+        self._task: asyncio.Task | None = None
+
+        self.sent = 0
+        self.failed = 0
+        self.finished = 0
+
+    def start(self):
+        if self._task is None and self._poll_interval > 0:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _deliver(self, job: dict, tg_id: int) -> bool:
+        async with self._slots:
+            try:
+                await self._send_queue.send(
+                    self._bot, self._build_message(job, tg_id), PRIORITY_BROADCAST
+                )
+            except Exception as e:
+                # бот заблокирован, чат не найден и т.п. — остальным всё равно шлём
+                logger.debug("Fanout: request %s not delivered to %s: %s", job["request_id"], tg_id, e)
+                self.failed += 1
+                return False
+        self.sent += 1
+        return True
+
+    async def _broadcast(self, job: dict):
+        req_id, cursor = job["request_id"], job["last_tg_id"]
+        while True:
+            recipients = await get_fanout_recipients(req_id, job["specialization"], cursor, self._page_size)
+            if recipients:
+                results = await asyncio.gather(*(self._deliver(job, tg_id) for tg_id in recipients))
+                cursor = recipients[-1]
+                await advance_fanout(req_id, cursor, sum(results), self._lease)
+            if len(recipients) < self._page_size:
+                break
+        await finish_fanout(req_id)
+        self.finished += 1
+
+    async def _drain(self) -> int:
+        jobs = await lease_fanout(self._batch_size, self._lease)
+        results = await asyncio.gather(*(self._broadcast(job) for job in jobs), return_exceptions=True)
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                # аренда истечёт, задание подхватят заново с сохранённого курсора
+                logger.warning("Fanout: request %s broadcast interrupted: %s", job["request_id"], result)
+        return len(jobs)
+
+    async def _run_forever(self):
+        while True:
+            try:
+                if await self._drain() == self._batch_size:
+                    continue  # забрали полную пачку — возможно, есть ещё
+            except Exception:
+                logger.exception("Fanout: drain failed")
+            await asyncio.sleep(self._poll_interval)
+
+    def stats(self) -> dict[str, Any]:
+        return {"sent": self.sent, "failed": self.failed, "finished": self.finished}
@@ -0,0 +1,263 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+import asyncpg
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from dotenv import load_dotenv
+
+from webhook import BOT_MODE
+
+load_dotenv()
+
+# memory | pg
+FSM_STORAGE = os.getenv("FSM_STORAGE", "pg")
+# через сколько секунд без активности брошенная анкета удаляется
+FSM_TTL = int(os.getenv("FSM_TTL", str(24 * 60 * 60)))
+# сколько секунд запись держится в памяти после последнего обращения
+FSM_MEMORY_IDLE = int(os.getenv("FSM_MEMORY_IDLE", "300"))
+# как часто изменения пачкой пишутся в базу
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0.5"))
+# кэш в памяти: auto | on | off. Кэш верен, только пока апдейты пользователя
+# приходят в один процесс. В polling это так всегда: getUpdates Telegram отдаёт
+# одному потребителю, а с WORKERS > 1 приёмник шлёт пользователя в один воркер.
+# За webhook может стоять несколько реплик, поэтому там auto читает и пишет
+# прямо в базу; on — если webhook принимает ровно один процесс.
+FSM_CACHE = os.getenv("FSM_CACHE", "auto")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Record:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    touched: float = field(default_factory=time.monotonic)
+
+
+def _key_row(key: StorageKey) -> tuple:
+    return key.bot_id, key.chat_id, key.user_id, key.thread_id or 0, key.destiny
+
+
+LOAD_SQL = """
+    SELECT state, data FROM fsm_storage
+    WHERE bot_id=$1 AND chat_id=$2 AND user_id=$3
+      AND thread_id=$4 AND destiny=$5
+      AND updated_at > NOW() - make_interval(secs => $6)
+"""
+EXPIRE_SQL = "DELETE FROM fsm_storage WHERE updated_at < NOW() - make_interval(secs => $1)"
+
+# запись без кэша: меняем только свою колонку, вторую не трогаем
+SET_STATE_SQL = """
+    INSERT INTO fsm_storage (bot_id, chat_id, user_id, thread_id, destiny, state, data, updated_at)
+    VALUES ($1, $2, $3, $4, $5, $6, '{}'::jsonb, NOW())
+    ON CONFLICT (bot_id, chat_id, user_id, thread_id, destiny)
+    DO UPDATE SET state = EXCLUDED.state, updated_at = NOW()
+"""
+SET_DATA_SQL = """
+    INSERT INTO fsm_storage (bot_id, chat_id, user_id, thread_id, destiny, state, data, updated_at)
+    VALUES ($1, $2, $3, $4, $5, NULL, $6::jsonb, NOW())
+    ON CONFLICT (bot_id, chat_id, user_id, thread_id, destiny)
+    DO UPDATE SET data = EXCLUDED.data, updated_at = NOW()
+"""
+
+
+class PgStorage(BaseStorage):
+    """
+    FSM-хранилище в Postgres с кэшем в памяти.
+
+    - чтения обслуживаются из памяти, в базу идём только при первом обращении
+      к ключу (после рестарта или вытеснения);
+    - изменения копятся в памяти и раз в flush_interval пишутся одной пачкой;
+    - записи, к которым не обращались memory_idle секунд, выгружаются из памяти,
+      а в базе удаляются строки старше ttl — брошенные анкеты не копятся.
+
+    Кэш рассчитан на то, что апдейты одного пользователя обрабатывает один
+    процесс (см. FSM_CACHE). С cache=False каждое чтение идёт в базу, а каждая
+    запись сразу сохраняется — так можно держать несколько реплик за webhook.
+    При падении процесса с кэшем теряется не больше flush_interval изменений.
+    """
+
+    def __init__(
+        self,
+        get_pool: Callable[[], asyncpg.Pool],
+        ttl: int = FSM_TTL,
+        memory_idle: int = FSM_MEMORY_IDLE,
+        flush_interval: float = FSM_FLUSH_INTERVAL,
+        cache: bool = True,
+    ):
+        self._get_pool = get_pool
+        self._cache = cache
+        self._ttl = ttl
+        self._memory_idle = min(memory_idle, ttl)
+        self._flush_interval = flush_interval
+        self._records: Dict[StorageKey, _Record] = {}
+        self._dirty: set[StorageKey] = set()
+        # без кэша: незаконченная запись по ключу — чтение ждёт её
+        self._writes: Dict[StorageKey, asyncio.Future] = {}
+        self._flusher: asyncio.Task | None = None
+        self._last_expire = 0.0
+
+    # ---------------------------
+    #  BaseStorage
+    # ---------------------------
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        if not self._cache:
+            return await self._write_through(SET_STATE_SQL, key, state)
+        record = await self._record(key)
+        record.state = state
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        if not self._cache:
+            return await self._write_through(SET_DATA_SQL, key, json.dumps(data))
+        record = await self._record(key)
+        record.data = copy.deepcopy(data)
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return copy.deepcopy((await self._record(key)).data)
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    # ---------------------------
+    #  Кэш в памяти
+    # ---------------------------
+    async def _load(self, key: StorageKey) -> _Record:
+        row = await self._get_pool().fetchrow(LOAD_SQL, *_key_row(key), float(self._ttl))
+        return _Record(row["state"], json.loads(row["data"])) if row else _Record()
+
+    async def _record(self, key: StorageKey) -> _Record:
+        if not self._cache:
+            # ответ хендлера уходит раньше, чем FSM сохранён: следующий апдейт
+            # того же пользователя не должен прочитать состояние до записи
+            pending = self._writes.get(key)
+            if pending is not None:
+                await asyncio.wait([pending])
+            return await self._load(key)
+        record = self._records.get(key)
+        if record is None:
+            loaded = await self._load(key)
+            # пока ждали базу, ключ мог появиться из параллельного апдейта
+            record = self._records.setdefault(key, loaded)
+        record.touched = time.monotonic()
+        return record
+
+    def _mark_dirty(self, key: StorageKey):
+        self._dirty.add(key)
+        self._start_flusher()
+
+    def _start_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_forever())
+
+    async def _write_through(self, sql: str, key: StorageKey, value: Optional[str]):
+        write = asyncio.ensure_future(self._get_pool().execute(sql, *_key_row(key), value))
+        self._writes[key] = write
+        try:
+            await write
+        finally:
+            if self._writes.get(key) is write:
+                del self._writes[key]
+        # без кэша флашер только чистит брошенные анкеты
+        self._start_flusher()
+
+    # ---------------------------
+    #  Запись пачками
+    # ---------------------------
+    async def flush(self):
+        if not self._dirty:
+            return
+
+        keys, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for key in keys:
+            record = self._records.get(key)
+            if record is None or (record.state is None and not record.data):
+                deletes.append(_key_row(key))
+                continue
+            try:
+                data = json.dumps(record.data)
+            except (TypeError, ValueError):
+                # в FSM положили то, что не ложится в JSON: эту запись не сохранить,
+                # но остальные из пачки должны уйти в базу
+                logger.exception("FSM data for %s is not JSON-serializable, not saved", _key_row(key))
+                continue
+            upserts.append((*_key_row(key), record.state, data))
+
+        try:
+            async with self._get_pool().acquire() as conn:
+                async with conn.transaction():
+                    if upserts:
+                        await conn.executemany("""
+                            INSERT INTO fsm_storage
+                                (bot_id, chat_id, user_id, thread_id, destiny, state, data, updated_at)
+                            VALUES ($1, $2, $3, $4, $5, $6, $7::jsonb, NOW())
+                            ON CONFLICT (bot_id, chat_id, user_id, thread_id, destiny)
+                            DO UPDATE SET state = EXCLUDED.state,
+                                          data = EXCLUDED.data,
+                                          updated_at = NOW()
+                        """, upserts)
+                    if deletes:
+                        await conn.executemany("""
+                            DELETE FROM fsm_storage
+                            WHERE bot_id=$1 AND chat_id=$2 AND user_id=$3
+                              AND thread_id=$4 AND destiny=$5
+                        """, deletes)
+        except (OSError, asyncpg.PostgresError):
+            # база недоступна — попробуем в следующий раз
+            self._dirty |= keys
+            raise
+
+    def _evict_idle(self):
+        deadline = time.monotonic() - self._memory_idle
+        for key in [k for k, r in self._records.items() if r.touched < deadline]:
+            if key not in self._dirty:
+                del self._records[key]
+
+    async def _expire_abandoned(self):
+        await self._get_pool().execute(EXPIRE_SQL, float(self._ttl))
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await self.flush()
+                self._evict_idle()
+                if time.monotonic() - self._last_expire > 60:
+                    self._last_expire = time.monotonic()
+                    await self._expire_abandoned()
+            except (OSError, asyncpg.PostgresError):
+                await asyncio.sleep(1)
+            except Exception:
+                # флашер не должен умирать: тогда изменения перестанут сохраняться
+                logger.exception("FSM flush failed")
+                await asyncio.sleep(1)
+
+
+def create_storage(get_pool: Callable[[], asyncpg.Pool]) -> BaseStorage:
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    if FSM_CACHE not in ("auto", "on", "off"):
+        raise RuntimeError(f"FSM_CACHE={FSM_CACHE!r}: ожидается auto, on или off")
+    cache = FSM_CACHE == "on" or (FSM_CACHE == "auto" and BOT_MODE != "webhook")
+    return PgStorage(get_pool, cache=cache)
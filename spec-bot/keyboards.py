@@ -36,3 +36,54 @@ def cancel_request_kb(req_id: int):
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="❌ Отменить заявку", callback_data=f"cancel:{req_id}")]
     ])
+
+def my_requests_kb(rows, page: int, has_prev: bool, has_next: bool):
+    """
+    Кнопки действий по каждой заявке страницы + навигация.
+    В курсоре (claimed_at, id) граничной заявки; isoformat идёт последним,
+    т.к. сам содержит двоеточия.
+    """
+    kb = [
+        [
+            InlineKeyboardButton(text=f"✔ #{r['id']}", callback_data=f"done:{r['id']}"),
+            InlineKeyboardButton(text=f"❌ #{r['id']}", callback_data=f"cancel:{r['id']}")
+        ]
+        for r in rows
+    ]
+
+    nav = []
+    if has_prev:
+        first = rows[0]
+        nav.append(InlineKeyboardButton(
+            text="◀️",
+            callback_data=f"myreq:prev:{page - 1}:{first['id']}:{first['claimed_at'].isoformat()}"
+        ))
+    if has_next:
+        last = rows[-1]
+        nav.append(InlineKeyboardButton(
+            text="▶️",
+            callback_data=f"myreq:next:{page + 1}:{last['id']}:{last['claimed_at'].isoformat()}"
+        ))
+    if nav:
+        kb.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=kb)
+
+def fanout_claim_kb(req_id: int):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🛠 Взять в работу", callback_data=f"claim:{req_id}")]
+    ])
+
+def search_results_kb(rows, page: int, has_prev: bool, has_next: bool):
+    """Кнопка claim на каждую найденную заявку + навигация; сам запрос лежит в FSM (search_query)."""
+    kb = [
+        [InlineKeyboardButton(text=f"🛠 Взять #{r['id']}", callback_data=f"claim:{r['id']}")]
+        for r in rows
+    ]
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=f"srch:{page - 1}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=f"srch:{page + 1}"))
+    if nav:
+        kb.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=kb)
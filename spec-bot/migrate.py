@@ -0,0 +1,249 @@
+"""
+Миграции схемы.
+
+    python migrate.py          — применить новые миграции
+    python migrate.py --check  — проверить, что горячие запросы идут по индексам
+
+Миграции — файлы migrations/NNNN_name.sql, применяются по порядку номеров,
+каждая в своей транзакции, и записываются в schema_migrations.
+Оба бота зовут migrate() при старте; одновременный запуск разводит
+advisory lock, так что каждая миграция применяется ровно один раз.
+Каталог migrations/ одинаковый в request-bot и spec-bot.
+
+То, что нельзя делать в транзакции на живой таблице (CREATE INDEX
+CONCURRENTLY, пакетный backfill с COMMIT), идёт в файле после строки
+`-- migrate: no-transaction`: эти команды выполняются по одной, вне
+транзакции, и миграция записывается только после последней. Если такая
+команда упала, при следующем запуске файл выполняется заново целиком,
+поэтому обе части должны быть повторяемыми (IF NOT EXISTS, OR REPLACE,
+DROP INDEX CONCURRENTLY IF EXISTS перед CREATE). Команду с комментарием
+`-- migrate: requires <extension>` пропускаем, если расширения в базе нет.
+"""
+import asyncio
+import json
+import re
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import asyncpg
+
+import db
+import fsm_storage
+from db import DATABASE_URL
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+NO_TRANSACTION_RE = re.compile(r"^-- migrate: no-transaction$", re.MULTILINE)
+REQUIRES_RE = re.compile(r"^-- migrate: requires (\w+)$", re.MULTILINE)
+
+SCHEMA_MIGRATIONS_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version    TEXT        PRIMARY KEY,
+        name       TEXT        NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+"""
+
+RECORD_MIGRATION_SQL = "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)"
+
+# Запросы, которые обязаны идти по индексу: (название, SQL, параметры).
+# SQL ботов — те же константы, что выполняют db.py и fsm_storage.py.
+# db.py у ботов разный: запросов другого бота здесь нет, поэтому --check
+# запускают в обоих каталогах.
+_NOW = datetime.now(timezone.utc)
+_BOT_QUERIES = [
+    # оба бота
+    ("specialist by tg_id", "SPECIALIST_STATUS_SQL", (1,)),
+    ("claim request", "TRY_CLAIM_SQL", (1, 1, "user")),
+    # request-bot
+    ("save request", "SAVE_REQUEST_SQL",
+     ("+77001234567", "name", "city", "desc", "LAW", "-100", "tg:1:abc", 86400.0)),
+    ("request by idempotency key", "REQUEST_BY_IDEMPOTENCY_KEY_SQL", ("tg:1:abc",)),
+    ("outbox lease", "LEASE_OUTBOX_SQL", (20, 30.0)),
+    ("sweep stale claims", "RELEASE_STALE_CLAIMS_SQL", (3600.0, 50, "note")),
+    ("sweep unpublished", "REQUEUE_UNPUBLISHED_SQL", (600.0, 50, ["LAW"], ["-100"])),
+    # spec-bot
+    ("request by id", "REQUEST_DATA_SQL", (1,)),
+    ("claimed page (first)", "CLAIMED_PAGE_FIRST_SQL", (1, 6)),
+    ("claimed page (next)", "CLAIMED_PAGE_NEXT_SQL", (1, _NOW, 1, 6)),
+    ("claimed page (prev)", "CLAIMED_PAGE_PREV_SQL", (1, _NOW, 1, 6)),
+    ("claimed count", "CLAIMED_COUNT_SQL", (1,)),
+    ("search requests", "SEARCH_REQUESTS_SQL", ("договор", "%договор%", ["LAW"], 6, 0)),
+    ("fanout lease", "LEASE_FANOUT_SQL", (10, 30.0)),
+    ("fanout recipients", "FANOUT_RECIPIENTS_SQL", (1, "LAW", 0, 100)),
+]
+
+# Запросы списка admin-server (admin-server/src/models/requestsModel.ts):
+# он на TypeScript, поэтому текст повторён здесь — менять вместе.
+_ADMIN_QUERIES = [
+    (
+        "admin list (first)",
+        """
+        SELECT * FROM requests
+        ORDER BY created_at DESC, id DESC
+        LIMIT $1
+        """,
+        (51,),
+    ),
+    (
+        "admin list (next)",
+        """
+        SELECT * FROM requests
+        WHERE (created_at, id) < ($1::timestamptz, $2)
+        ORDER BY created_at DESC, id DESC
+        LIMIT $3
+        """,
+        (_NOW, 1, 51),
+    ),
+    (
+        "admin list by status",
+        """
+        SELECT * FROM requests
+        WHERE status = ANY($1::text[])
+          AND (created_at, id) < ($2::timestamptz, $3)
+        ORDER BY created_at DESC, id DESC
+        LIMIT $4
+        """,
+        (["PENDING"], _NOW, 1, 51),
+    ),
+    (
+        "admin list by specialist",
+        """
+        SELECT * FROM requests
+        WHERE claimed_by_id = $1
+          AND (created_at, id) < ($2::timestamptz, $3)
+        ORDER BY created_at DESC, id DESC
+        LIMIT $4
+        """,
+        (1, _NOW, 1, 51),
+    ),
+]
+
+HOT_QUERIES = [
+    (name, getattr(db, const), args)
+    for name, const, args in _BOT_QUERIES
+    if hasattr(db, const)
+] + [
+    ("fsm record", fsm_storage.LOAD_SQL, (1, 1, 1, 0, "default", 86400.0)),
+    ("fsm expire", fsm_storage.EXPIRE_SQL, (86400.0,)),
+] + _ADMIN_QUERIES
+
+
+def _migration_files() -> list[tuple[str, str, Path]]:
+    files = []
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        version, _, name = path.stem.partition("_")
+        files.append((version, name, path))
+    return files
+
+
+def _split_statements(sql: str) -> list[str]:
+    """Команды по `;` в конце строки; внутри $$...$$ (тела DO и функций) не режем."""
+    statements, lines, quoted = [], [], False
+    for line in sql.splitlines():
+        lines.append(line)
+        if line.count("$$") % 2:
+            quoted = not quoted
+        if not quoted and line.rstrip().endswith(";"):
+            statements.append("\n".join(lines).strip())
+            lines = []
+    tail = "\n".join(lines).strip()
+    if any(not line.startswith("--") for line in tail.splitlines() if line.strip()):
+        statements.append(tail)
+    return statements
+
+
+def _read_migration(path: Path) -> tuple[str, list[str]]:
+    """Часть для транзакции и команды, которые выполняются вне её."""
+    sql = path.read_text(encoding="utf-8")
+    match = NO_TRANSACTION_RE.search(sql)
+    if match is None:
+        return sql, []
+    return sql[:match.start()], _split_statements(sql[match.end():])
+
+
+async def _run_outside_transaction(conn: asyncpg.Connection, statement: str):
+    required = REQUIRES_RE.search(statement)
+    if required and not await conn.fetchval(
+        "SELECT 1 FROM pg_extension WHERE extname = $1", required.group(1)
+    ):
+        print(f"  skipped, no extension {required.group(1)}: {statement.splitlines()[-1]}")
+        return
+    await conn.execute(statement)
+
+
+async def migrate(pool: asyncpg.Pool) -> list[str]:
+    """Применяет ещё не применённые миграции. Возвращает их версии."""
+    applied_now = []
+    async with pool.acquire() as conn:
+        # сессионный lock: миграций несколько, и каждая — своя транзакция
+        await conn.execute("SELECT pg_advisory_lock(hashtext('schema_migrations'))")
+        try:
+            await conn.execute(SCHEMA_MIGRATIONS_SQL)
+            applied = {r["version"] for r in await conn.fetch("SELECT version FROM schema_migrations")}
+
+            for version, name, path in _migration_files():
+                if version in applied:
+                    continue
+                head, statements = _read_migration(path)
+                async with conn.transaction():
+                    await conn.execute(head)
+                    if not statements:
+                        await conn.execute(RECORD_MIGRATION_SQL, version, name)
+                if statements:
+                    for statement in statements:
+                        await _run_outside_transaction(conn, statement)
+                    await conn.execute(RECORD_MIGRATION_SQL, version, name)
+                applied_now.append(version)
+                print(f"migration {version}_{name} applied")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext('schema_migrations'))")
+    return applied_now
+
+
+def _seq_scans(plan: dict) -> list[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name", "?"))
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+async def check_query_plans(pool: asyncpg.Pool) -> list[str]:
+    """
+    EXPLAIN каждого запроса из HOT_QUERIES с enable_seqscan=off.
+    На маленьких таблицах планировщик честно выбирает seq scan, поэтому
+    он выключается: если Seq Scan остался и так — подходящего индекса нет.
+    Возвращает список проблем (пустой — всё хорошо).
+    """
+    problems = []
+    async with pool.acquire() as conn:
+        for name, sql, args in HOT_QUERIES:
+            async with conn.transaction():
+                await conn.execute("SET LOCAL enable_seqscan = off")
+                raw = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *args)
+            plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+            tables = _seq_scans(plan)
+            if tables:
+                problems.append(f"{name}: Seq Scan on {', '.join(tables)}")
+    return problems
+
+
+async def main():
+    pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=1)
+    try:
+        await migrate(pool)
+        if "--check" in sys.argv:
+            problems = await check_query_plans(pool)
+            for problem in problems:
+                print(f"SEQ SCAN: {problem}")
+            if problems:
+                sys.exit(1)
+            print(f"query plans OK ({len(HOT_QUERIES)} queries)")
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
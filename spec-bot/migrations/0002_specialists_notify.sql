@@ -0,0 +1,17 @@
+-- NOTIFY на изменения specialists: боты по нему сбрасывают кэш специалистов
+
+CREATE OR REPLACE FUNCTION notify_specialists_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.tg_id IS NOT NULL THEN
+        PERFORM pg_notify('specialists_changed', OLD.tg_id::text);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.tg_id IS NOT NULL THEN
+        PERFORM pg_notify('specialists_changed', NEW.tg_id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER specialists_changed
+AFTER INSERT OR UPDATE OR DELETE ON specialists
+FOR EACH ROW EXECUTE FUNCTION notify_specialists_changed();
@@ -0,0 +1,14 @@
+-- FSM-хранилище ботов (fsm_storage.PgStorage)
+
+CREATE TABLE IF NOT EXISTS fsm_storage (
+    bot_id     BIGINT      NOT NULL,
+    chat_id    BIGINT      NOT NULL,
+    user_id    BIGINT      NOT NULL,
+    thread_id  BIGINT      NOT NULL DEFAULT 0,
+    destiny    TEXT        NOT NULL DEFAULT 'default',
+    state      TEXT,
+    data       JSONB       NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (bot_id, chat_id, user_id, thread_id, destiny)
+);
+CREATE INDEX IF NOT EXISTS fsm_storage_updated_at_idx ON fsm_storage (updated_at);
@@ -0,0 +1,20 @@
+-- Индексы под запросы ботов и админки.
+-- Если в specialists уже есть дубли tg_id, миграция упадёт —
+-- их нужно разобрать руками, иначе кэш и claim работают с произвольной строкой.
+
+-- WHERE tg_id = $1 (статус специалиста, регистрация, claim)
+CREATE UNIQUE INDEX IF NOT EXISTS specialists_tg_id_key ON specialists (tg_id);
+
+-- spec-bot /my_requests: активные заявки специалиста, новые сверху (keyset по claimed_at, id).
+-- Условие должно буквально совпадать с ACTIVE_STATUSES_SQL в spec-bot/db.py
+CREATE INDEX IF NOT EXISTS requests_claimed_active_idx
+    ON requests (claimed_by_id, claimed_at DESC, id DESC)
+    WHERE status IN ('CLAIMED', 'RESEND');
+
+-- request-bot get_claimed_requests: все заявки специалиста, без фильтра по статусу
+CREATE INDEX IF NOT EXISTS requests_claimed_by_idx
+    ON requests (claimed_by_id, claimed_at DESC)
+    WHERE claimed_by_id IS NOT NULL;
+
+-- админка: список заявок ORDER BY created_at DESC
+CREATE INDEX IF NOT EXISTS requests_created_at_idx ON requests (created_at DESC);
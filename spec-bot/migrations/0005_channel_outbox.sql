@@ -0,0 +1,14 @@
+-- Outbox публикаций в каналы: строка пишется в одной транзакции с заявкой,
+-- публикует её фоновый воркер request-bot (outbox.py)
+
+CREATE TABLE IF NOT EXISTS channel_outbox (
+    id              BIGSERIAL   PRIMARY KEY,
+    request_id      INTEGER     NOT NULL REFERENCES requests (id) ON DELETE CASCADE,
+    channel_id      TEXT        NOT NULL,
+    attempts        INTEGER     NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_until    TIMESTAMPTZ,
+    last_error      TEXT,
+    created_at      TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS channel_outbox_next_attempt_idx ON channel_outbox (next_attempt_at);
@@ -0,0 +1,62 @@
+-- Идемпотентная отправка заявок и поиск повторов (final_send request-bot, admin-server).
+-- Миграция идёт при старте ботов на живой таблице: колонки добавляются без
+-- перезаписи таблицы, content_hash заполняется пачками, индексы строятся
+-- CONCURRENTLY — запись в requests на всё это время не блокируется.
+
+-- Хэш нормализованных телефона и описания: последние 10 цифр телефона
+-- (+7 / 8 / пробелы не важны), описание без регистра и лишних пробелов.
+-- Считается в базе, чтобы бот и admin-server хэшировали одинаково.
+CREATE OR REPLACE FUNCTION request_content_hash(phone TEXT, description TEXT) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT md5(
+        right(regexp_replace(coalesce(phone, ''), '\D', '', 'g'), 10) || E'\n' ||
+        lower(btrim(regexp_replace(coalesce(description, ''), '\s+', ' ', 'g')))
+    )
+$$;
+
+ALTER TABLE requests
+    -- ключ отправки: повтор того же подтверждения не создаёт вторую заявку
+    ADD COLUMN IF NOT EXISTS idempotency_key TEXT,
+    -- заявка-повтор (status = 'DUPLICATE') указывает на исходную и в канал не идёт
+    ADD COLUMN IF NOT EXISTS duplicate_of    INT REFERENCES requests (id) ON DELETE SET NULL,
+    -- считает триггер ниже; старые заявки дозаполняются пачками в конце файла
+    ADD COLUMN IF NOT EXISTS content_hash    TEXT;
+
+CREATE OR REPLACE FUNCTION requests_set_content_hash() RETURNS trigger AS $$
+BEGIN
+    NEW.content_hash := request_content_hash(NEW.phone, NEW.description);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER requests_content_hash
+BEFORE INSERT OR UPDATE OF phone, description, content_hash ON requests
+FOR EACH ROW EXECUTE FUNCTION requests_set_content_hash();
+
+-- migrate: no-transaction
+
+-- заявки, созданные до триггера: пачками по id, каждая пачка — своя транзакция
+DO $$
+DECLARE
+    last_id INT := 0;
+    max_id  INT;
+BEGIN
+    SELECT max(id) INTO max_id FROM requests;
+    WHILE last_id < coalesce(max_id, 0) LOOP
+        UPDATE requests SET content_hash = request_content_hash(phone, description)
+        WHERE id > last_id AND id <= last_id + 5000 AND content_hash IS NULL;
+        last_id := last_id + 5000;
+        COMMIT;
+    END LOOP;
+END
+$$;
+
+-- NULL-ключи (старые заявки, admin-server без заголовка) не конфликтуют
+DROP INDEX CONCURRENTLY IF EXISTS requests_idempotency_key;
+CREATE UNIQUE INDEX CONCURRENTLY requests_idempotency_key ON requests (idempotency_key);
+
+-- поиск недавней исходной заявки с тем же содержимым
+DROP INDEX CONCURRENTLY IF EXISTS requests_content_hash_idx;
+CREATE INDEX CONCURRENTLY requests_content_hash_idx
+    ON requests (content_hash, created_at DESC)
+    WHERE duplicate_of IS NULL;
@@ -0,0 +1,18 @@
+-- Список заявок в админке: keyset по (created_at, id), новые сверху,
+-- с фильтрами по статусу и специализации (admin-server listRequests).
+
+-- без id в ключе страницы с одинаковым created_at сортировались бы в памяти
+CREATE INDEX IF NOT EXISTS requests_created_id_idx ON requests (created_at DESC, id DESC);
+DROP INDEX IF EXISTS requests_created_at_idx;
+
+-- ?status=PENDING и ?specialization=LAW: страница читается из индекса
+-- по порядку, без сортировки всех подходящих заявок
+CREATE INDEX IF NOT EXISTS requests_status_created_idx
+    ON requests (status, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS requests_specialization_created_idx
+    ON requests (specialization, created_at DESC, id DESC);
+
+-- DELETE /requests/:id: FK duplicate_of ... ON DELETE SET NULL ищет дубли
+-- удаляемой заявки; без индекса это полный проход по requests на каждое удаление
+CREATE INDEX IF NOT EXISTS requests_duplicate_of_idx
+    ON requests (duplicate_of) WHERE duplicate_of IS NOT NULL;
@@ -0,0 +1,8 @@
+-- requests_claimed_by_idx (0004) обслуживал request-bot get_claimed_requests,
+-- которого больше нет: /my_requests читает requests_claimed_active_idx.
+DROP INDEX IF EXISTS requests_claimed_by_idx;
+
+-- ?claimed_by= в списке админки: keyset по (created_at, id) среди заявок специалиста
+CREATE INDEX IF NOT EXISTS requests_claimed_by_created_idx
+    ON requests (claimed_by_id, created_at DESC, id DESC)
+    WHERE claimed_by_id IS NOT NULL;
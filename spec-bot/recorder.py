@@ -0,0 +1,144 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import TelegramObject, Update
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Путь к файлу записи (*.jsonl.gz); пусто — запись выключена
+RECORD_UPDATES = os.getenv("RECORD_UPDATES", "")
+RECORD_FLUSH_INTERVAL = float(os.getenv("RECORD_FLUSH_INTERVAL", "1"))
+
+logger = logging.getLogger(__name__)
+
+# в combined-bot оба бота могут писать в один файл — gzip-блоки не должны перемешаться
+_write_lock = threading.Lock()
+
+# Поля с именами людей — маскируются всегда
+_NAME_KEYS = {"first_name", "last_name", "username", "phone_number", "vcard"}
+# Свободный текст пользователя — маскируется, кроме команд
+_TEXT_KEYS = {"text", "caption"}
+
+
+def _mask(value: str) -> str:
+    # длина и форма сохраняются (важно для валидации и размера), буквы и цифры — нет
+    return re.sub(r"\d", "0", re.sub(r"[^\W\d_]", "x", value))
+
+
+def redact(value: Any, key: str | None = None) -> Any:
+    """Копия апдейта без имён, телефонов и текста сообщений. id чатов и callback_data остаются."""
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v, key) for v in value]
+    if isinstance(value, str):
+        if key in _NAME_KEYS:
+            return _mask(value)
+        if key in _TEXT_KEYS and not value.startswith("/"):
+            return _mask(value)
+    return value
+
+
+def outcome_of(result: Any = None, error: BaseException | None = None) -> str:
+    """Итог обработки апдейта — по нему replay ищет расхождения."""
+    if error is not None:
+        return f"error:{type(error).__name__}"
+    if result is UNHANDLED:
+        return "unhandled"
+    return "handled"
+
+
+class UpdateRecorder(BaseMiddleware):
+    """
+    Outer-middleware на dp.update: дописывает каждый входящий апдейт
+    (в обезличенном виде) и итог его обработки в gzip-JSONL.
+
+    Строка: {"t": unix-время прихода, "bot": имя бота, "outcome": ..., "update": {...}}.
+    Запись на диск пачками раз в flush_interval в отдельном потоке,
+    чтобы не блокировать event loop. Файл дописывается (gzip из нескольких
+    блоков читается как один поток).
+    """
+
+    def __init__(self, path: str, bot_name: str, flush_interval: float = RECORD_FLUSH_INTERVAL):
+        self._path = path
+        self._bot_name = bot_name
+        self._flush_interval = flush_interval
+        self._lines: list[str] = []
+        self._flusher: asyncio.Task | None = None
+        self.recorded = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        arrived = time.time()
+        result, error = None, None
+        try:
+            result = await handler(event, data)
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._append(arrived, event, outcome_of(result, error))
+
+    def _append(self, arrived: float, event: Update, outcome: str):
+        update = event.model_dump(mode="json", exclude_none=True, by_alias=True)
+        self._lines.append(json.dumps({
+            "t": arrived,
+            "bot": self._bot_name,
+            "outcome": outcome,
+            "update": redact(update),
+        }, ensure_ascii=False))
+        self.recorded += 1
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_forever())
+
+    def _write(self, lines: list[str]):
+        with _write_lock, gzip.open(self._path, "at", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def flush(self):
+        if not self._lines:
+            return
+        lines, self._lines = self._lines, []
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except OSError:
+            logger.exception("Failed to write %s updates to %s", len(lines), self._path)
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            await self.flush()
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+
+def setup_recorder(dp: Dispatcher, bot_name: str, path: str = RECORD_UPDATES) -> UpdateRecorder | None:
+    """Включает запись, если задан RECORD_UPDATES."""
+    if not path:
+        return None
+    recorder = UpdateRecorder(path, bot_name)
+    dp.update.outer_middleware(recorder)
+    return recorder
@@ -0,0 +1,134 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+from dotenv import load_dotenv
+
+from metrics import THROTTLED_UPDATES
+from send_queue import TokenBucket
+
+load_dotenv()
+
+# Лимит по умолчанию на пользователя и хендлер: THROTTLE_RATE апдейтов/с,
+# всплеск до THROTTLE_BURST подряд; THROTTLE_RATE=0 — ограничение выключено
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "1"))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "5"))
+# бакет без апдейтов дольше THROTTLE_IDLE секунд забывается
+THROTTLE_IDLE = float(os.getenv("THROTTLE_IDLE", "600"))
+# и бакетов не больше THROTTLE_MAX_BUCKETS (вытесняются самые давние)
+THROTTLE_MAX_BUCKETS = int(os.getenv("THROTTLE_MAX_BUCKETS", "100000"))
+
+THROTTLED_TEXT = "⏳ Слишком часто, подождите немного"
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Inner-middleware на message и callback_query: защита от флуда до хендлера.
+
+    - одинаковый callback_data от того же пользователя, пока первый ещё
+      обрабатывается (двойной тап по «Все верно», «Взять в работу»), —
+      отбрасывается, на callback отвечаем пустым answer;
+    - token bucket на (пользователь, хендлер): лимит по умолчанию
+      или из флага хендлера, например
+      @dp.message(CommandStart(), flags={"throttle": {"rate": 0.2, "burst": 3}}),
+      flags={"throttle": False} — без ограничения.
+
+    Отброшенный апдейт стоит одного ответа: callback получает короткий
+    answer, сообщение — одно предупреждение, пока лимит не восстановится.
+    Бакеты хранятся в LRU и вытесняются по простою и по количеству.
+    """
+
+    def __init__(
+        self,
+        rate: float = THROTTLE_RATE,
+        burst: float = THROTTLE_BURST,
+        idle: float = THROTTLE_IDLE,
+        max_buckets: int = THROTTLE_MAX_BUCKETS,
+    ):
+        self._rate = rate
+        self._burst = burst
+        self._idle = idle
+        self._max_buckets = max_buckets
+        self._buckets: OrderedDict[tuple[int, str], TokenBucket] = OrderedDict()
+        # (пользователь, хендлер), кому уже сказали «подождите»
+        self._warned: set[tuple[int, str]] = set()
+        self._in_flight: set[tuple[int, str]] = set()
+
+    def _bucket(self, key: tuple[int, str], rate: float, burst: float) -> TokenBucket:
+        now = time.monotonic()
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+        self._buckets[key] = bucket  # в конец: самый свежий
+
+        while self._buckets:
+            oldest_key, oldest = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self._max_buckets and now - oldest.updated < self._idle:
+                break
+            del self._buckets[oldest_key]
+            self._warned.discard(oldest_key)
+        return bucket
+
+    def _limits(self, data: Dict[str, Any]) -> tuple[float, float] | None:
+        flag = get_flag(data, "throttle", default=True)
+        if flag is False or self._rate <= 0:
+            return None
+        rate, burst = self._rate, self._burst
+        if isinstance(flag, dict):
+            rate, burst = flag.get("rate", rate), flag.get("burst", burst)
+        return (rate, burst) if rate > 0 else None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+
+        duplicate_key = None
+        if isinstance(event, CallbackQuery) and event.data:
+            duplicate_key = (user.id, event.data)
+            if duplicate_key in self._in_flight:
+                THROTTLED_UPDATES.labels(name, "duplicate").inc()
+                return event.answer()
+
+        limits = self._limits(data)
+        if limits is not None:
+            key = (user.id, name)
+            if self._bucket(key, *limits).reserve() > 0:
+                THROTTLED_UPDATES.labels(name, "rate").inc()
+                if isinstance(event, CallbackQuery):
+                    return event.answer(THROTTLED_TEXT)
+                if isinstance(event, Message) and key not in self._warned:
+                    self._warned.add(key)
+                    return event.answer(THROTTLED_TEXT)
+                return None
+            self._warned.discard(key)
+
+        if duplicate_key is None:
+            return await handler(event, data)
+        self._in_flight.add(duplicate_key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(duplicate_key)
+
+    def stats(self) -> dict[str, Any]:
+        return {"buckets": len(self._buckets), "in_flight": len(self._in_flight)}
+
+
+def setup_throttling(dp: Dispatcher) -> ThrottlingMiddleware:
+    """Регистрировать до setup_metrics: отброшенные апдейты не попадают в метрики хендлеров."""
+    throttling = ThrottlingMiddleware()
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(throttling)
+    return throttling